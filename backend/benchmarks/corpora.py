@@ -0,0 +1,72 @@
+import random
+from typing import Any, Dict, List
+
+from data.omani_knowledge_base import EXTRACTED_KNOWLEDGE
+
+# أحجام المدونات: عدد الفقرات لكل نص وعدد النتائج لكل رد بحث
+SIZES = {
+    'small': {'paragraphs': 3, 'results': 5},
+    'medium': {'paragraphs': 30, 'results': 20},
+    'large': {'paragraphs': 300, 'results': 100},
+}
+
+SENTENCES = [
+    'يُعد الشعر العُماني من أقدم فنون الأدب في سلطنة عُمان',
+    'نشرت مجلة نزوى حواراً مطولاً مع الشاعر حول تجربته في كتابة القصيدة',
+    'تناولت الدراسة النقدية بنية الرواية العُمانية المعاصرة وأثر التراث فيها',
+    'ولد الأديب في نزوى عام 1950م وتلقى تعليمه في مسقط ثم صحار',
+    'من المحتمل أن القصيدة كتبت في القرن الثاني الهجري وفقاً للمصادر',
+    'يتميز أسلوب الكاتب بالإيقاع الهادئ والقافية المتنوعة على بحر الطويل',
+    'وقد حاز على جائزة السلطان قابوس في عام 2011 تقديراً لأعماله',
+    'تحضر مفردات البيئة مثل النخيل واللبان والبخور والخنجر في النص',
+    'قدمت فرقة الرزحة عرضاً تراثياً في صلالة ضمن مهرجان ظفار',
+    'Oman literature article published in the Observer newspaper interview',
+]
+
+URLS = [
+    'https://www.omanobserver.om/article/{i}',
+    'https://www.omandaily.om/culture/{i}',
+    'https://www.academia.edu/{i}/omani-poetry',
+    'https://ar.wikipedia.org/wiki/article_{i}',
+    'https://www.facebook.com/posts/{i}',
+    'https://www.nizwa.om/issue/{i}',
+    'https://example.com/blog/{i}',
+]
+
+QUERIES = {
+    # اسم شخصية أدبية معروف (مطابقة مبكرة)
+    'figure': f"من هو {EXTRACTED_KNOWLEDGE['omani_literary_figures'][0]}؟",
+    # مفهوم في آخر القائمة (مسح شبه كامل)
+    'concept': f"اشرح {EXTRACTED_KNOWLEDGE['key_concepts'][-1]}",
+    # لا مطابقة (أسوأ حالة: مسح كل القوائم)
+    'miss': 'كيف أكتب رسالة رسمية إلى المدرسة؟',
+}
+
+def paragraph(rng: random.Random) -> str:
+    figure = rng.choice(EXTRACTED_KNOWLEDGE['omani_literary_figures'])
+    sentences = rng.sample(SENTENCES, 4)
+    return f"{figure}: " + '. '.join(sentences) + '.'
+
+def text_corpus(size: str, seed: int = 7) -> str:
+    """نص عربي حتمي بالحجم المطلوب (فقرات مفصولة بسطر فارغ)"""
+    rng = random.Random(seed)
+    return '\n\n'.join(paragraph(rng) for _ in range(SIZES[size]['paragraphs']))
+
+def search_response(size: str, seed: int = 11) -> Dict[str, Any]:
+    """رد Tavily مصطنع بعدد النتائج المطلوب ومحتوى خام طويل"""
+    rng = random.Random(seed)
+    results: List[Dict[str, Any]] = []
+    for i in range(SIZES[size]['results']):
+        results.append({
+            'title': rng.choice(SENTENCES)[:60],
+            'url': rng.choice(URLS).format(i=i),
+            'content': ' '.join(paragraph(rng) for _ in range(3)),
+            'raw_content': ' '.join(paragraph(rng) for _ in range(20)),
+            'score': round(rng.random(), 3),
+            'published_date': '2024-01-01',
+        })
+    return {'answer': '', 'results': results}
+
+def llm_response(size: str, seed: int = 13) -> str:
+    """رد نموذج مصطنع يحوي أسماء وتواريخ وعبارات عدم يقين لفحص التحقق"""
+    return text_corpus(size, seed)
@@ -0,0 +1,167 @@
+"""قياس أداء دوال معالجة النصوص الساخنة مع مقارنة بخط أساس محفوظ
+
+الاستخدام (من مجلد backend وبيئة الاعتماديات كاملة):
+
+    python -m benchmarks.run_hot_paths --save-baseline     # حفظ خط الأساس على هذا الجهاز
+    python -m benchmarks.run_hot_paths                      # مقارنة وفشل عند تراجع > 25%
+    python -m benchmarks.run_hot_paths -k tavily --threshold 0.1
+
+خطوط الأساس خاصة بالجهاز: تُحفظ وتُقارن على نفس الجهاز (أو نفس نوع آلة CI).
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+# الخدمات تُنشئ مثيلاتها عند الاستيراد؛ وضع الإعادة يعفيها من مفاتيح المزودين
+os.environ.setdefault('PROVIDER_MODE', 'replay')
+os.environ.setdefault('TRACING_ENABLED', 'false')
+
+from benchmarks.corpora import SIZES, QUERIES, text_corpus, search_response, llm_response
+
+BASELINE_PATH = Path(__file__).parent / 'baselines.json'
+
+def build_benchmarks() -> Dict[str, Callable[[], object]]:
+    """كل دالة ساخنة × كل حجم مدونة؛ المدخلات تُبنى مسبقاً خارج القياس"""
+    from services.chat_service import ChatService
+    from services.tavily_service import TavilyAdvancedSearchService
+    from services.verification_service import InformationVerificationService
+    from services.knowledge_service import OmaniLiteratureKnowledgeBase
+    from services.nizwa_extractor import NizwaMagazineExtractor
+
+    # الدوال المقاسة لا تلمس قاعدة البيانات ولا العملاء، فلا حاجة لتشغيل __init__
+    chat = object.__new__(ChatService)
+    tavily = object.__new__(TavilyAdvancedSearchService)
+    knowledge = object.__new__(OmaniLiteratureKnowledgeBase)
+    verifier = InformationVerificationService()
+    nizwa = NizwaMagazineExtractor()
+    loop = asyncio.new_event_loop()
+
+    benchmarks: Dict[str, Callable[[], object]] = {}
+
+    for name, query in QUERIES.items():
+        benchmarks[f"chat._search_local_knowledge_base[{name}]"] = (
+            lambda q=query: chat._search_local_knowledge_base(q)
+        )
+
+    for size in SIZES:
+        response = search_response(size)
+        first = response['results'][0]
+        text = text_corpus(size)
+        answer = llm_response(size)
+        query = 'الشعر العُماني في مجلة نزوى'
+
+        benchmarks[f"tavily._filter_for_journalism_content[{size}]"] = (
+            lambda r=response: tavily._filter_for_journalism_content(r, query)
+        )
+        benchmarks[f"tavily._calculate_relevance_score[{size}]"] = (
+            lambda t=text: tavily._calculate_relevance_score({'content': t, 'title': first['title']}, query)
+        )
+        benchmarks[f"tavily._extract_omani_keywords[{size}]"] = (
+            lambda t=text: tavily._extract_omani_keywords(t)
+        )
+        benchmarks[f"verifier.verify_response[{size}]"] = (
+            lambda a=answer: loop.run_until_complete(verifier.verify_response(a, query))
+        )
+        benchmarks[f"knowledge._extract_keywords[{size}]"] = (
+            lambda t=text: knowledge._extract_keywords(t)
+        )
+        benchmarks[f"knowledge._extract_entities[{size}]"] = (
+            lambda t=text: knowledge._extract_entities(t)
+        )
+        benchmarks[f"nizwa._analyze_content[{size}]"] = (
+            lambda t=text: nizwa._analyze_content(t, 1)
+        )
+
+    return benchmarks
+
+def measure(func: Callable[[], object], rounds: int, min_round_time: float) -> Dict[str, float]:
+    """معايرة عدد التكرارات لكل جولة ثم قياس عدة جولات (بأسلوب pytest-benchmark)"""
+    func()  # إحماء
+
+    iterations = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        if time.perf_counter() - started >= min_round_time or iterations >= 1_000_000:
+            break
+        iterations *= 2
+
+    timings: List[float] = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            func()
+        timings.append((time.perf_counter() - started) / iterations)
+
+    return {
+        'min_us': min(timings) * 1e6,
+        'median_us': statistics.median(timings) * 1e6,
+        'mean_us': statistics.mean(timings) * 1e6,
+        'stddev_us': (statistics.stdev(timings) if len(timings) > 1 else 0.0) * 1e6,
+        'iterations': iterations,
+        'rounds': rounds,
+    }
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='قياس أداء الدوال الساخنة لمعالجة النصوص')
+    parser.add_argument('-k', '--filter', default='', help='تشغيل القياسات التي يحتوي اسمها على النص')
+    parser.add_argument('--rounds', type=int, default=7)
+    parser.add_argument('--min-round-time', type=float, default=0.02, help='أقل زمن لكل جولة بالثواني')
+    parser.add_argument('--threshold', type=float, default=0.25, help='نسبة التراجع المسموحة (0.25 = 25%%)')
+    parser.add_argument('--stat', default='median_us', choices=['min_us', 'median_us', 'mean_us'])
+    parser.add_argument('--baseline', default=str(BASELINE_PATH))
+    parser.add_argument('--save-baseline', action='store_true', help='حفظ النتائج خطَّ أساسٍ جديداً')
+    parser.add_argument('--output', help='حفظ النتائج بصيغة JSON')
+    args = parser.parse_args(argv)
+
+    # تحذيرات الخدمات (مثل التحقق) تُكتب لكل استدعاء وتشوّه القياس بزمن الإخراج
+    logging.disable(logging.WARNING)
+
+    baseline_path = Path(args.baseline)
+    baseline = json.loads(baseline_path.read_text(encoding='utf-8')) if baseline_path.exists() else {}
+
+    results = {}
+    regressions = []
+    for name, func in build_benchmarks().items():
+        if args.filter not in name:
+            continue
+
+        stats = measure(func, args.rounds, args.min_round_time)
+        results[name] = stats
+
+        line = f"{name:<55} {stats[args.stat]:>12.1f}us  ±{stats['stddev_us']:>8.1f}"
+        previous = baseline.get(name, {}).get(args.stat)
+        if previous:
+            change = stats[args.stat] / previous - 1.0
+            line += f"  {change:+7.1%}"
+            if change > args.threshold:
+                regressions.append(f"{name}: {previous:.1f}us → {stats[args.stat]:.1f}us ({change:+.1%})")
+                line += "  تراجع!"
+        print(line)
+
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding='utf-8')
+
+    if args.save_baseline:
+        baseline.update(results)
+        baseline_path.write_text(json.dumps(baseline, indent=2, ensure_ascii=False, sort_keys=True), encoding='utf-8')
+        print(f"تم حفظ خط الأساس: {baseline_path}")
+        return 0
+
+    if not baseline:
+        print("لا يوجد خط أساس للمقارنة - شغّل مع --save-baseline أولاً")
+
+    for regression in regressions:
+        print(f"تراجع في الأداء: {regression}")
+    return 1 if regressions else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""فحص ميزانية زمن الإقلاع: زمن استيراد server.py وزمن أول طلب، وعدم استيراد الاعتماديات الثقيلة مبكراً
+
+الاستخدام (من مجلد backend):
+
+    python -m benchmarks.startup_budget --import-budget-ms 2000 --first-request-budget-ms 4000
+
+يخرج بكود 1 عند تجاوز أي ميزانية أو عند استيراد موديول ثقيل أثناء استيراد server.py.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# موديولات يجب ألا تُستورد حتى تُستخدم ميزاتها (سجل الخدمات ينشئها عند الطلب)
+HEAVY_MODULES = [
+    'langchain', 'langchain_openai', 'langchain_anthropic', 'langchain_community',
+    'sklearn', 'PyPDF2', 'tavily', 'anthropic', 'emergentintegrations', 'faiss', 'openai',
+]
+
+def child_env() -> dict:
+    env = dict(os.environ)
+    # motor لا يتصل عند الإنشاء، لذا يكفي عنوان افتراضي لقياس الاستيراد
+    env.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+    env.setdefault('DB_NAME', 'ghassan_startup_check')
+    return env
+
+def measure_import(runs: int) -> dict:
+    """زمن استيراد server.py في مفسر جديد (أفضل قيمة من عدة تشغيلات) والموديولات الثقيلة المستوردة"""
+    script = (
+        "import time, json, sys\n"
+        "started = time.perf_counter()\n"
+        "import server\n"
+        "elapsed = time.perf_counter() - started\n"
+        f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+        "print(json.dumps({'import_ms': elapsed * 1000, 'heavy_loaded': heavy}))\n"
+    )
+    timings, heavy = [], []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, '-c', script], cwd=BACKEND_DIR, env=child_env(),
+            capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+        timings.append(result['import_ms'])
+        heavy = result['heavy_loaded']
+    return {'import_ms': min(timings), 'heavy_loaded': heavy}
+
+def slowest_imports(limit: int = 10) -> list:
+    """أبطأ الموديولات تراكمياً حسب -X importtime"""
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import server'],
+        cwd=BACKEND_DIR, env=child_env(), capture_output=True, text=True
+    ).stderr
+
+    rows = []
+    for line in stderr.splitlines():
+        # الصيغة: "import time: self [us] | cumulative | imported package"
+        parts = line[len('import time:'):].split('|')
+        if not line.startswith('import time:') or len(parts) != 3 or not parts[1].strip().isdigit():
+            continue
+        rows.append((int(parts[1]), parts[2].strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def measure_first_request(timeout: float) -> float:
+    """الزمن من تشغيل uvicorn حتى أول رد ناجح من /api/ (بالملّي ثانية)"""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'server:app', '--host', '127.0.0.1', '--port', str(port)],
+        cwd=BACKEND_DIR, env=child_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/", timeout=1) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except OSError:
+                time.sleep(0.02)
+        raise TimeoutError(f"no successful response within {timeout}s")
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description='فحص ميزانية زمن إقلاع الخادم')
+    parser.add_argument('--import-budget-ms', type=float, default=2000.0)
+    parser.add_argument('--first-request-budget-ms', type=float, default=4000.0)
+    parser.add_argument('--runs', type=int, default=3, help='عدد تشغيلات قياس الاستيراد')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--skip-server', action='store_true', help='قياس الاستيراد فقط دون تشغيل uvicorn')
+    args = parser.parse_args(argv)
+
+    failures = []
+
+    result = measure_import(args.runs)
+    print(f"زمن استيراد server.py: {result['import_ms']:.0f}ms (الميزانية {args.import_budget_ms:.0f}ms)")
+    if result['import_ms'] > args.import_budget_ms:
+        failures.append('import time')
+    if result['heavy_loaded']:
+        print(f"موديولات ثقيلة استُوردت مبكراً: {', '.join(result['heavy_loaded'])}")
+        failures.append('heavy imports')
+
+    print("أبطأ الموديولات (تراكمياً):")
+    for cumulative_us, name in slowest_imports():
+        print(f"  {cumulative_us / 1000:>8.1f}ms  {name}")
+
+    if not args.skip_server:
+        first_request_ms = measure_first_request(args.timeout)
+        print(f"زمن أول طلب: {first_request_ms:.0f}ms (الميزانية {args.first_request_budget_ms:.0f}ms)")
+        if first_request_ms > args.first_request_budget_ms:
+            failures.append('time to first request')
+
+    for failure in failures:
+        print(f"تجاوز الميزانية: {failure}")
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""زاحف غير متصل يبني فهرس الروابط الموثوقة لبديل الروابط الخارجية في المحادثة
+
+الاستخدام (من مجلد backend):
+
+    python -m jobs.crawl_trusted_links                                  # كل المواقع الموثوقة
+    python -m jobs.crawl_trusted_links --domain nizwa.om --max-pages 100
+
+    # تجربة محلية على خادم بديل بدلاً من المواقع الحقيقية:
+    python -m http.server 8765 --directory ./site_snapshot &
+    python -m jobs.crawl_trusted_links --seed http://127.0.0.1:8765/ --domain 127.0.0.1 --output /tmp/links.sqlite3
+
+يحترم robots.txt، ويزحف بتزامن محدود مع تأخير بين طلبات النطاق الواحد، ويبني الفهرس
+في ملف مؤقت ثم يستبدل القديم ذرياً فيلتقطه الخادم دون إعادة تشغيل. مع --domain تُستبدل
+صفحات النطاقات المحددة فقط وتبقى صفحات بقية النطاقات في الفهرس.
+"""
+import argparse
+import asyncio
+import re
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import urljoin, urlsplit
+from urllib.robotparser import RobotFileParser
+
+import aiohttp
+from bs4 import BeautifulSoup
+
+from services.link_index import TRUSTED_LINK_DOMAINS, DEFAULT_INDEX_PATH, write_index
+from services.search_warehouse import canonical_url
+
+USER_AGENT = 'GhassanLinkCrawler/1.0 (+https://github.com/thabit89/oman-read)'
+SKIPPED_PATHS = re.compile(r'/(login|register|search|tag|feed|wp-admin|wp-json|cart|print)(/|$)', re.IGNORECASE)
+SKIPPED_EXTENSIONS = re.compile(r'\.(pdf|jpe?g|png|gif|webp|svg|mp[34]|zip|docx?|xlsx?|css|js)$', re.IGNORECASE)
+MAX_PAGE_BYTES = 2 * 1024 * 1024
+
+def matching_domain(host: str, domains: List[str]) -> Optional[str]:
+    for domain in domains:
+        if host == domain or host.endswith(f'.{domain}'):
+            return domain
+    return None
+
+def parse_page(html: str, url: str) -> Dict[str, Any]:
+    """العنوان والوصف والنص والروابط من صفحة HTML"""
+    soup = BeautifulSoup(html, 'html.parser')
+
+    def meta(*names: str) -> str:
+        for name in names:
+            tag = soup.find('meta', attrs={'property': name}) or soup.find('meta', attrs={'name': name})
+            if tag and tag.get('content'):
+                return tag['content'].strip()
+        return ''
+
+    heading = soup.find('h1')
+    title = meta('og:title') or (soup.title.get_text(strip=True) if soup.title else '') or (
+        heading.get_text(strip=True) if heading else ''
+    )
+    paragraphs = [p.get_text(' ', strip=True) for p in soup.find_all('p')]
+    body = ' '.join(paragraph for paragraph in paragraphs if paragraph)
+    description = meta('description', 'og:description') or body[:300]
+
+    links = []
+    for anchor in soup.find_all('a', href=True):
+        href = anchor['href'].strip()
+        if href and not href.startswith(('mailto:', 'tel:', 'javascript:', '#')):
+            links.append(urljoin(url, href))
+
+    return {'title': title, 'description': description, 'text': f'{description} {body[:5000]}', 'links': links}
+
+class TrustedLinkCrawler:
+    """زحف بالعرض أولاً داخل النطاقات الموثوقة فقط، مع حد للصفحات والعمق لكل نطاق"""
+
+    def __init__(self, args):
+        self.domains = args.domain or list(TRUSTED_LINK_DOMAINS)
+        self.seeds = args.seed or [f'https://{domain}/' for domain in self.domains]
+        self.max_pages = args.max_pages
+        self.max_depth = args.max_depth
+        self.concurrency = args.concurrency
+        self.delay = args.delay
+        self.timeout = aiohttp.ClientTimeout(total=args.timeout)
+        self.min_text = args.min_text
+
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.seen: Set[str] = set()
+        self.indexed: Set[str] = set()
+        self.fetched: Dict[str, int] = {}
+        self.pages: List[Dict[str, Any]] = []
+        self.skipped: Dict[str, int] = {}
+        self.robots: Dict[str, Optional[RobotFileParser]] = {}
+        self.next_request_at: Dict[str, float] = {}
+
+    def _skip(self, reason: str):
+        self.skipped[reason] = self.skipped.get(reason, 0) + 1
+
+    def _enqueue(self, url: str, depth: int):
+        # الرابط الموحد للمقارنة فقط؛ الطلب يُرسل للرابط كما هو (بلا مرساة)
+        url = url.split('#', 1)[0]
+        key = canonical_url(url)
+        parts = urlsplit(url)
+        domain = matching_domain(parts.hostname or '', self.domains)
+        if domain is None or parts.scheme not in ('http', 'https') or key in self.seen:
+            return
+        if SKIPPED_EXTENSIONS.search(parts.path) or SKIPPED_PATHS.search(parts.path):
+            return
+        self.seen.add(key)
+        self.queue.put_nowait((url, depth, domain))
+
+    async def _allowed(self, http: aiohttp.ClientSession, url: str) -> bool:
+        parts = urlsplit(url)
+        origin = f'{parts.scheme}://{parts.netloc}'
+        if origin not in self.robots:
+            parser = None
+            try:
+                async with http.get(f'{origin}/robots.txt', timeout=self.timeout) as response:
+                    if response.status == 200:
+                        parser = RobotFileParser()
+                        parser.parse((await response.text(errors='replace')).splitlines())
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+            self.robots[origin] = parser
+        parser = self.robots[origin]
+        return parser is None or parser.can_fetch(USER_AGENT, url)
+
+    async def _wait_turn(self, host: str):
+        """تأخير ثابت بين طلبات النطاق الواحد مهما كان عدد العمال"""
+        now = time.monotonic()
+        start_at = max(now, self.next_request_at.get(host, now))
+        self.next_request_at[host] = start_at + self.delay
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
+
+    async def _fetch(self, http: aiohttp.ClientSession, url: str) -> Optional[Tuple[str, str]]:
+        await self._wait_turn(urlsplit(url).netloc)
+        async with http.get(url, timeout=self.timeout, allow_redirects=True) as response:
+            if response.status != 200:
+                self._skip(f'status_{response.status}')
+                return None
+            if 'html' not in response.headers.get('Content-Type', ''):
+                self._skip('not_html')
+                return None
+            if (response.content_length or 0) > MAX_PAGE_BYTES:
+                self._skip('too_large')
+                return None
+            body = await response.read()
+            try:
+                return str(response.url), body.decode(response.charset or 'utf-8', errors='replace')
+            except LookupError:
+                # ترميز غير معروف في ترويسة الخادم
+                return str(response.url), body.decode('utf-8', errors='replace')
+
+    async def _worker(self, http: aiohttp.ClientSession):
+        while True:
+            url, depth, domain = await self.queue.get()
+            try:
+                if self.fetched.get(domain, 0) >= self.max_pages:
+                    continue
+                if not await self._allowed(http, url):
+                    self._skip('robots')
+                    continue
+                self.fetched[domain] = self.fetched.get(domain, 0) + 1
+
+                fetched = await self._fetch(http, url)
+                if fetched is None:
+                    continue
+                final_url, html = fetched
+                page = await asyncio.to_thread(parse_page, html, final_url)
+
+                if depth < self.max_depth:
+                    for link in page['links']:
+                        self._enqueue(link, depth + 1)
+
+                # الصفحات القصيرة (الرئيسية، الفهارس) تُزحف روابطها ولا تُفهرس
+                if not page['title'] or len(page['text']) < self.min_text:
+                    self._skip('thin_content')
+                    continue
+                # إعادة التوجيه قد توصل رابطين لنفس الصفحة
+                if canonical_url(final_url) in self.indexed:
+                    continue
+                self.indexed.add(canonical_url(final_url))
+                self.pages.append({
+                    'url': final_url.split('#', 1)[0],
+                    'domain': domain,
+                    'source_type': TRUSTED_LINK_DOMAINS.get(domain, 'trusted'),
+                    'title': page['title'][:200],
+                    'description': page['description'][:300],
+                    'text': page['text'],
+                    'crawled_at': time.time()
+                })
+            except Exception as e:
+                # أي خطأ في رابط واحد يُحسب تجاوزاً ولا يوقف العامل (وإلا لم ينتهِ queue.join)
+                self._skip(type(e).__name__)
+            finally:
+                self.queue.task_done()
+
+    async def run(self) -> List[Dict[str, Any]]:
+        for seed in self.seeds:
+            self._enqueue(seed, 0)
+        async with aiohttp.ClientSession(headers={'User-Agent': USER_AGENT}) as http:
+            workers = [asyncio.create_task(self._worker(http)) for _ in range(self.concurrency)]
+            await self.queue.join()
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return self.pages
+
+async def main_async(args) -> int:
+    started = time.perf_counter()
+    crawler = TrustedLinkCrawler(args)
+    pages = await crawler.run()
+
+    print(f"الصفحات المجلوبة: {sum(crawler.fetched.values())} | المفهرسة: {len(pages)}")
+    for reason, count in sorted(crawler.skipped.items()):
+        print(f"  تُجاوزت ({reason}): {count}")
+    if not pages:
+        # لا يُستبدل فهرس سليم بفهرس فارغ بسبب انقطاع مؤقت
+        print("لم تُفهرس أي صفحة - الفهرس الحالي لم يتغير")
+        return 1
+
+    output = Path(args.output)
+    # زحف نطاقات محددة يحدّث صفحاتها فقط ولا يحذف صفحات النطاقات الأخرى من الفهرس
+    replace_domains = crawler.domains if args.domain else None
+    count = await asyncio.to_thread(write_index, output, pages, replace_domains)
+    scope = f"النطاقات: {', '.join(crawler.domains)}" if replace_domains else "كل النطاقات"
+    print(f"تم بناء الفهرس ({count} صفحة، {scope}) في {output} خلال {time.perf_counter() - started:.1f}s")
+    return 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='بناء فهرس الروابط الموثوقة من المواقع العُمانية المعتمدة')
+    parser.add_argument('--domain', action='append', help='نطاق موثوق (يتكرر)؛ الافتراضي كل النطاقات المعتمدة')
+    parser.add_argument('--seed', action='append', help='رابط بداية (يتكرر)؛ الافتراضي الصفحة الرئيسية لكل نطاق')
+    parser.add_argument('--max-pages', type=int, default=200, help='أقصى عدد صفحات لكل نطاق')
+    parser.add_argument('--max-depth', type=int, default=3)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--delay', type=float, default=1.0, help='ثوانٍ بين طلبين لنفس النطاق')
+    parser.add_argument('--timeout', type=float, default=15.0)
+    parser.add_argument('--min-text', type=int, default=200, help='أقل طول نص لفهرسة الصفحة')
+    parser.add_argument('--output', default=str(DEFAULT_INDEX_PATH))
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main_async(parse_args())))
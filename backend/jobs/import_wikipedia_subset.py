@@ -0,0 +1,312 @@
+"""استيراد مقالات ويكيبيديا العربية في تصنيفات الأدب العُماني إلى نسخة محلية مضغوطة مفهرسة
+
+الاستخدام (من مجلد backend):
+
+    # بناء كامل من ملف تفريغ (https://dumps.wikimedia.org/arwiki/latest/arwiki-latest-pages-articles.xml.bz2)
+    python -m jobs.import_wikipedia_subset --dump arwiki-latest-pages-articles.xml.bz2
+
+    # تحديث دوري (cron): ما تغيرت مراجعته أو دخل التصنيفات أو خرج منها منذ آخر تحديث
+    python -m jobs.import_wikipedia_subset --refresh
+
+    # تصنيفات أخرى وعمق توسيع مختلف
+    python -m jobs.import_wikipedia_subset --dump dump.xml.bz2 --category "شعراء عمانيون" --category-depth 1
+
+البناء الكامل يمر على الملف مرتين: الأولى لشجرة التصنيفات (لتوسيع التصنيفات الجذرية إلى
+الفرعية)، والثانية لاستيراد المقالات المشمولة. التحديث يستخدم واجهة MediaWiki ويقارن أرقام
+المراجعات فلا يجلب إلا ما تغير. في الحالتين يُبنى ملف جديد ويستبدل القديم ذرياً.
+"""
+import argparse
+import asyncio
+import bz2
+import gzip
+import json
+import re
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Set
+import xml.etree.ElementTree as ElementTree
+
+import aiohttp
+
+from services.sqlite_files import build_atomically
+from services.wiki_mirror import DEFAULT_MIRROR_PATH, SCHEMA, store_page, delete_page
+
+API_URL = 'https://ar.wikipedia.org/w/api.php'
+USER_AGENT = 'GhassanWikiMirror/1.0 (+https://github.com/thabit89/oman-read)'
+CATEGORY_PREFIXES = ('تصنيف:', 'Category:')
+
+DEFAULT_CATEGORIES = [
+    'أدب عماني', 'شعراء عمانيون', 'كتاب عمانيون', 'روائيون عمانيون',
+    'أدباء عمانيون', 'ثقافة عمان', 'مدن عمان', 'تاريخ عمان'
+]
+
+CATEGORY_LINK = re.compile(r'\[\[\s*(?:تصنيف|Category)\s*:\s*([^\]|]+)', re.IGNORECASE)
+COMMENTS = re.compile(r'<!--.*?-->', re.DOTALL)
+REFERENCES = re.compile(r'<ref[^>]*/>|<ref[^>]*>.*?</ref>', re.DOTALL | re.IGNORECASE)
+INNER_TEMPLATE = re.compile(r'\{\{[^{}]*\}\}')
+INNER_TABLE = re.compile(r'\{\|(?:(?!\{\|).)*?\|\}', re.DOTALL)
+MEDIA_LINK = re.compile(r'\[\[\s*(?:ملف|صورة|File|Image|تصنيف|Category)\s*:[^\[\]]*(?:\[\[[^\[\]]*\]\][^\[\]]*)*\]\]', re.IGNORECASE)
+WIKI_LINK = re.compile(r'\[\[(?:[^\[\]|]*\|)?([^\[\]]*)\]\]')
+EXTERNAL_LINK = re.compile(r'\[https?://[^\s\]]+\s*([^\]]*)\]')
+HEADING = re.compile(r'^=+\s*(.*?)\s*=+\s*$', re.MULTILINE)
+# الأقسام الختامية لا تضيف نصاً مفيداً للبحث
+TRAILING_SECTIONS = re.compile(r'^==\s*(?:المراجع|مراجع|المصادر|مصادر|وصلات خارجية|انظر أيضا|انظر أيضًا)\s*==', re.MULTILINE)
+
+def normalize_category(name: str) -> str:
+    return ' '.join(name.replace('_', ' ').split())
+
+def page_categories(wikitext: str) -> List[str]:
+    return list(dict.fromkeys(normalize_category(name) for name in CATEGORY_LINK.findall(wikitext)))
+
+def _remove_nested(pattern: re.Pattern, text: str) -> str:
+    previous = None
+    while previous != text:
+        previous = text
+        text = pattern.sub('', text)
+    return text
+
+def wikitext_to_text(wikitext: str) -> str:
+    """نص المقالة المقروء من صيغة الويكي (بلا قوالب أو جداول أو مراجع أو ملفات)"""
+    match = TRAILING_SECTIONS.search(wikitext)
+    text = wikitext[:match.start()] if match else wikitext
+    text = COMMENTS.sub('', text)
+    text = REFERENCES.sub('', text)
+    text = _remove_nested(INNER_TEMPLATE, text)
+    text = _remove_nested(INNER_TABLE, text)
+    text = MEDIA_LINK.sub('', text)
+    text = WIKI_LINK.sub(r'\1', text)
+    text = EXTERNAL_LINK.sub(r'\1', text)
+    text = HEADING.sub(r'\1', text)
+    text = re.sub(r"'{2,}", '', text)
+    text = re.sub(r'<[^>]+>', '', text)
+    lines = (' '.join(line.split()).strip(' *#:;') for line in text.splitlines())
+    return '\n'.join(line for line in lines if line)
+
+def _open_dump(path: Path):
+    if path.suffix == '.bz2':
+        return bz2.open(path, 'rb')
+    if path.suffix == '.gz':
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+def iter_dump_pages(path: Path) -> Iterator[Dict[str, Any]]:
+    """صفحات ملف التفريغ واحدة تلو الأخرى دون تحميل الملف في الذاكرة"""
+    with _open_dump(path) as stream:
+        page: Dict[str, Any] = {}
+        in_revision = False
+        root = None
+        for event, element in ElementTree.iterparse(stream, events=('start', 'end')):
+            tag = element.tag.rsplit('}', 1)[-1]
+            if event == 'start':
+                if root is None:
+                    root = element
+                if tag == 'page':
+                    page = {'redirect': False}
+                elif tag == 'revision':
+                    in_revision = True
+                continue
+
+            if tag == 'title':
+                page['title'] = element.text or ''
+            elif tag == 'ns':
+                page['ns'] = int(element.text or 0)
+            elif tag == 'id' and not in_revision and 'page_id' not in page:
+                page['page_id'] = int(element.text)
+            elif tag == 'id' and in_revision and 'revision_id' not in page:
+                page['revision_id'] = int(element.text)
+            elif tag == 'redirect':
+                page['redirect'] = True
+            elif tag == 'text':
+                page['wikitext'] = element.text or ''
+            elif tag == 'revision':
+                in_revision = False
+            elif tag == 'page':
+                yield page
+                # مسح الجذر لا الصفحة فقط: الصفحات المفرغة تبقى أبناء للجذر وتتراكم مع ملايين الصفحات
+                root.clear()
+
+def expand_scope(roots: List[str], parents: Dict[str, Set[str]], depth: int) -> Set[str]:
+    """التصنيفات الجذرية وتصنيفاتها الفرعية حتى العمق المحدد"""
+    children: Dict[str, Set[str]] = {}
+    for category, category_parents in parents.items():
+        for parent in category_parents:
+            children.setdefault(parent, set()).add(category)
+
+    scope = {normalize_category(root) for root in roots}
+    frontier = set(scope)
+    for _ in range(depth):
+        frontier = {child for category in frontier for child in children.get(category, ())} - scope
+        scope |= frontier
+    return scope
+
+def _page_record(page: Dict[str, Any], categories: List[str]) -> Dict[str, Any]:
+    return {
+        'page_id': page['page_id'],
+        'title': page['title'],
+        'revision_id': page.get('revision_id', 0),
+        'categories': categories,
+        'text': wikitext_to_text(page['wikitext'])
+    }
+
+def _write_meta(conn, **values):
+    conn.executemany('INSERT OR REPLACE INTO meta VALUES (?, ?)', [(key, str(value)) for key, value in values.items()])
+
+def import_dump(args) -> int:
+    dump = Path(args.dump)
+    roots = args.category or DEFAULT_CATEGORIES
+
+    parents: Dict[str, Set[str]] = {}
+    if args.category_depth > 0:
+        print("المرور الأول: شجرة التصنيفات...")
+        for page in iter_dump_pages(dump):
+            if page.get('ns') == 14 and page['title'].startswith(CATEGORY_PREFIXES):
+                name = normalize_category(page['title'].split(':', 1)[1])
+                parents[name] = set(page_categories(page.get('wikitext', '')))
+    scope = expand_scope(roots, parents, args.category_depth)
+    print(f"التصنيفات المشمولة: {len(scope)}")
+
+    print("المرور الثاني: استيراد المقالات...")
+    imported = 0
+    with build_atomically(Path(args.output)) as conn:
+        for statement in SCHEMA:
+            conn.execute(statement)
+        conn.executemany('INSERT OR IGNORE INTO scope_categories VALUES (?)', [(name,) for name in scope])
+        for page in iter_dump_pages(dump):
+            if page.get('ns') != 0 or page['redirect'] or 'wikitext' not in page:
+                continue
+            categories = page_categories(page['wikitext'])
+            if not scope.intersection(categories):
+                continue
+            record = _page_record(page, categories)
+            if len(record['text']) >= args.min_text:
+                store_page(conn, record)
+                imported += 1
+        _write_meta(
+            conn, source=dump.name, built_at=datetime.utcnow().isoformat(),
+            root_categories=json.dumps(roots, ensure_ascii=False), category_depth=args.category_depth
+        )
+    print(f"تم استيراد {imported} مقالة إلى {args.output}")
+    return 0 if imported else 1
+
+class MediaWikiClient:
+    """طلبات متتابعة مهذبة لواجهة MediaWiki (طلب واحد في كل لحظة مع تأخير بسيط)"""
+
+    def __init__(self, http: aiohttp.ClientSession, delay: float):
+        self.http = http
+        self.delay = delay
+
+    async def query(self, **params) -> Dict[str, Any]:
+        params = {'action': 'query', 'format': 'json', 'formatversion': '2', **params}
+        async with self.http.get(API_URL, params=params) as response:
+            response.raise_for_status()
+            data = await response.json()
+        await asyncio.sleep(self.delay)
+        return data
+
+    async def category_members(self, category: str) -> List[Dict[str, Any]]:
+        members, cursor = [], {}
+        while True:
+            data = await self.query(
+                list='categorymembers', cmtitle=f'تصنيف:{category}', cmtype='page|subcat', cmlimit='500', **cursor
+            )
+            members += data.get('query', {}).get('categorymembers', [])
+            if 'continue' not in data:
+                return members
+            cursor = {'cmcontinue': data['continue']['cmcontinue']}
+
+async def refresh_from_api(args) -> int:
+    """تحديث جزئي: إضافة ما دخل التصنيفات، وحذف ما خرج منها، وإعادة جلب ما تغيرت مراجعته"""
+    output = Path(args.output)
+    if not output.exists():
+        print(f"لا توجد نسخة محلية في {output} - ابدأ ببناء كامل عبر --dump")
+        return 1
+
+    with build_atomically(output, copy_existing=True) as conn:
+        meta = dict(conn.execute('SELECT key, value FROM meta').fetchall())
+        roots = args.category or json.loads(meta.get('root_categories') or '[]') or DEFAULT_CATEGORIES
+        depth = int(meta.get('category_depth', args.category_depth))
+        stored = dict(conn.execute('SELECT page_id, revision_id FROM pages').fetchall())
+
+        timeout = aiohttp.ClientTimeout(total=args.timeout)
+        async with aiohttp.ClientSession(headers={'User-Agent': USER_AGENT}, timeout=timeout) as http:
+            client = MediaWikiClient(http, args.delay)
+
+            # الأعضاء الحاليون للتصنيفات الجذرية وفروعها
+            scope, frontier, members = set(), [normalize_category(root) for root in roots], set()
+            for level in range(depth + 1):
+                next_frontier = []
+                for category in frontier:
+                    if category in scope:
+                        continue
+                    scope.add(category)
+                    for member in await client.category_members(category):
+                        if member['ns'] == 0:
+                            members.add(member['pageid'])
+                        elif member['ns'] == 14 and level < depth:
+                            next_frontier.append(normalize_category(member['title'].split(':', 1)[1]))
+                frontier = next_frontier
+
+            # أرقام المراجعات الحالية لكل الأعضاء (50 صفحة لكل طلب)
+            member_ids = sorted(members)
+            latest: Dict[int, int] = {}
+            for start in range(0, len(member_ids), 50):
+                data = await client.query(prop='info', pageids='|'.join(map(str, member_ids[start:start + 50])))
+                for page in data.get('query', {}).get('pages', []):
+                    if not page.get('missing') and not page.get('redirect'):
+                        latest[page['pageid']] = page['lastrevid']
+
+            changed = [page_id for page_id, revision in latest.items() if stored.get(page_id) != revision]
+            removed = [page_id for page_id in stored if page_id not in latest]
+
+            updated = 0
+            for start in range(0, len(changed), 50):
+                data = await client.query(
+                    prop='revisions', rvprop='ids|content', rvslots='main',
+                    pageids='|'.join(map(str, changed[start:start + 50]))
+                )
+                for page in data.get('query', {}).get('pages', []):
+                    revision = (page.get('revisions') or [{}])[0]
+                    wikitext = revision.get('slots', {}).get('main', {}).get('content')
+                    if wikitext is None:
+                        continue
+                    record = _page_record(
+                        {'page_id': page['pageid'], 'title': page['title'], 'revision_id': revision.get('revid', 0), 'wikitext': wikitext},
+                        page_categories(wikitext)
+                    )
+                    if len(record['text']) >= args.min_text:
+                        store_page(conn, record)
+                        updated += 1
+
+        for page_id in removed:
+            delete_page(conn, page_id)
+        conn.execute('DELETE FROM scope_categories')
+        conn.executemany('INSERT INTO scope_categories VALUES (?)', [(name,) for name in scope])
+        _write_meta(conn, refreshed_at=datetime.utcnow().isoformat())
+
+    print(f"الأعضاء: {len(latest)} | محدثة أو جديدة: {updated} | محذوفة: {len(removed)}")
+    return 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='نسخة محلية من ويكيبيديا العربية لتصنيفات الأدب العُماني')
+    mode = parser.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--dump', help='ملف تفريغ pages-articles (xml أو xml.bz2 أو xml.gz) للبناء الكامل')
+    mode.add_argument('--refresh', action='store_true', help='تحديث جزئي عبر واجهة MediaWiki')
+    parser.add_argument('--category', action='append', help='تصنيف جذري (يتكرر)؛ الافتراضي تصنيفات الأدب العُماني')
+    parser.add_argument('--category-depth', type=int, default=2, help='عمق التوسيع للتصنيفات الفرعية')
+    parser.add_argument('--min-text', type=int, default=200, help='أقل طول نص لاستيراد المقالة')
+    parser.add_argument('--delay', type=float, default=0.2, help='ثوانٍ بين طلبات الواجهة')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--output', default=str(DEFAULT_MIRROR_PATH))
+    return parser.parse_args(argv)
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    started = time.perf_counter()
+    status = import_dump(args) if args.dump else asyncio.run(refresh_from_api(args))
+    print(f"المدة: {time.perf_counter() - started:.1f}s")
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""مولد حمل لواجهة الدردشة يعيد جلسات عربية واقعية ويقيس أهداف مستوى الخدمة
+
+الاستخدام (من مجلد backend، والخادم يعمل بمزودين مسجلين PROVIDER_MODE=replay وMongo محلية):
+
+    python -m loadtest.run --base-url http://localhost:8001 --concurrency 1,4,16,32 --duration 60
+
+يطبع لكل مستوى تزامن: الإنتاجية، والمئينات p50/p95/p99 لكل مسار، ونسبة الأخطاء،
+وتأخر حلقة الأحداث في الخادم (من /api/metrics) وفي المولد نفسه.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from loadtest.traces import generate_traces, load_traces, save_traces
+
+LAG_BUCKET_PATTERN = re.compile(r'^ghassan_event_loop_lag_seconds_bucket\{le="([^"]+)"\} (\S+)$')
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+class StepStats:
+    """نتائج مستوى تزامن واحد"""
+
+    def __init__(self, concurrency: int):
+        self.concurrency = concurrency
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.error_samples: List[str] = []
+        self.client_lag: List[float] = []
+        self.elapsed = 0.0
+        self.server_lag: Optional[Dict[str, float]] = None
+
+    def record(self, endpoint: str, latency: float, error: Optional[str] = None):
+        self.latencies.setdefault(endpoint, []).append(latency)
+        if error:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            if len(self.error_samples) < 5:
+                self.error_samples.append(f"{endpoint}: {error}")
+
+    def summary(self) -> Dict[str, Any]:
+        total = sum(len(v) for v in self.latencies.values())
+        errors = sum(self.errors.values())
+        endpoints = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            endpoints[endpoint] = {
+                'requests': len(values),
+                'errors': self.errors.get(endpoint, 0),
+                'p50_ms': round(percentile(values, 0.50) * 1000, 1),
+                'p95_ms': round(percentile(values, 0.95) * 1000, 1),
+                'p99_ms': round(percentile(values, 0.99) * 1000, 1),
+            }
+        return {
+            'concurrency': self.concurrency,
+            'duration_s': round(self.elapsed, 1),
+            'requests': total,
+            'throughput_rps': round(total / self.elapsed, 2) if self.elapsed else 0.0,
+            'error_rate': round(errors / total, 4) if total else 0.0,
+            'endpoints': endpoints,
+            'server_loop_lag_ms': self.server_lag,
+            'client_loop_lag_ms': {
+                'p99': round(percentile(self.client_lag, 0.99) * 1000, 1),
+                'max': round(max(self.client_lag, default=0.0) * 1000, 1),
+            },
+            'error_samples': self.error_samples,
+        }
+
+async def timed_request(
+    http: aiohttp.ClientSession,
+    stats: StepStats,
+    endpoint: str,
+    method: str,
+    url: str,
+    **kwargs
+) -> Optional[Dict[str, Any]]:
+    started = time.perf_counter()
+    try:
+        async with http.request(method, url, **kwargs) as response:
+            body = await response.json(content_type=None)
+            error = None if response.status < 400 else f"HTTP {response.status}"
+            stats.record(endpoint, time.perf_counter() - started, error)
+            return body if error is None else None
+    except Exception as e:
+        stats.record(endpoint, time.perf_counter() - started, f"{type(e).__name__}: {e}")
+        return None
+
+async def virtual_user(
+    http: aiohttp.ClientSession,
+    base_url: str,
+    traces: itertools.cycle,
+    stats: StepStats,
+    deadline: float,
+    think_scale: float
+):
+    """مستخدم افتراضي: يفتح جلسة ويرسل أدوارها بالترتيب مع وقت تفكير، حتى نهاية المرحلة"""
+    while time.perf_counter() < deadline:
+        trace = next(traces)
+        session = await timed_request(http, stats, 'POST /api/chat/session', 'POST', f"{base_url}/api/chat/session")
+        session_id = session.get('session_id') if session else None
+
+        for turn, think in zip(trace['turns'], trace['think_time']):
+            if time.perf_counter() >= deadline:
+                return
+            reply = await timed_request(
+                http, stats, 'POST /api/chat/message', 'POST', f"{base_url}/api/chat/message",
+                json={'message': turn, 'session_id': session_id}
+            )
+            if reply:
+                session_id = reply.get('session_id', session_id)
+            if trace['fetch_history'] and session_id:
+                await timed_request(
+                    http, stats, 'GET /api/chat/history/{session_id}', 'GET',
+                    f"{base_url}/api/chat/history/{session_id}"
+                )
+            await asyncio.sleep(think * think_scale)
+
+async def sample_client_lag(stats: StepStats, stop: asyncio.Event, interval: float = 0.1):
+    """تأخر حلقة أحداث المولد نفسه: إذا ارتفع فالأرقام تقيس المولد لا الخادم"""
+    while not stop.is_set():
+        scheduled = time.perf_counter() + interval
+        await asyncio.sleep(interval)
+        stats.client_lag.append(max(0.0, time.perf_counter() - scheduled))
+
+async def scrape_loop_lag(http: aiohttp.ClientSession, base_url: str) -> Optional[List[Tuple[float, float]]]:
+    """قراءة دلاء مدرج تأخر حلقة الأحداث من نقطة المقاييس في الخادم"""
+    try:
+        async with http.get(f"{base_url}/api/metrics") as response:
+            text = await response.text()
+    except Exception:
+        return None
+
+    buckets = []
+    for line in text.splitlines():
+        match = LAG_BUCKET_PATTERN.match(line)
+        if match:
+            bound = float('inf') if match.group(1) == '+Inf' else float(match.group(1))
+            buckets.append((bound, float(match.group(2))))
+    return buckets or None
+
+def lag_between(before, after) -> Optional[Dict[str, float]]:
+    """مئينات تأخر حلقة الأحداث خلال المرحلة من فرق الدلاء التراكمية (حد أعلى للدلو)"""
+    if not before or not after:
+        return None
+
+    deltas = [(bound, a - b) for (bound, b), (_, a) in zip(before, after)]
+    total = deltas[-1][1]
+    if total <= 0:
+        return None
+
+    def quantile(p: float) -> float:
+        for bound, count in deltas:
+            if count >= p * total:
+                return round(bound * 1000, 1)
+        return float('inf')
+
+    return {'samples': int(total), 'p50': quantile(0.50), 'p95': quantile(0.95), 'p99': quantile(0.99)}
+
+async def run_step(
+    base_url: str,
+    traces: List[Dict[str, Any]],
+    concurrency: int,
+    duration: float,
+    think_scale: float,
+    timeout: float
+) -> StepStats:
+    stats = StepStats(concurrency)
+    connector = aiohttp.TCPConnector(limit=concurrency * 2)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as http:
+        lag_before = await scrape_loop_lag(http, base_url)
+
+        stop = asyncio.Event()
+        lag_task = asyncio.create_task(sample_client_lag(stats, stop))
+        cycle = itertools.cycle(traces)
+        started = time.perf_counter()
+        deadline = started + duration
+
+        await asyncio.gather(*[
+            virtual_user(http, base_url, cycle, stats, deadline, think_scale)
+            for _ in range(concurrency)
+        ])
+
+        stats.elapsed = time.perf_counter() - started
+        stop.set()
+        await lag_task
+        stats.server_lag = lag_between(lag_before, await scrape_loop_lag(http, base_url))
+    return stats
+
+def print_step(summary: Dict[str, Any]):
+    print(f"\n=== تزامن {summary['concurrency']} ({summary['duration_s']}s) ===")
+    print(f"الطلبات: {summary['requests']}  الإنتاجية: {summary['throughput_rps']} طلب/ث  "
+          f"الأخطاء: {summary['error_rate'] * 100:.2f}%")
+    for endpoint, row in summary['endpoints'].items():
+        print(f"  {endpoint:<38} n={row['requests']:<6} p50={row['p50_ms']:>8}ms  "
+              f"p95={row['p95_ms']:>8}ms  p99={row['p99_ms']:>8}ms  errors={row['errors']}")
+    if summary['server_loop_lag_ms']:
+        lag = summary['server_loop_lag_ms']
+        print(f"  تأخر حلقة الخادم: p50={lag['p50']}ms p95={lag['p95']}ms p99={lag['p99']}ms")
+    print(f"  تأخر حلقة المولد: p99={summary['client_loop_lag_ms']['p99']}ms")
+    for sample in summary['error_samples']:
+        print(f"  ! {sample}")
+
+def check_slo(summaries: List[Dict[str, Any]], p95_ms: Optional[float], max_error_rate: Optional[float]) -> List[str]:
+    violations = []
+    for summary in summaries:
+        if max_error_rate is not None and summary['error_rate'] > max_error_rate:
+            violations.append(
+                f"تزامن {summary['concurrency']}: نسبة الأخطاء {summary['error_rate']:.2%} > {max_error_rate:.2%}"
+            )
+        message = summary['endpoints'].get('POST /api/chat/message')
+        if p95_ms is not None and message and message['p95_ms'] > p95_ms:
+            violations.append(
+                f"تزامن {summary['concurrency']}: p95 للرسائل {message['p95_ms']}ms > {p95_ms}ms"
+            )
+    return violations
+
+async def main_async(args) -> int:
+    traces = load_traces(args.traces) if args.traces else generate_traces(args.sessions, args.seed)
+    if args.dump_traces:
+        save_traces(traces, args.dump_traces)
+
+    summaries = []
+    for concurrency in [int(c) for c in args.concurrency.split(',')]:
+        stats = await run_step(args.base_url, traces, concurrency, args.duration, args.think_scale, args.timeout)
+        summary = stats.summary()
+        summaries.append(summary)
+        print_step(summary)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'base_url': args.base_url, 'steps': summaries}, f, ensure_ascii=False, indent=2)
+
+    violations = check_slo(summaries, args.slo_p95_ms, args.max_error_rate)
+    for violation in violations:
+        print(f"مخالفة SLO: {violation}")
+    return 1 if violations else 0
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='اختبار حمل لواجهة دردشة غسان')
+    parser.add_argument('--base-url', default='http://localhost:8001')
+    parser.add_argument('--concurrency', default='1,4,16', help='مستويات التزامن مفصولة بفواصل')
+    parser.add_argument('--duration', type=float, default=30.0, help='مدة كل مستوى بالثواني')
+    parser.add_argument('--sessions', type=int, default=200, help='عدد الجلسات المولدة')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--traces', help='ملف JSONL لجلسات محفوظة بدلاً من التوليد')
+    parser.add_argument('--dump-traces', help='حفظ الجلسات المولدة في ملف JSONL')
+    parser.add_argument('--think-scale', type=float, default=1.0, help='0 = بلا وقت تفكير')
+    parser.add_argument('--timeout', type=float, default=120.0, help='مهلة الطلب الواحد بالثواني')
+    parser.add_argument('--output', help='حفظ التقرير بصيغة JSON')
+    parser.add_argument('--slo-p95-ms', type=float, help='أقصى p95 مقبول لـ /api/chat/message')
+    parser.add_argument('--max-error-rate', type=float, help='أقصى نسبة أخطاء مقبولة (0-1)')
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    sys.exit(asyncio.run(main_async(parse_args())))
@@ -0,0 +1,83 @@
+import json
+import random
+from typing import Any, Dict, List
+
+# كتّاب وأعمال عُمانية تُستخدم لتوليد أسئلة واقعية
+AUTHORS = [
+    ('أبو مسلم البهلاني', 'النونية'),
+    ('عبدالله الخليلي', 'وحي العبقرية'),
+    ('سيف الرحبي', 'رأس المسافر'),
+    ('جوخة الحارثي', 'سيدات القمر'),
+    ('زهران القاسمي', 'تغريبة القافر'),
+    ('هدى حمد', 'التي تعد السلالم'),
+    ('عبدالله حبيب', 'قشرة الليل'),
+    ('بدرية الشحي', 'الطواف حيث الجمر'),
+]
+
+# عبارات المرحلة الدراسية كما يكتبها الطلاب (تطابق _detect_student_level)
+GRADE_PHRASES = {
+    'primary': ['أنا في صف ثالث', 'أنا طالب صف رابع'],
+    'middle': ['أنا في صف سابع', 'طالبة صف تاسع'],
+    'secondary': ['أنا في صف عاشر', 'أدرس في الثانوية'],
+    'general': [''],
+}
+
+SIMPLE_TEMPLATES = [
+    'ما هو أشهر عمل للكاتب {author}؟',
+    'اشرح لي ببساطة من هو {author}',
+    'أريد أن أفهم قصة {work}',
+    'متى كتب {author} {work}؟',
+]
+
+ANALYTICAL_TEMPLATES = [
+    'حلل الأسلوب الأدبي في {work} لـ {author}',
+    'قارن بين {author} و{other} من حيث الموضوعات',
+    'ما الفرق بين أسلوب {author} وأسلوب {other}؟',
+    'قدم نقداً أدبياً متخصصاً لـ {work} مع تحليل البلاغة فيها',
+    'ما البحر الشعري الغالب في شعر {author}؟ وضح بالإعراب والعروض',
+]
+
+FOLLOW_UPS = [
+    'أعطني مثالاً من النص',
+    'وما رأيك الشخصي في ذلك؟',
+    'هل يمكنك التوسع أكثر؟',
+    'ما المصادر التي تنصح بها للاستزادة؟',
+    'كيف أثر ذلك في الأدب العُماني المعاصر؟',
+]
+
+def generate_session(rng: random.Random) -> Dict[str, Any]:
+    """جلسة محادثة متعددة الأدوار بمرحلة دراسية ونوع أسئلة محددين"""
+    grade = rng.choices(list(GRADE_PHRASES), weights=[2, 3, 4, 1])[0]
+    analytical = rng.random() < (0.2 if grade == 'primary' else 0.5)
+    author, work = rng.choice(AUTHORS)
+    other = rng.choice([a for a, _ in AUTHORS if a != author])
+
+    template = rng.choice(ANALYTICAL_TEMPLATES if analytical else SIMPLE_TEMPLATES)
+    opening = template.format(author=author, work=work, other=other)
+    grade_phrase = rng.choice(GRADE_PHRASES[grade])
+    if grade_phrase:
+        opening = f"{grade_phrase}، {opening}"
+
+    turns = [opening] + rng.sample(FOLLOW_UPS, rng.randint(0, 3))
+    return {
+        'grade': grade,
+        'kind': 'analytical' if analytical else 'simple',
+        'turns': turns,
+        # وقت التفكير بين الرسائل (ثوانٍ) ونسبة جلب السجل بعد كل رد
+        'think_time': [round(rng.uniform(0.5, 3.0), 2) for _ in turns],
+        'fetch_history': rng.random() < 0.3,
+    }
+
+def generate_traces(count: int, seed: int = 42) -> List[Dict[str, Any]]:
+    """مجموعة جلسات حتمية من البذرة نفسها لمقارنة التشغيلات"""
+    rng = random.Random(seed)
+    return [generate_session(rng) for _ in range(count)]
+
+def load_traces(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def save_traces(traces: List[Dict[str, Any]], path: str):
+    with open(path, 'w', encoding='utf-8') as f:
+        for trace in traces:
+            f.write(json.dumps(trace, ensure_ascii=False) + '\n')
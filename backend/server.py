@@ -1,4 +1,5 @@
-from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, UploadFile, File, Request
+from fastapi.responses import PlainTextResponse, JSONResponse
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
@@ -6,33 +7,104 @@ from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
+from contextlib import asynccontextmanager
 from pydantic import BaseModel, Field
 from typing import List, Optional
 import uuid
 from datetime import datetime
 import shutil
+import time
+import math
+import asyncio
 
 # استيراد خدمات جديدة
 from services.chat_service import ChatService
 from services.knowledge_service import OmaniLiteratureKnowledgeBase
 from services.verification_service import information_verifier
-from services.simple_collector import simple_collector
-from services.nizwa_extractor import nizwa_extractor
+from services.registry import service_registry
+from services.hedging_service import hedged_executor
+from services.resilience import provider_resilience
+from services.usage_service import usage_tracker
+from services.tracing import tracer
+from services.provider_cassettes import provider_cassettes
+from services.loop_monitor import loop_lag_monitor
+from services.warmup import warmup_manager
+from services.shared_cache import shared_cache
+from services.admission import admission_controller, AdmissionRejected
+from services.provider_scheduler import provider_scheduler
+from services.search_policy import search_policy
+from services.search_warehouse import search_warehouse
+from services.link_index import trusted_link_index
+from services.wiki_mirror import wikipedia_mirror
+from services.job_queue import job_queue
+from services.metrics import metrics, http_request_duration, http_requests_in_flight, MongoCommandMetrics
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(
+    mongo_url,
+    event_listeners=[MongoCommandMetrics()],
+    # اتصالات مفتوحة مسبقاً حتى لا يدفع أول طلب ثمن الاتصال والمصافحة
+    minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', '5'))
+)
 db = client[os.environ['DB_NAME']]
 
 # إنشاء خدمة الدردشة وقاعدة المعرفة والنظم المتقدمة
 chat_service = ChatService(db)
 knowledge_base = OmaniLiteratureKnowledgeBase(db)
 
+async def warm_up_mongo():
+    """فتح الاتصال بقاعدة البيانات وإنشاء فهارس الاستعلامات الساخنة"""
+    await client.admin.command('ping')
+    await chat_service.ensure_indexes()
+    await usage_tracker.ensure_indexes()
+    await search_warehouse.ensure_indexes()
+    await job_queue.ensure_indexes()
+
+async def warm_up_local_knowledge():
+    ChatService.prime_local_index()
+
+def warm_up_service(name: str):
+    async def step():
+        # الاستيراد والإنشاء متزامنان وقد يطولان، فيُنفذان في خيط منفصل
+        service = await service_registry.aget(name)
+        if hasattr(service, 'warm_up'):
+            await service.warm_up()
+    return step
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """دورة حياة التطبيق: بدء الخدمات الخفيفة فوراً، ثم إحماء في الخلفية تعتمد عليه الجاهزية"""
+    usage_tracker.attach_db(db)
+    usage_tracker.start()
+    search_warehouse.attach_db(db)
+    search_warehouse.start()
+    job_queue.attach_db(db)
+    job_queue.start()
+    loop_lag_monitor.start()
+    
+    warmup_manager.add_step('mongo', warm_up_mongo)
+    warmup_manager.add_step('local_knowledge_index', warm_up_local_knowledge)
+    warmup_manager.add_step('shared_cache', shared_cache.open, required=False)
+    for name in filter(None, os.environ.get('WARMUP_SERVICES', 'tavily_search,ghassan_llm,advanced_ghassan').split(',')):
+        warmup_manager.add_step(f'service:{name.strip()}', warm_up_service(name.strip()), required=False)
+    warmup_manager.start()
+    yield
+    await warmup_manager.stop()
+    await loop_lag_monitor.stop()
+    await usage_tracker.stop()
+    await search_warehouse.stop()
+    await job_queue.stop()
+    await shared_cache.close()
+    await service_registry.shutdown()
+    provider_resilience.shutdown()
+    client.close()
+
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # إعداد مجلد الصور الثابتة
 UPLOADS_DIR = Path("/app/frontend/public/uploads")
@@ -44,6 +116,46 @@ app.mount("/uploads", StaticFiles(directory=str(UPLOADS_DIR)), name="uploads")
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """فتح مقطع جذري لكل طلب مع قبول معرف التتبع القادم من العميل (traceparent)"""
+    incoming_trace_id = request.headers.get('x-trace-id')
+    traceparent = request.headers.get('traceparent', '').split('-')
+    if len(traceparent) == 4 and len(traceparent[1]) == 32:
+        incoming_trace_id = traceparent[1]
+    
+    with tracer.span(f"{request.method} {request.url.path}", trace_id=incoming_trace_id) as span:
+        # ربط الطلب بمهامه حتى ينسب مراقب الحلقة أي حجب إلى المسار ومعرف التتبع
+        loop_token = loop_lag_monitor.bind_request(f"{request.method} {request.url.path}", tracer.current_trace_id())
+        try:
+            response = await call_next(request)
+        finally:
+            loop_lag_monitor.unbind_request(loop_token)
+        if span is not None:
+            span.set_attribute('http.status_code', response.status_code)
+            response.headers['X-Trace-Id'] = span.trace.trace_id
+        return response
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """قياس زمن كل طلب حسب قالب المسار (لا المسار الفعلي) وعدد الطلبات الجارية"""
+    http_requests_in_flight.inc()
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        http_requests_in_flight.dec()
+        route = request.scope.get('route')
+        http_request_duration.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=getattr(route, 'path', 'unmatched'),
+            status=str(status)
+        )
+
 
 # Define Models
 class StatusCheck(BaseModel):
@@ -79,20 +191,58 @@ class ContactRequest(BaseModel):
 async def root():
     return {"message": "مرحباً! أنا غسان، مساعدك الأدبي العُماني الذكي"}
 
+@api_router.get("/health")
+async def health():
+    """فحص الحياة: العملية تعمل وتستجيب (لا يعتمد على الإحماء أو قاعدة البيانات)"""
+    return {"status": "alive"}
+
+@api_router.get("/ready")
+async def ready():
+    """فحص الجاهزية: 200 بعد اكتمال خطوات الإحماء الإلزامية، و503 قبل ذلك"""
+    status = warmup_manager.get_status()
+    return JSONResponse(status_code=200 if status['ready'] else 503, content=status)
+
 @api_router.post("/chat/message", response_model=ChatResponse)
-async def send_message(request: ChatMessageRequest):
+async def send_message(request: ChatMessageRequest, http_request: Request):
     """إرسال رسالة لغسان والحصول على رد ذكي مع فحص الموثوقية"""
     try:
-        result = await chat_service.process_user_message(
-            message_text=request.message,
-            session_id=request.session_id
+        timeout = admission_controller.parse_timeout(http_request.headers.get('X-Request-Timeout'))
+        priority = admission_controller.resolve_priority(
+            http_request.headers.get('X-Priority'),
+            http_request.headers.get('X-Priority-Token')
         )
-        
-        # فحص موثوقية الرد
-        verification_result = await information_verifier.verify_response(
-            response=result['text'],
-            user_query=request.message
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        # الرفض يحدث قبل أي استدعاء للمزودين حتى لا تتراكم الطلبات حتى المهلات
+        admission_controller.check_rate_limit(request.session_id)
+        async with admission_controller.admit(priority=priority, timeout=timeout):
+            return await _process_chat_message(request)
+    except AdmissionRejected as e:
+        raise HTTPException(
+            status_code=e.status_code,
+            detail=f"الخادم مشغول حالياً، أعد المحاولة لاحقاً ({e.reason})",
+            headers={'Retry-After': str(max(1, math.ceil(e.retry_after)))}
         )
+
+async def _process_chat_message(request: ChatMessageRequest) -> ChatResponse:
+    usage_token = usage_tracker.begin_request(request.session_id)
+    result = None
+    try:
+        with tracer.span('send_message', session_id=request.session_id):
+            result = await chat_service.process_user_message(
+                message_text=request.message,
+                session_id=request.session_id
+            )
+            
+            # فحص موثوقية الرد (إعادة استخدام نتيجة السلسلة إن وُجدت)
+            verification_result = result.get('verification')
+            if verification_result is None:
+                verification_result = await information_verifier.verify_response(
+                    response=result['text'],
+                    user_query=request.message
+                )
         
         return ChatResponse(
             message_id=result['message_id'],
@@ -107,6 +257,8 @@ async def send_message(request: ChatMessageRequest):
     except Exception as e:
         logging.error(f"خطأ في إرسال الرسالة: {e}")
         raise HTTPException(status_code=500, detail=f"خطأ في معالجة الرسالة: {str(e)}")
+    finally:
+        usage_tracker.end_request(usage_token, session_id=result['session_id'] if result else None)
 
 @api_router.post("/contact/send")
 async def send_contact_message(request: ContactRequest):
@@ -169,6 +321,137 @@ async def get_knowledge_stats():
         logging.error(f"خطأ في جلب الإحصائيات: {e}")
         raise HTTPException(status_code=500, detail=f"خطأ في جلب الإحصائيات: {str(e)}")
 
+@api_router.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """المقاييس بصيغة Prometheus النصية: زمن الطلبات والمزودين وقاعدة البيانات والتخزين المؤقت"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@api_router.get("/providers/cassettes")
+async def get_cassette_stats():
+    """وضع مزودي الخدمات (live/record/replay) وإحصائيات التسجيل والإعادة"""
+    try:
+        return provider_cassettes.get_cassette_stats()
+    except Exception as e:
+        logging.error(f"خطأ في إحصائيات التسجيلات: {e}")
+        raise HTTPException(status_code=500, detail=f"خطأ في جلب الإحصائيات: {str(e)}")
+
+@api_router.get("/services/registry")
+async def get_service_registry():
+    """الخدمات المسجلة: هل أُنشئت، وزمن إنشائها، وسبب تعذرها إن وجد"""
+    try:
+        return service_registry.get_registry_stats()
+    except Exception as e:
+        logging.error(f"خطأ في حالة الخدمات: {e}")
+        raise HTTPException(status_code=500, detail=f"خطأ في جلب الإحصائيات: {str(e)}")
+
+@api_router.get("/admission/stats")
+async def get_admission_stats():
+    """الطلبات قيد التنفيذ وعمق الطابور وعدد الطلبات المرفوضة لكل سبب"""
+    try:
+        return admission_controller.get_admission_stats()
+    except Exception as e:
+        logging.error(f"خطأ في إحصائيات القبول: {e}")
+        raise HTTPException(status_code=500, detail=f"خطأ في جلب الإحصائيات: {str(e)}")
+
+@api_router.get("/loop/stats")
+async def get_loop_stats():
+    """نسب تأخر حلقة الأحداث وآخر حالات الحجب مع المكدس والمسار"""
+    try:
+        return loop_lag_monitor.get_lag_stats()
+    except Exception as e:
+        logging.error(f"خطأ في إحصائيات حلقة الأحداث: {e}")
+        raise HTTPException(status_code=500, detail=f"خطأ في جلب الإحصائيات: {str(e)}")
+
+@api_router.get("/scheduler/stats")
+async def get_scheduler_stats():
+    """الاستدعاءات الخارجية الجارية والمنتظرة لكل مزود وفئة أولوية"""
+    try:
+        return provider_scheduler.get_scheduler_stats()
+    except Exception as e:
+        logging.error(f"خطأ في إحصائيات المجدول: {e}")
+        raise HTTPException(status_code=500, detail=f"خطأ في جلب الإحصائيات: {str(e)}")
+
+@api_router.get("/search/policy")
+async def get_search_policy_stats():
+    """فائدة نتائج البحث لكل فئة استعلام وعمق، والتوفير مقارنة بالبحث المتقدم دائماً"""
+    try:
+        return search_policy.get_policy_stats()
+    except Exception as e:
+        logging.error(f"خطأ في إحصائيات سياسة البحث: {e}")
+        raise HTTPException(status_code=500, detail=f"خطأ في جلب الإحصائيات: {str(e)}")
+
+@api_router.get("/search/warehouse")
+async def get_search_warehouse_stats():
+    """حجم المستودع المحلي لنتائج البحث وحداثته ونسبة الإجابة منه دون الشبكة"""
+    try:
+        return await search_warehouse.get_warehouse_stats()
+    except Exception as e:
+        logging.error(f"خطأ في إحصائيات مستودع البحث: {e}")
+        raise HTTPException(status_code=500, detail=f"خطأ في جلب الإحصائيات: {str(e)}")
+
+@api_router.get("/links/index")
+async def get_trusted_link_index_stats():
+    """حجم فهرس الروابط الموثوقة وعمره ونسبة الإجابة منه دون بحث شبكي"""
+    try:
+        return await asyncio.to_thread(trusted_link_index.get_index_stats)
+    except Exception as e:
+        logging.error(f"خطأ في إحصائيات فهرس الروابط: {e}")
+        raise HTTPException(status_code=500, detail=f"خطأ في جلب الإحصائيات: {str(e)}")
+
+@api_router.get("/wikipedia/mirror")
+async def get_wikipedia_mirror_stats():
+    """حجم نسخة ويكيبيديا المحلية وتاريخ بنائها وآخر تحديث ونسبة الإجابة منها"""
+    try:
+        return await asyncio.to_thread(wikipedia_mirror.get_mirror_stats)
+    except Exception as e:
+        logging.error(f"خطأ في إحصائيات نسخة ويكيبيديا المحلية: {e}")
+        raise HTTPException(status_code=500, detail=f"خطأ في جلب الإحصائيات: {str(e)}")
+
+@api_router.get("/cache/stats")
+async def get_shared_cache_stats():
+    """نسبة الإصابة في التخزين المشترك لهذا العامل ولجميع العمال، وذاكرة كل عامل"""
+    try:
+        return await shared_cache.get_cache_stats()
+    except Exception as e:
+        logging.error(f"خطأ في إحصائيات التخزين المشترك: {e}")
+        raise HTTPException(status_code=500, detail=f"خطأ في جلب الإحصائيات: {str(e)}")
+
+@api_router.get("/llm/cascade-stats")
+async def get_cascade_stats():
+    """إحصائيات سلسلة النماذج: نسبة التصعيد وزمن كل مستوى وتكلفته"""
+    try:
+        return (await service_registry.aget('ghassan_llm')).get_cascade_stats()
+    except Exception as e:
+        logging.error(f"خطأ في إحصائيات السلسلة: {e}")
+        raise HTTPException(status_code=500, detail=f"خطأ في جلب الإحصائيات: {str(e)}")
+
+@api_router.get("/llm/hedging-stats")
+async def get_hedging_stats():
+    """إحصائيات الطلبات الاحتياطية: المهلة الحالية ونسبة التحوط والميزانية المتبقية"""
+    try:
+        return hedged_executor.get_hedging_stats()
+    except Exception as e:
+        logging.error(f"خطأ في إحصائيات التحوط: {e}")
+        raise HTTPException(status_code=500, detail=f"خطأ في جلب الإحصائيات: {str(e)}")
+
+@api_router.get("/resilience/breakers")
+async def get_breaker_states():
+    """حالة قواطع الدائرة والمهل التكيفية لكل مزود خارجي"""
+    try:
+        return provider_resilience.get_breaker_states()
+    except Exception as e:
+        logging.error(f"خطأ في حالة قواطع الدائرة: {e}")
+        raise HTTPException(status_code=500, detail=f"خطأ في جلب الحالة: {str(e)}")
+
+@api_router.get("/usage/summary")
+async def get_usage_summary(session_id: Optional[str] = None):
+    """ملخص استهلاك التوكنات والتكلفة (p50/p95 لكل طلب، ومجاميع لكل نموذج ومرحلة)"""
+    try:
+        return await usage_tracker.get_usage_summary(session_id)
+    except Exception as e:
+        logging.error(f"خطأ في ملخص الاستهلاك: {e}")
+        raise HTTPException(status_code=500, detail=f"خطأ في جلب الملخص: {str(e)}")
+
 # @api_router.post("/chat/message-advanced", response_model=ChatResponse)
 # async def send_message_advanced(request: ChatMessageRequest):
 #     """إرسال رسالة لغسان المطور مع نظام RAG متكامل"""
@@ -265,9 +548,8 @@ async def upload_ghassan_avatar(image: UploadFile = File(...), type: str = "avat
         filename = f"ghassan-avatar.{file_extension}"
         file_path = UPLOADS_DIR / filename
         
-        # حفظ الصورة
-        with open(file_path, "wb") as buffer:
-            buffer.write(content)
+        # حفظ الصورة (الكتابة للقرص في خيط منفصل)
+        await asyncio.to_thread(file_path.write_bytes, content)
         
         # إنشاء رابط للوصول للصورة
         image_url = f"/uploads/{filename}"
@@ -318,39 +600,81 @@ async def get_current_avatar():
             
     except Exception as e:
         logger.error(f"خطأ في جلب الصورة الحالية: {e}")
-@api_router.post("/collect/simple")
-async def simple_collect_sources():
-    """جمع بسيط للمصادر من المقابلات والمقالات"""
-    try:
-        results = await simple_collector.bulk_collect_all_authors()
+async def run_simple_collection(params: dict, report) -> dict:
+    """مهمة الجمع الشامل: مصادر كل المؤلفين المعروفين ثم حفظها"""
+    results = await (await service_registry.aget('simple_collector')).bulk_collect_all_authors(progress=report)
+    
+    # حفظ النتائج في قاعدة البيانات للاستفادة منها لاحقاً
+    await db.collected_sources.insert_one({
+        'collection_id': str(uuid.uuid4()),
+        'results': results,
+        'collection_date': datetime.utcnow(),
+        'status': 'completed' if results.get('collection_completed') else 'failed'
+    })
+    if not results.get('collection_completed'):
+        raise RuntimeError(results.get('error', 'لم يكتمل الجمع'))
+    return results
+
+async def run_author_collection(params: dict, report) -> dict:
+    """مهمة جمع مصادر مؤلف محدد ثم حفظها"""
+    author_name = params['author_name']
+    results = await (await service_registry.aget('simple_collector')).collect_sources_for_author(author_name)
+    
+    # حفظ نتائج هذا المؤلف
+    await db.author_sources.insert_one({
+        'author_name': author_name,
+        'sources': results,
+        'collection_date': datetime.utcnow()
+    })
+    return results
+
+async def run_nizwa_extraction(params: dict, report) -> dict:
+    """مهمة استخراج محتوى من أرشيف مجلة نزوى"""
+    nizwa_extractor = await service_registry.aget('nizwa_extractor')
+    results = await nizwa_extractor.extract_sample_issues()
+    
+    if results['successfully_extracted'] > 0:
+        # تنسيق وحفظ في قاعدة البيانات
+        formatted_content = nizwa_extractor.format_for_knowledge_base(results)
         
-        # حفظ النتائج في قاعدة البيانات للاستفادة منها لاحقاً
-        await db.collected_sources.insert_one({
-            'collection_id': str(uuid.uuid4()),
+        await db.nizwa_extractions.insert_one({
+            'extraction_id': str(uuid.uuid4()),
             'results': results,
-            'collection_date': datetime.utcnow(),
-            'status': 'completed' if results.get('collection_completed') else 'failed'
+            'formatted_content': formatted_content,
+            'extraction_date': datetime.utcnow(),
+            'status': 'completed'
         })
-        
-        return results
+    
+    return results
+
+# الجمع الشامل والاستخراج يزحفان على المصادر نفسها، فمهمة واحدة من كل نوع في وقت واحد
+job_queue.register('simple_collection', run_simple_collection, max_concurrency=1)
+job_queue.register('author_collection', run_author_collection, max_concurrency=2)
+job_queue.register('nizwa_extraction', run_nizwa_extraction, max_concurrency=1)
+
+def job_accepted(job: dict) -> dict:
+    """رد الإنشاء: المعرف والحالة ورابط المتابعة (العمل نفسه يجري في الخلفية)"""
+    return {
+        'job_id': job['job_id'],
+        'job_type': job['job_type'],
+        'status': job['status'],
+        'status_url': f"/api/jobs/{job['job_id']}"
+    }
+
+@api_router.post("/collect/simple", status_code=202)
+async def simple_collect_sources():
+    """جمع بسيط للمصادر من المقابلات والمقالات (مهمة في الخلفية)"""
+    try:
+        return job_accepted(await job_queue.submit('simple_collection'))
     except Exception as e:
         logging.error(f"خطأ في الجمع البسيط: {e}")
         raise HTTPException(status_code=500, detail=f"خطأ في الجمع: {str(e)}")
 
-@api_router.get("/collect/author/{author_name}")
+@api_router.get("/collect/author/{author_name}", status_code=202)
 async def collect_for_specific_author(author_name: str):
-    """جمع مصادر لمؤلف محدد"""
+    """جمع مصادر لمؤلف محدد (مهمة في الخلفية)"""
     try:
-        results = await simple_collector.collect_sources_for_author(author_name)
-        
-        # حفظ نتائج هذا المؤلف
-        await db.author_sources.insert_one({
-            'author_name': author_name,
-            'sources': results,
-            'collection_date': datetime.utcnow()
-        })
-        
-        return results
+        return job_accepted(await job_queue.submit('author_collection', {'author_name': author_name}))
     except Exception as e:
         logging.error(f"خطأ في جمع مصادر المؤلف: {e}")
         raise HTTPException(status_code=500, detail=f"خطأ في الجمع: {str(e)}")
@@ -359,8 +683,8 @@ async def collect_for_specific_author(author_name: str):
 async def get_sources_stats():
     """إحصائيات المصادر المجمعة"""
     try:
-        total_collections = await db.collected_sources.count_documents({})
-        total_authors = await db.author_sources.count_documents({})
+        total_collections = await db.collected_sources.estimated_document_count()
+        total_authors = await db.author_sources.estimated_document_count()
         
         # آخر عمليات الجمع
         recent_collections = await db.collected_sources.find().sort('collection_date', -1).limit(3).to_list(3)
@@ -375,72 +699,48 @@ async def get_sources_stats():
         logging.error(f"خطأ في إحصائيات المصادر: {e}")
         return {'error': str(e)}
 
-@api_router.get("/collect/author/{author_name}")
-async def collect_for_specific_author(author_name: str):
-    """جمع مصادر لمؤلف محدد"""
+@api_router.post("/extract/nizwa", status_code=202)
+async def extract_nizwa_content():
+    """استخراج محتوى من أرشيف مجلة نزوى (مهمة في الخلفية)"""
     try:
-        results = await simple_collector.collect_sources_for_author(author_name)
-        
-        # حفظ نتائج هذا المؤلف
-        await db.author_sources.insert_one({
-            'author_name': author_name,
-            'sources': results,
-            'collection_date': datetime.utcnow()
-        })
-        
-        return results
+        return job_accepted(await job_queue.submit('nizwa_extraction'))
     except Exception as e:
-        logging.error(f"خطأ في جمع مصادر المؤلف: {e}")
-        raise HTTPException(status_code=500, detail=f"خطأ في الجمع: {str(e)}")
+        logging.error(f"خطأ في استخراج نزوى: {e}")
+        raise HTTPException(status_code=500, detail=f"خطأ في الاستخراج: {str(e)}")
 
-@api_router.get("/sources/stats")
-async def get_sources_stats():
-    """إحصائيات المصادر المجمعة"""
+@api_router.get("/jobs")
+async def list_jobs(job_type: Optional[str] = None, status: Optional[str] = None, limit: int = 20):
+    """أحدث المهام (بلا نتائجها) مع عددها حسب النوع والحالة"""
     try:
-        total_collections = await db.collected_sources.count_documents({})
-        total_authors = await db.author_sources.count_documents({})
-        
-        # آخر عمليات الجمع
-        recent_collections = await db.collected_sources.find().sort('collection_date', -1).limit(3).to_list(3)
-        
         return {
-            'total_collections': total_collections,
-            'total_author_collections': total_authors,
-            'recent_collections': recent_collections,
-            'last_updated': datetime.utcnow().isoformat()
+            'jobs': await job_queue.list_jobs(job_type, status, min(limit, 100)),
+            'stats': await job_queue.get_queue_stats()
         }
     except Exception as e:
-        logging.error(f"خطأ في إحصائيات المصادر: {e}")
-        return {'error': str(e)}
-
-@api_router.post("/extract/nizwa")
-async def extract_nizwa_content():
-    """استخراج محتوى من أرشيف مجلة نزوى"""
-    try:
-        results = await nizwa_extractor.extract_sample_issues()
-        
-        if results['successfully_extracted'] > 0:
-            # تنسيق وحفظ في قاعدة البيانات
-            formatted_content = nizwa_extractor.format_for_knowledge_base(results)
-            
-            await db.nizwa_extractions.insert_one({
-                'extraction_id': str(uuid.uuid4()),
-                'results': results,
-                'formatted_content': formatted_content,
-                'extraction_date': datetime.utcnow(),
-                'status': 'completed'
-            })
-        
-        return results
-    except Exception as e:
-        logging.error(f"خطأ في استخراج نزوى: {e}")
-        raise HTTPException(status_code=500, detail=f"خطأ في الاستخراج: {str(e)}")
+        logging.error(f"خطأ في جلب المهام: {e}")
+        raise HTTPException(status_code=500, detail=f"خطأ في جلب المهام: {str(e)}")
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """حالة المهمة وتقدمها ونتيجتها عند الانتهاء"""
+    job = await job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="المهمة غير موجودة")
+    return job
+
+@api_router.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    """إلغاء مهمة منتظرة فوراً، أو طلب إيقاف مهمة جارية"""
+    job = await job_queue.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="المهمة غير موجودة")
+    return job
 
 @api_router.get("/knowledge/nizwa-stats")
 async def get_nizwa_extraction_stats():
     """إحصائيات استخراج مجلة نزوى"""
     try:
-        total_extractions = await db.nizwa_extractions.count_documents({})
+        total_extractions = await db.nizwa_extractions.estimated_document_count()
         latest_extraction = await db.nizwa_extractions.find_one(
             {}, sort=[('extraction_date', -1)]
         )
@@ -505,7 +805,3 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
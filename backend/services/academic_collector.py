@@ -1,15 +1,20 @@
+import os
 import asyncio
 import aiohttp
-from typing import List, Dict, Any, Optional
+import hashlib
+import time
+from typing import List, Dict, Any, Callable, Optional, Tuple
 import logging
 from bs4 import BeautifulSoup
 from newspaper import Article
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 from urllib.parse import urljoin, urlparse
 import re
 
-from services.tavily_service import tavily_search_service
+from services.admission import TokenBucket
+from services.registry import service_registry
+from services.search_policy import search_policy
 
 logger = logging.getLogger(__name__)
 
@@ -43,9 +48,26 @@ class AcademicSourceCollector:
             'أحمد بلال', 'يحيى منصور', 'حسين العبري', 'فاطمة الشيدي',
             'عبدالله الطائي', 'زاهر الغافري', 'خالد البلوشي'
         ]
+        
+        # حالة الزحف لكل (فئة، مؤلف أو موضوع، استعلام) في crawl_checkpoints بعد attach_db؛
+        # الاستعلام المكتمل خلال نافذة الحداثة لا يُعاد وتُستخدم نتائجه المحفوظة
+        self.checkpoints = None
+        self.freshness = timedelta(hours=float(os.environ.get('ACADEMIC_CRAWL_FRESHNESS_HOURS', '168')))
+        # حد معدل مشترك بين الفئات المتزامنة (يحل محل التأخير الثابت بعد كل استعلام)
+        self._search_bucket = TokenBucket(
+            float(os.environ.get('ACADEMIC_SEARCH_RATE_PER_SECOND', '0.5')),
+            float(os.environ.get('ACADEMIC_SEARCH_BURST', '2'))
+        )
+    
+    def attach_db(self, db):
+        self.checkpoints = db.crawl_checkpoints
     
-    async def collect_comprehensive_sources(self) -> Dict[str, Any]:
-        """جمع شامل للمصادر الأكاديمية"""
+    async def collect_comprehensive_sources(self, force_refresh: bool = False) -> Dict[str, Any]:
+        """جمع شامل للمصادر الأكاديمية
+
+        الفئات الأربع مستقلة فتُزحف معاً، وكل استعلام يُحفظ عند انتهائه؛ فإن توقف الجمع
+        استأنفت الإعادة مما بقي. force_refresh يتجاهل نافذة الحداثة ويعيد كل الاستعلامات.
+        """
         
         collection_results = {
             'academic_papers': [],
@@ -55,22 +77,20 @@ class AcademicSourceCollector:
             'total_collected': 0,
             'collection_date': datetime.utcnow().isoformat()
         }
+        crawl_stats = {'queries_total': 0, 'queries_run': 0, 'queries_resumed': 0, 'queries_failed': 0}
+        started = time.perf_counter()
         
         try:
-            # جمع الأبحاث الأكاديمية
-            academic_results = await self._collect_academic_papers()
+            # الأبحاث الأكاديمية والمقابلات والمقالات الأدبية ومعلومات الكتب معاً
+            academic_results, interviews_results, articles_results, books_results = await asyncio.gather(
+                self._collect_academic_papers(crawl_stats, force_refresh),
+                self._collect_interviews(crawl_stats, force_refresh),
+                self._collect_literary_articles(crawl_stats, force_refresh),
+                self._collect_books_metadata(crawl_stats, force_refresh)
+            )
             collection_results['academic_papers'] = academic_results
-            
-            # جمع المقابلات والحوارات
-            interviews_results = await self._collect_interviews()
             collection_results['interviews'] = interviews_results
-            
-            # جمع المقالات من المجلات الأدبية
-            articles_results = await self._collect_literary_articles()
             collection_results['articles'] = articles_results
-            
-            # جمع معلومات الكتب والدواوين
-            books_results = await self._collect_books_metadata()
             collection_results['books_metadata'] = books_results
             
             collection_results['total_collected'] = (
@@ -78,173 +98,230 @@ class AcademicSourceCollector:
                 len(articles_results) + len(books_results)
             )
             
-            logger.info(f"تم جمع {collection_results['total_collected']} مصدر أكاديمي")
-            
-            return collection_results
+            logger.info(
+                f"تم جمع {collection_results['total_collected']} مصدر أكاديمي "
+                f"({crawl_stats['queries_run']} استعلام جديد، {crawl_stats['queries_resumed']} من نقاط الحفظ)"
+            )
             
         except Exception as e:
             logger.error(f"خطأ في جمع المصادر: {e}")
-            return collection_results
+        
+        collection_results['crawl'] = {**crawl_stats, 'duration_seconds': round(time.perf_counter() - started, 2)}
+        return collection_results
     
-    async def _collect_academic_papers(self) -> List[Dict[str, Any]]:
-        """جمع الأبحاث الأكاديمية عن الأدب العُماني"""
-        academic_papers = []
+    @staticmethod
+    def _checkpoint_id(category: str, subject: str, query: str) -> str:
+        return hashlib.sha1(f'{category}|{subject}|{query}'.encode('utf-8')).hexdigest()
+    
+    async def _acquire_search_slot(self):
+        wait = self._search_bucket.try_acquire()
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self._search_bucket.try_acquire()
+    
+    async def _crawl(
+        self,
+        category: str,
+        tasks: List[Tuple[str, str, Dict[str, Any]]],
+        to_item: Callable[[Dict[str, Any], str, str], Optional[Dict[str, Any]]],
+        crawl_stats: Dict[str, int],
+        force_refresh: bool
+    ) -> List[Dict[str, Any]]:
+        """تنفيذ استعلامات فئة واحدة بالترتيب مع حفظ حالة كل استعلام ونتائجه
+
+        tasks: (المؤلف أو الموضوع، الاستعلام، معاملات البحث). to_item يحول نتيجة البحث
+        إلى عنصر، أو None إن لم تكن من هذه الفئة.
+        """
+        items = []
+        fresh_after = datetime.utcnow() - self.freshness
         
-        try:
-            # البحث في كل مؤلف معروف
-            for author in self.known_omani_authors[:5]:  # أول 5 للاختبار
-                search_query = f'"{author}" الأدب العُماني academic research site:edu OR site:jstor.org'
+        for subject, query, search_kwargs in tasks:
+            crawl_stats['queries_total'] += 1
+            checkpoint_id = self._checkpoint_id(category, subject, query)
+            
+            try:
+                if self.checkpoints is not None and not force_refresh:
+                    checkpoint = await self.checkpoints.find_one({'_id': checkpoint_id, 'status': 'completed'})
+                    if checkpoint and checkpoint['completed_at'] >= fresh_after:
+                        items.extend(checkpoint['items'])
+                        crawl_stats['queries_resumed'] += 1
+                        continue
                 
-                # استخدام Tavily للبحث الأكاديمي
-                results = await tavily_search_service.search_omani_literature_advanced(
-                    query=search_query,
-                    max_results=3,
-                    include_domains=self.academic_sites['journals'] + 
-                                  [site.replace('https://', '').replace('http://', '') 
-                                   for site in self.academic_sites['universities']]
+                await self._acquire_search_slot()
+                results = await (await service_registry.aget('tavily_search')).search_omani_literature_advanced(
+                    query=query, **search_kwargs
                 )
+                crawl_stats['queries_run'] += 1
                 
-                for result in results.get('results', []):
-                    if self._is_academic_content(result):
-                        academic_paper = {
-                            'title': result.get('title', ''),
-                            'url': result.get('url', ''),
-                            'abstract': result.get('content', '')[:500],
-                            'covered_author': author,
-                            'source_type': 'academic_paper',
-                            'reliability_score': result.get('reliability_rating', 0.8),
-                            'collection_date': datetime.utcnow().isoformat(),
-                            'metadata': {
-                                'search_query': search_query,
-                                'tavily_score': result.get('score', 0)
-                            }
-                        }
-                        academic_papers.append(academic_paper)
+                if results.get('error'):
+                    # الاستعلام الفاشل لا يُعلَّم مكتملاً فيُعاد في التشغيل التالي
+                    crawl_stats['queries_failed'] += 1
+                    await self._save_checkpoint(checkpoint_id, category, subject, query, 'failed', [], results['error'])
+                    continue
                 
-                # تأخير للتجنب Rate limiting
-                await asyncio.sleep(2)
-            
+                found = [item for item in (to_item(result, subject, query) for result in results.get('results', [])) if item]
+                search_policy.record_usage(results, len(found))
+                await self._save_checkpoint(checkpoint_id, category, subject, query, 'completed', found)
+                items.extend(found)
+            except Exception as e:
+                # خطأ في استعلام واحد (قاعدة البيانات أو خدمة البحث) لا يُسقط ما جُمع من الفئة حتى الآن
+                logger.error(f"خطأ في استعلام الزحف ({category}/{subject}): {e}")
+                crawl_stats['queries_failed'] += 1
+                await self._save_checkpoint(checkpoint_id, category, subject, query, 'failed', [], f"{type(e).__name__}: {e}")
+        
+        return items
+    
+    async def _save_checkpoint(
+        self, checkpoint_id: str, category: str, subject: str, query: str,
+        status: str, items: List[Dict[str, Any]], error: Optional[str] = None
+    ):
+        if self.checkpoints is None:
+            return
+        now = datetime.utcnow()
+        fields = {
+            'category': category, 'subject': subject, 'query': query,
+            'status': status, 'error': error, 'last_attempt_at': now
+        }
+        update: Dict[str, Any] = {'$set': fields, '$inc': {'attempts': 1}}
+        if status == 'completed':
+            fields.update(items=items, completed_at=now)
+        else:
+            # الفشل لا يمس عناصر آخر تشغيل مكتمل ولا وقت اكتماله (الذي يقرؤه فحص الاستئناف)
+            update['$setOnInsert'] = {'items': []}
+        try:
+            await self.checkpoints.update_one({'_id': checkpoint_id}, update, upsert=True)
         except Exception as e:
-            logger.error(f"خطأ في جمع الأبحاث الأكاديمية: {e}")
+            logger.error(f"خطأ في حفظ حالة الزحف ({category}/{subject}): {e}")
+    
+    async def _collect_academic_papers(self, crawl_stats: Dict[str, int], force_refresh: bool = False) -> List[Dict[str, Any]]:
+        """جمع الأبحاث الأكاديمية عن الأدب العُماني"""
+        include_domains = self.academic_sites['journals'] + [
+            site.replace('https://', '').replace('http://', '') for site in self.academic_sites['universities']
+        ]
+        # البحث في كل مؤلف معروف
+        tasks = [
+            (author, f'"{author}" الأدب العُماني academic research site:edu OR site:jstor.org',
+             {'max_results': 3, 'include_domains': include_domains})
+            for author in self.known_omani_authors
+        ]
+        
+        def to_paper(result: Dict[str, Any], author: str, search_query: str) -> Optional[Dict[str, Any]]:
+            if not self._is_academic_content(result):
+                return None
+            return {
+                'title': result.get('title', ''),
+                'url': result.get('url', ''),
+                'abstract': result.get('content', '')[:500],
+                'covered_author': author,
+                'source_type': 'academic_paper',
+                'reliability_score': result.get('reliability_rating', 0.8),
+                'collection_date': datetime.utcnow().isoformat(),
+                'metadata': {
+                    'search_query': search_query,
+                    'tavily_score': result.get('score', 0)
+                }
+            }
         
-        return academic_papers[:20]  # أول 20 بحث
+        try:
+            return await self._crawl('academic_papers', tasks, to_paper, crawl_stats, force_refresh)
+        except Exception as e:
+            logger.error(f"خطأ في جمع الأبحاث الأكاديمية: {e}")
+            return []
     
-    async def _collect_interviews(self) -> List[Dict[str, Any]]:
+    async def _collect_interviews(self, crawl_stats: Dict[str, int], force_refresh: bool = False) -> List[Dict[str, Any]]:
         """جمع المقابلات والحوارات مع الأدباء العُمانيين"""
-        interviews = []
+        # البحث عن مقابلات مع كل مؤلف
+        tasks = [
+            (author, f'مقابلة مع "{author}" OR حوار مع "{author}" OR لقاء مع "{author}" site:omanobserver.om OR site:shabiba.com',
+             {'max_results': 2})
+            for author in self.known_omani_authors
+        ]
+        
+        def to_interview(result: Dict[str, Any], author: str, _query: str) -> Optional[Dict[str, Any]]:
+            if not self._is_interview_content(result):
+                return None
+            return {
+                'title': result.get('title', ''),
+                'url': result.get('url', ''),
+                'content': result.get('content', ''),
+                'interviewee': author,
+                'source_type': 'interview',
+                'publication_date': result.get('published_date'),
+                'reliability_score': result.get('reliability_rating', 0.7),
+                'collection_date': datetime.utcnow().isoformat()
+            }
         
         try:
-            # البحث عن مقابلات مع كل مؤلف
-            for author in self.known_omani_authors[:5]:
-                interview_query = f'مقابلة مع "{author}" OR حوار مع "{author}" OR لقاء مع "{author}" site:omanobserver.om OR site:shabiba.com'
-                
-                results = await tavily_search_service.search_omani_literature_advanced(
-                    query=interview_query,
-                    max_results=2
-                )
-                
-                for result in results.get('results', []):
-                    if self._is_interview_content(result):
-                        interview = {
-                            'title': result.get('title', ''),
-                            'url': result.get('url', ''),
-                            'content': result.get('content', ''),
-                            'interviewee': author,
-                            'source_type': 'interview',
-                            'publication_date': result.get('published_date'),
-                            'reliability_score': result.get('reliability_rating', 0.7),
-                            'collection_date': datetime.utcnow().isoformat()
-                        }
-                        interviews.append(interview)
-                
-                await asyncio.sleep(2)
-            
+            return await self._crawl('interviews', tasks, to_interview, crawl_stats, force_refresh)
         except Exception as e:
             logger.error(f"خطأ في جمع المقابلات: {e}")
-        
-        return interviews
+            return []
     
-    async def _collect_literary_articles(self) -> List[Dict[str, Any]]:
+    async def _collect_literary_articles(self, crawl_stats: Dict[str, int], force_refresh: bool = False) -> List[Dict[str, Any]]:
         """جمع المقالات من المجلات الأدبية العربية"""
-        articles = []
+        # مواضيع أدبية عُمانية للبحث عنها
+        literary_topics = [
+            'الشعر العُماني المعاصر',
+            'الرواية في الأدب العُماني',
+            'النقد الأدبي العُماني',
+            'التراث الثقافي العُماني'
+        ]
+        tasks = [
+            (topic, f'"{topic}" مقال OR article مجلة أدبية OR literary journal', {'max_results': 3})
+            for topic in literary_topics
+        ]
+        
+        def to_article(result: Dict[str, Any], topic: str, _query: str) -> Optional[Dict[str, Any]]:
+            if not self._is_literary_article(result):
+                return None
+            return {
+                'title': result.get('title', ''),
+                'url': result.get('url', ''),
+                'content': result.get('content', ''),
+                'topic': topic,
+                'source_type': 'literary_article',
+                'reliability_score': result.get('reliability_rating', 0.6),
+                'collection_date': datetime.utcnow().isoformat()
+            }
         
         try:
-            # مواضيع أدبية عُمانية للبحث عنها
-            literary_topics = [
-                'الشعر العُماني المعاصر',
-                'الرواية في الأدب العُماني',
-                'النقد الأدبي العُماني',
-                'التراث الثقافي العُماني'
-            ]
-            
-            for topic in literary_topics:
-                article_query = f'"{topic}" مقال OR article مجلة أدبية OR literary journal'
-                
-                results = await tavily_search_service.search_omani_literature_advanced(
-                    query=article_query,
-                    max_results=3
-                )
-                
-                for result in results.get('results', []):
-                    if self._is_literary_article(result):
-                        article = {
-                            'title': result.get('title', ''),
-                            'url': result.get('url', ''),
-                            'content': result.get('content', ''),
-                            'topic': topic,
-                            'source_type': 'literary_article',
-                            'reliability_score': result.get('reliability_rating', 0.6),
-                            'collection_date': datetime.utcnow().isoformat()
-                        }
-                        articles.append(article)
-                
-                await asyncio.sleep(2)
-            
+            return await self._crawl('articles', tasks, to_article, crawl_stats, force_refresh)
         except Exception as e:
             logger.error(f"خطأ في جمع المقالات: {e}")
-        
-        return articles
+            return []
     
-    async def _collect_books_metadata(self) -> List[Dict[str, Any]]:
+    async def _collect_books_metadata(self, crawl_stats: Dict[str, int], force_refresh: bool = False) -> List[Dict[str, Any]]:
         """جمع معلومات الكتب والدواوين العُمانية"""
-        books = []
+        # البحث عن كتب ودواوين محددة
+        book_queries = [
+            'دواوين شعراء عُمان',
+            'روايات عُمانية منشورة', 
+            'كتب الأدب العُماني',
+            'مؤلفات الكتاب العُمانيين'
+        ]
+        tasks = [
+            (query, f'"{query}" كتاب OR book ديوان OR collection', {'max_results': 4})
+            for query in book_queries
+        ]
+        
+        def to_book(result: Dict[str, Any], query: str, _search_query: str) -> Optional[Dict[str, Any]]:
+            if not self._is_book_metadata(result):
+                return None
+            return {
+                'title': result.get('title', ''),
+                'url': result.get('url', ''),
+                'description': result.get('content', ''),
+                'search_category': query,
+                'source_type': 'book_metadata',
+                'reliability_score': result.get('reliability_rating', 0.5),
+                'collection_date': datetime.utcnow().isoformat()
+            }
         
         try:
-            # البحث عن كتب ودواوين محددة
-            book_queries = [
-                'دواوين شعراء عُمان',
-                'روايات عُمانية منشورة', 
-                'كتب الأدب العُماني',
-                'مؤلفات الكتاب العُمانيين'
-            ]
-            
-            for query in book_queries:
-                search_query = f'"{query}" كتاب OR book ديوان OR collection'
-                
-                results = await tavily_search_service.search_omani_literature_advanced(
-                    query=search_query,
-                    max_results=4
-                )
-                
-                for result in results.get('results', []):
-                    if self._is_book_metadata(result):
-                        book = {
-                            'title': result.get('title', ''),
-                            'url': result.get('url', ''),
-                            'description': result.get('content', ''),
-                            'search_category': query,
-                            'source_type': 'book_metadata',
-                            'reliability_score': result.get('reliability_rating', 0.5),
-                            'collection_date': datetime.utcnow().isoformat()
-                        }
-                        books.append(book)
-                
-                await asyncio.sleep(2)
-            
+            return await self._crawl('books_metadata', tasks, to_book, crawl_stats, force_refresh)
         except Exception as e:
             logger.error(f"خطأ في جمع معلومات الكتب: {e}")
-        
-        return books
+            return []
     
     def _is_academic_content(self, result: Dict[str, Any]) -> bool:
         """فحص إذا كان المحتوى أكاديمياً"""
@@ -296,5 +373,4 @@ class AcademicSourceCollector:
         
         return any(indicator in content + title for indicator in book_indicators)
 
-# إنشاء مثيل جامع المصادر الأكاديمية
-academic_collector = AcademicSourceCollector()
\ No newline at end of file
+# المثيل يُنشأ عند أول استخدام عبر service_registry.get('academic_collector')
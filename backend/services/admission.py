@@ -0,0 +1,231 @@
+import os
+import asyncio
+import hmac
+import heapq
+import itertools
+import math
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+import logging
+
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+admission_in_flight = metrics.gauge('admission_in_flight', 'Chat requests holding an admission slot')
+admission_queue_depth = metrics.gauge('admission_queue_depth', 'Chat requests waiting for an admission slot')
+admission_shed = metrics.counter('admission_shed_total', 'Chat requests rejected by admission control', ('reason',))
+admission_queue_wait = metrics.histogram(
+    'admission_queue_wait_seconds', 'Time spent waiting for an admission slot',
+    export_buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0)
+)
+
+# أولويات الطلبات: الأصغر يُخدم أولاً
+PRIORITIES = {'high': 0, 'normal': 1, 'low': 2}
+
+class AdmissionRejected(Exception):
+    """رفض الطلب فوراً بدلاً من تركه ينتظر حتى تتتابع المهلات"""
+
+    def __init__(self, status_code: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status_code = status_code
+        self.reason = reason
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """دلو رموز: سعة للدفعات المفاجئة ومعدل ثابت لإعادة الملء"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, amount: float = 1.0) -> float:
+        """0 عند النجاح، وإلا عدد الثواني حتى تتوفر الرموز"""
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        return (amount - self.tokens) / self.rate if self.rate > 0 else math.inf
+
+class AdmissionController:
+    """التحكم في قبول طلبات المحادثة: حد للطلبات المتزامنة لكل عامل، وطابور أولويات قصير،
+    ورفض سريع (429/503 مع Retry-After) عندما يتجاوز الانتظار المتوقع هدف زمن الاستجابة"""
+
+    def __init__(self):
+        self.enabled = os.environ.get('ADMISSION_ENABLED', 'true').lower() == 'true'
+        self.max_in_flight = int(os.environ.get('ADMISSION_MAX_IN_FLIGHT', '16'))
+        self.max_queue = int(os.environ.get('ADMISSION_MAX_QUEUE', '32'))
+        self.queue_slo = float(os.environ.get('ADMISSION_QUEUE_SLO_SECONDS', '2.0'))
+        # الأولوية العالية للمستدعين الموثوقين فقط (مفتاح مشترك في الترويسة X-Priority-Token)
+        self.high_priority_token = os.environ.get('ADMISSION_HIGH_PRIORITY_TOKEN', '')
+
+        # حد المعدل لكل جلسة: رسائل في الدقيقة مع سعة للدفعات
+        self.session_rate = float(os.environ.get('SESSION_RATE_PER_MINUTE', '12')) / 60.0
+        self.session_burst = float(os.environ.get('SESSION_RATE_BURST', '4'))
+        self.max_sessions = int(os.environ.get('SESSION_RATE_MAX_TRACKED', '10000'))
+
+        self.in_flight = 0
+        self._waiters: List[Any] = []
+        self._sequence = itertools.count()
+        self._buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+        # متوسط أُسّي لزمن خدمة الطلب لتقدير زمن الانتظار في الطابور
+        self.avg_service_time = float(os.environ.get('ADMISSION_INITIAL_SERVICE_TIME', '3.0'))
+        self.stats = {'admitted': 0, 'queued': 0, 'rate_limited': 0, 'queue_full': 0, 'slo': 0, 'deadline': 0}
+
+    def resolve_priority(self, requested: Optional[str], token: Optional[str] = None) -> str:
+        """التحقق من فئة الأولوية المطلوبة؛ 'high' تُمنح للمستدعين الموثوقين فقط وإلا تُخفض إلى 'normal'"""
+        priority = (requested or 'normal').strip().lower()
+        if priority not in PRIORITIES:
+            raise ValueError(f"أولوية غير معروفة: {requested}")
+        if priority == 'high':
+            trusted = bool(self.high_priority_token) and bool(token) and hmac.compare_digest(token, self.high_priority_token)
+            if not trusted:
+                return 'normal'
+        return priority
+
+    @staticmethod
+    def parse_timeout(raw: Optional[str]) -> Optional[float]:
+        """قراءة مهلة العميل من الترويسة؛ يُرفض ما ليس رقماً موجباً منتهياً"""
+        if raw is None or not raw.strip():
+            return None
+        try:
+            timeout = float(raw)
+        except ValueError:
+            raise ValueError(f"مهلة غير صالحة: {raw}")
+        if not math.isfinite(timeout) or timeout <= 0:
+            raise ValueError(f"مهلة غير صالحة: {raw}")
+        return timeout
+
+    def check_rate_limit(self, session_id: Optional[str]):
+        """حد المعدل لكل جلسة؛ الطلبات بلا جلسة تُحد بالطابور فقط"""
+        if not self.enabled or not session_id:
+            return
+
+        bucket = self._buckets.get(session_id)
+        if bucket is None:
+            bucket = self._buckets[session_id] = TokenBucket(self.session_rate, self.session_burst)
+            if len(self._buckets) > self.max_sessions:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(session_id)
+
+        wait = bucket.try_acquire()
+        if wait > 0:
+            self._shed('rate_limited')
+            raise AdmissionRejected(429, 'rate_limited', wait)
+
+    def estimated_wait(self, position: int) -> float:
+        """الانتظار المتوقع لطلب في موقع معين من الطابور"""
+        return (position + 1) * self.avg_service_time / max(1, self.max_in_flight)
+
+    @asynccontextmanager
+    async def admit(self, priority: str = 'normal', timeout: Optional[float] = None):
+        """حجز مقعد تنفيذ أو الانتظار في الطابور حتى المهلة، أو الرفض الفوري"""
+        if not self.enabled:
+            yield
+            return
+
+        if self.in_flight < self.max_in_flight and not self._waiters:
+            self._acquire()
+        else:
+            await self._wait_in_queue(PRIORITIES.get(priority, PRIORITIES['normal']), timeout)
+
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.avg_service_time = 0.9 * self.avg_service_time + 0.1 * (time.perf_counter() - started)
+            self._release()
+
+    async def _wait_in_queue(self, priority: int, timeout: Optional[float]):
+        if len(self._waiters) >= self.max_queue:
+            self._shed('queue_full')
+            raise AdmissionRejected(503, 'queue_full', self.estimated_wait(len(self._waiters)))
+
+        budget = min(self.queue_slo, timeout) if timeout else self.queue_slo
+        position = sum(1 for waiter in self._waiters if waiter[0] <= priority)
+        expected = self.estimated_wait(position)
+        if expected > budget:
+            self._shed('slo')
+            raise AdmissionRejected(503, 'slo', expected)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._sequence), future]
+        heapq.heappush(self._waiters, entry)
+        self.stats['queued'] += 1
+        admission_queue_depth.set(len(self._waiters))
+
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=budget)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # المقعد مُنح في نفس لحظة انتهاء المهلة
+                pass
+            else:
+                self._remove(entry)
+                self._shed('deadline')
+                raise AdmissionRejected(503, 'deadline', self.estimated_wait(len(self._waiters)))
+        except asyncio.CancelledError:
+            # العميل قطع الاتصال: إعادة المقعد إن كان قد مُنح
+            if future.done() and not future.cancelled():
+                self._release()
+            else:
+                self._remove(entry)
+            raise
+        finally:
+            admission_queue_wait.observe(time.perf_counter() - started)
+
+    def _remove(self, entry):
+        entry[2].cancel()
+        if entry in self._waiters:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+        admission_queue_depth.set(len(self._waiters))
+
+    def _acquire(self):
+        self.in_flight += 1
+        self.stats['admitted'] += 1
+        admission_in_flight.set(self.in_flight)
+
+    def _release(self):
+        self.in_flight -= 1
+        # تسليم المقعد مباشرة لأعلى طلب أولوية في الطابور
+        while self._waiters and self.in_flight < self.max_in_flight:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self._acquire()
+                future.set_result(True)
+        admission_in_flight.set(self.in_flight)
+        admission_queue_depth.set(len(self._waiters))
+
+    def _shed(self, reason: str):
+        self.stats[reason] += 1
+        admission_shed.inc(reason=reason)
+        logger.warning(f"رفض طلب محادثة ({reason}): {self.in_flight} قيد التنفيذ و{len(self._waiters)} في الطابور")
+
+    def get_admission_stats(self) -> Dict[str, Any]:
+        """الحمل الحالي وعدادات القبول والرفض"""
+        return {
+            'enabled': self.enabled,
+            'in_flight': self.in_flight,
+            'max_in_flight': self.max_in_flight,
+            'queue_depth': len(self._waiters),
+            'max_queue': self.max_queue,
+            'queue_slo_seconds': self.queue_slo,
+            'avg_service_time_seconds': round(self.avg_service_time, 3),
+            'tracked_sessions': len(self._buckets),
+            **self.stats
+        }
+
+# مثيل واحد لكل عامل (الحدود لكل عامل)
+admission_controller = AdmissionController()
@@ -0,0 +1,42 @@
+import re
+from typing import List
+
+# التشكيل وعلامات القرآن والتطويل: لا تغير الكلمة في البحث
+_DIACRITICS = re.compile(r'[\u0610-\u061A\u064B-\u065F\u0670\u06D6-\u06ED\u0640]')
+_LETTER_FORMS = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ئ': 'ي', 'ؤ': 'و', 'ة': 'ه'
+})
+_WORD = re.compile(r'\w+')
+
+# سوابق التعريف والعطف والجر الملتصقة بالكلمة (الأطول أولاً)
+_PREFIXES = ('وال', 'بال', 'كال', 'فال', 'لل', 'ال')
+
+STOP_WORDS = frozenset({
+    'من', 'في', 'عن', 'علي', 'الي', 'ما', 'ماذا', 'هو', 'هي', 'هل', 'كيف', 'لماذا', 'اين', 'متي',
+    'او', 'ثم', 'التي', 'الذي', 'الذين', 'هذا', 'هذه', 'ذلك', 'تلك', 'كان', 'كانت', 'مع', 'عند',
+    'اريد', 'اعطني', 'اخبرني', 'قل', 'لي', 'عليه', 'فيه', 'به', 'اهم', 'بعض', 'كل', 'وما', 'ومن',
+    'the', 'and', 'of', 'in', 'on', 'about', 'what', 'who', 'is'
+})
+
+def normalize_arabic(text: str) -> str:
+    """توحيد النص للمطابقة: أحرف صغيرة، بلا تشكيل أو تطويل، وتوحيد صور الألف والياء والتاء المربوطة"""
+    return _DIACRITICS.sub('', (text or '').lower()).translate(_LETTER_FORMS)
+
+def light_stem(token: str) -> str:
+    """حذف سابقة التعريف أو العطف إن بقي بعدها جذر كافٍ (الشعر، والشعر ← شعر)"""
+    for prefix in _PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 3:
+            return token[len(prefix):]
+    return token
+
+def search_terms(text: str) -> List[str]:
+    """مصطلحات البحث الفريدة من النص بترتيب ظهورها، بعد التوحيد والتجذيع وحذف كلمات التوقف"""
+    terms = []
+    for word in _WORD.findall(normalize_arabic(text)):
+        if len(word) < 2 or word in STOP_WORDS:
+            continue
+        term = light_stem(word)
+        if term not in STOP_WORDS:
+            terms.append(term)
+    return list(dict.fromkeys(terms))
@@ -7,6 +7,12 @@ import uuid
 
 load_dotenv()
 
+from services.hedging_service import hedged_executor
+from services.resilience import provider_resilience
+from services.usage_service import usage_tracker
+from services.tracing import tracer
+from services.provider_cassettes import provider_cassettes
+
 logger = logging.getLogger(__name__)
 
 class ClaudeDirectService:
@@ -14,10 +20,12 @@ class ClaudeDirectService:
     
     def __init__(self):
         self.api_key = os.environ.get('ANTHROPIC_API_KEY')
-        if not self.api_key:
+        if not self.api_key and not provider_cassettes.replaying:
             raise ValueError("ANTHROPIC_API_KEY not found")
         
-        self.client = anthropic.Anthropic(api_key=self.api_key)
+        # عميل غير متزامن حتى لا يحجب حلقة الأحداث ويمكن إلغاء الطلب الخاسر عند التحوط
+        self.client = anthropic.AsyncAnthropic(api_key=self.api_key or 'replay')
+        self.model = "claude-3-5-sonnet-20241022"
         
         # رسالة نظام متخصصة للتحليل الأدبي العُماني - مفكر إبداعي
         self.system_message = """أنت غسان، المفكر الأدبي العُماني الإبداعي والناقد المبدع.
@@ -75,18 +83,38 @@ class ClaudeDirectService:
 - طبق النظريات النقدية المناسبة
 """
 
-            # إرسال للـ Claude
-            response = self.client.messages.create(
-                model="claude-3-5-sonnet-20241022",
-                max_tokens=4000,
-                temperature=0.3,  # دقة أعلى، إبداع أقل
-                system=self.system_message,
-                messages=[
-                    {
-                        "role": "user", 
-                        "content": full_message
-                    }
-                ]
+            # إرسال للـ Claude مع طلب احتياطي إذا تأخر الرد عن المهلة التكيفية
+            async def send(stage: str = 'literary_analysis'):
+                request = dict(
+                    model=self.model,
+                    max_tokens=4000,
+                    temperature=0.3,  # دقة أعلى، إبداع أقل
+                    system=self.system_message,
+                    messages=[
+                        {
+                            "role": "user", 
+                            "content": full_message
+                        }
+                    ]
+                )
+                with tracer.span('llm.anthropic', model=self.model, stage=stage):
+                    response = await provider_resilience.call('anthropic', lambda: provider_cassettes.call(
+                        'anthropic', request,
+                        lambda: self.client.messages.create(**request),
+                        encode=lambda message: message.model_dump(mode='json'),
+                        decode=anthropic.types.Message.model_validate
+                    ))
+                # الطلب الاحتياطي يُسجل بمرحلة مستقلة ليظهر في تقارير التكلفة
+                usage_tracker.record(
+                    'anthropic', self.model,
+                    prompt_tokens=response.usage.input_tokens,
+                    completion_tokens=response.usage.output_tokens,
+                    stage=stage
+                )
+                return response
+            
+            response = await hedged_executor.execute(
+                f"anthropic:{self.model}", send, lambda: send('literary_analysis:hedge')
             )
             
             return {
@@ -106,5 +134,4 @@ class ClaudeDirectService:
                 'error': str(e)
             }
 
-# مثيل خدمة Claude المباشرة
-claude_direct_service = ClaudeDirectService()
\ No newline at end of file
+# المثيل يُنشأ عند أول استخدام عبر service_registry.get('claude_direct')
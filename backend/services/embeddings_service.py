@@ -6,9 +6,15 @@ from motor.motor_asyncio import AsyncIOMotorCollection
 import logging
 from datetime import datetime
 import json
-from sklearn.metrics.pairwise import cosine_similarity
+import base64
+import asyncio
 
 from models.literature_models import EmbeddingRecord, Author, LiteraryWork, AcademicSource
+from services.resilience import provider_resilience
+from services.usage_service import usage_tracker
+from services.tracing import tracer
+from services.provider_cassettes import provider_cassettes
+from services.shared_cache import shared_cache
 
 logger = logging.getLogger(__name__)
 
@@ -24,6 +30,8 @@ class EmbeddingsService:
         
         # إعداد OpenAI
         self.openai_api_key = os.environ.get('EMERGENT_LLM_KEY')
+        if not self.openai_api_key and provider_cassettes.replaying:
+            self.openai_api_key = 'replay'
         if self.openai_api_key:
             openai.api_key = self.openai_api_key
         
@@ -142,14 +150,15 @@ class EmbeddingsService:
             embeddings_cursor = self.embeddings_collection.find(filter_criteria)
             embeddings_list = await embeddings_cursor.to_list(length=None)
             
-            # حساب التشابه
+            # حساب التشابه لكل التضمينات دفعة واحدة في خيط منفصل
+            scores = await asyncio.to_thread(
+                self._batch_similarity,
+                query_embedding,
+                [embedding_record['embedding_vector'] for embedding_record in embeddings_list]
+            )
+            
             similarities = []
-            for embedding_record in embeddings_list:
-                similarity = self._calculate_similarity(
-                    query_embedding,
-                    embedding_record['embedding_vector']
-                )
-                
+            for embedding_record, similarity in zip(embeddings_list, scores):
                 similarities.append({
                     'content_id': embedding_record['content_id'],
                     'content_type': embedding_record['content_type'],
@@ -168,6 +177,19 @@ class EmbeddingsService:
             logger.error(f"خطأ في البحث الدلالي: {e}")
             return []
     
+    def _embedding_cache_key(self, text: str) -> Tuple[str, str]:
+        # تنظيف النص
+        cleaned_text = text.strip().replace('\n', ' ')[:8000]  # حد أقصى
+        
+        # التضمين حتمي لنفس النص والنموذج، فيُشارك بين جميع العمال
+        return cleaned_text, shared_cache.make_key(self.embedding_model, 'float32', cleaned_text)
+    
+    async def cached_embedding(self, text: str) -> Optional[List[float]]:
+        """التضمين المخزن مسبقاً فقط، دون أي استدعاء للمزود (لمسارات المحادثة)"""
+        _, cache_key = self._embedding_cache_key(text)
+        cached_vector = await shared_cache.get('embeddings', cache_key)
+        return self._unpack_vector(cached_vector) if cached_vector is not None else None
+    
     async def _generate_embedding(self, text: str) -> Optional[List[float]]:
         """إنشاء تضمين متجه للنص باستخدام OpenAI"""
         try:
@@ -175,37 +197,67 @@ class EmbeddingsService:
                 logger.warning("OpenAI API key not available for embeddings")
                 return None
             
-            # تنظيف النص
-            cleaned_text = text.strip().replace('\n', ' ')[:8000]  # حد أقصى
+            cleaned_text, cache_key = self._embedding_cache_key(text)
+            cached_vector = await shared_cache.get('embeddings', cache_key)
+            if cached_vector is not None:
+                return self._unpack_vector(cached_vector)
             
             # إنشاء التضمين
-            response = await openai.Embedding.acreate(
-                input=cleaned_text,
-                model=self.embedding_model
+            with tracer.span('embeddings.create', model=self.embedding_model, chars=len(cleaned_text)):
+                request = {'input': cleaned_text, 'model': self.embedding_model}
+                response = await provider_resilience.call('openai', lambda: provider_cassettes.call(
+                    'openai_embeddings', request,
+                    lambda: openai.Embedding.acreate(**request),
+                    encode=lambda result: json.loads(json.dumps(result))
+                ))
+            
+            usage = response.get('usage') or {}
+            usage_tracker.record(
+                'openai', self.embedding_model,
+                prompt_tokens=usage.get('prompt_tokens') or usage_tracker.estimate_tokens(cleaned_text),
+                completion_tokens=0,
+                stage='embedding',
+                estimated='prompt_tokens' not in usage
             )
             
             embedding_vector = response['data'][0]['embedding']
+            await shared_cache.set('embeddings', cache_key, self._pack_vector(embedding_vector))
             return embedding_vector
             
         except Exception as e:
             logger.error(f"خطأ في إنشاء التضمين: {e}")
             return None
     
+    @staticmethod
+    def _pack_vector(vector: List[float]) -> str:
+        """ترميز المتجه float32 بصيغة base64 للتخزين المشترك (≈ ربع حجم JSON العشري)"""
+        return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode('ascii')
+    
+    @staticmethod
+    def _unpack_vector(packed: str) -> List[float]:
+        return np.frombuffer(base64.b64decode(packed), dtype=np.float32).tolist()
+    
     def _calculate_similarity(self, vec1: List[float], vec2: List[float]) -> float:
         """حساب التشابه الكوسيني بين متجهين"""
         try:
-            # تحويل إلى numpy arrays
-            arr1 = np.array(vec1).reshape(1, -1)
-            arr2 = np.array(vec2).reshape(1, -1)
-            
-            # حساب التشابه الكوسيني
-            similarity = cosine_similarity(arr1, arr2)[0][0]
-            return float(similarity)
+            return self._batch_similarity(vec1, [vec2])[0]
             
         except Exception as e:
             logger.error(f"خطأ في حساب التشابه: {e}")
             return 0.0
     
+    @staticmethod
+    def _batch_similarity(query_vector: List[float], vectors: List[List[float]]) -> List[float]:
+        """التشابه الكوسيني بين متجه الاستعلام وكل المتجهات بعملية مصفوفات واحدة"""
+        if not vectors:
+            return []
+        
+        query = np.asarray(query_vector, dtype=np.float32)
+        matrix = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1) * np.linalg.norm(query)
+        scores = np.divide(matrix @ query, norms, out=np.zeros(len(vectors), dtype=np.float32), where=norms > 0)
+        return scores.astype(float).tolist()
+    
     async def get_embeddings_stats(self) -> Dict[str, Any]:
         """إحصائيات التضمينات المتجهة"""
         try:
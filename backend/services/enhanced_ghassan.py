@@ -3,8 +3,7 @@ import logging
 from datetime import datetime
 
 from services.rag_service import AdvancedRAGService
-from services.claude_service import claude_direct_service
-from services.llm_service import ghassan_llm_service
+from services.registry import service_registry
 
 logger = logging.getLogger(__name__)
 
@@ -157,7 +156,7 @@ class EnhancedGhassanService:
         قدم تحليلاً أدبياً أو نحوياً متخصصاً وعميقاً.
         """
         
-        return await claude_direct_service.analyze_literary_text(
+        return await (await service_registry.aget('claude_direct')).analyze_literary_text(
             user_message=query,
             search_context=enhanced_context,
             session_id=session_id
@@ -188,7 +187,7 @@ class EnhancedGhassanService:
         {strategy_instructions}
         """
         
-        return await ghassan_llm_service.generate_response_with_search(
+        return await (await service_registry.aget('ghassan_llm')).generate_response_with_search(
             user_message=query,
             search_results=[],  # السياق مُجمع مسبقاً
             session_id=session_id,
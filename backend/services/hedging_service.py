@@ -0,0 +1,135 @@
+import os
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class HedgedRequestExecutor:
+    """تنفيذ طلبات احتياطية (hedging) لتقليص ذيل زمن استجابة مزودي النماذج"""
+
+    def __init__(self):
+        self.enabled = os.environ.get('HEDGING_ENABLED', 'true').lower() == 'true'
+
+        # موعد إطلاق الطلب الاحتياطي = مئين زمن الاستجابة الأخير لكل مزود
+        self.percentile = float(os.environ.get('HEDGE_PERCENTILE', '0.95'))
+        self.min_samples = int(os.environ.get('HEDGE_MIN_SAMPLES', '20'))
+        self.default_delay_ms = float(os.environ.get('HEDGE_DEFAULT_DELAY_MS', '8000'))
+        self.min_delay_ms = float(os.environ.get('HEDGE_MIN_DELAY_MS', '500'))
+
+        # ميزانية عامة: كل طلب أساسي يكسب جزءاً من طلب احتياطي (5% افتراضياً)
+        self.budget_ratio = float(os.environ.get('HEDGE_BUDGET_RATIO', '0.05'))
+        self.max_budget = float(os.environ.get('HEDGE_MAX_BURST', '3'))
+        self._budget = self.max_budget
+
+        self.latencies: Dict[str, deque] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+    def hedge_delay(self, key: str) -> float:
+        """حساب مهلة إطلاق الطلب الاحتياطي بالثواني من توزيع زمن الاستجابة"""
+        samples = self.latencies.get(key)
+        if not samples or len(samples) < self.min_samples:
+            return self.default_delay_ms / 1000
+
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile))
+        return max(self.min_delay_ms, ordered[index]) / 1000
+
+    async def execute(
+        self,
+        key: str,
+        primary: Callable[[], Awaitable[Any]],
+        backup: Optional[Callable[[], Awaitable[Any]]] = None
+    ) -> Any:
+        """تنفيذ الطلب الأساسي، وإطلاق طلب احتياطي إذا تأخر، وإلغاء الطلب الخاسر"""
+        stats = self.stats.setdefault(key, {
+            'primary_calls': 0, 'hedges_fired': 0, 'hedge_wins': 0, 'budget_denied': 0
+        })
+        stats['primary_calls'] += 1
+        self._earn_budget()
+
+        if not self.enabled:
+            return await self._timed(key, primary)
+
+        started = time.perf_counter()
+        primary_task = asyncio.ensure_future(primary())
+        tasks = {primary_task: 'primary'}
+
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=self.hedge_delay(key))
+            if done:
+                return self._record(key, started, primary_task.result())
+
+            if not self._try_consume_budget():
+                stats['budget_denied'] += 1
+                return self._record(key, started, await primary_task)
+
+            stats['hedges_fired'] += 1
+            logger.info(f"إطلاق طلب احتياطي لـ {key} بعد {self.hedge_delay(key):.1f} ثانية")
+            backup_task = asyncio.ensure_future((backup or primary)())
+            tasks[backup_task] = 'backup'
+
+            pending = set(tasks)
+            first_error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if tasks[task] == 'backup':
+                            stats['hedge_wins'] += 1
+                        return self._record(key, started, task.result())
+                    first_error = first_error or task.exception()
+
+            raise first_error
+
+        finally:
+            # إلغاء الطلب الخاسر (أو كلا الطلبين عند إلغاء الطلب الخارجي)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _timed(self, key: str, call: Callable[[], Awaitable[Any]]) -> Any:
+        """تنفيذ طلب بلا تحوط مع تسجيل زمنه"""
+        started = time.perf_counter()
+        return self._record(key, started, await call())
+
+    def _record(self, key: str, started: float, result: Any) -> Any:
+        """تسجيل زمن الاستجابة لتحديث المهلة التكيفية"""
+        samples = self.latencies.setdefault(key, deque(maxlen=200))
+        samples.append((time.perf_counter() - started) * 1000)
+        return result
+
+    def _earn_budget(self):
+        """كل طلب أساسي يضيف جزءاً من طلب احتياطي إلى الميزانية"""
+        self._budget = min(self.max_budget, self._budget + self.budget_ratio)
+
+    def _try_consume_budget(self) -> bool:
+        """استهلاك طلب احتياطي واحد من الميزانية إن توفر"""
+        if self._budget >= 1.0:
+            self._budget -= 1.0
+            return True
+        return False
+
+    def get_hedging_stats(self) -> Dict[str, Any]:
+        """إحصائيات التحوط لكل مزود"""
+        providers = {}
+        for key, stats in self.stats.items():
+            calls = stats['primary_calls']
+            providers[key] = {
+                **stats,
+                'hedge_rate': round(stats['hedges_fired'] / calls, 3) if calls else 0.0,
+                'current_delay_ms': round(self.hedge_delay(key) * 1000, 1)
+            }
+
+        return {
+            'enabled': self.enabled,
+            'percentile': self.percentile,
+            'budget_ratio': self.budget_ratio,
+            'available_budget': round(self._budget, 2),
+            'providers': providers
+        }
+
+# مثيل واحد مشترك لجميع مزودي النماذج
+hedged_executor = HedgedRequestExecutor()
@@ -0,0 +1,355 @@
+import os
+import asyncio
+import json
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import logging
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from services.metrics import metrics
+from services.provider_scheduler import provider_scheduler
+
+logger = logging.getLogger(__name__)
+
+jobs_finished = metrics.counter('jobs_finished_total', 'Background jobs that reached a final state', ('job_type', 'status'))
+jobs_running = metrics.gauge('jobs_running', 'Background jobs running on this worker', ('job_type',))
+job_duration_seconds = metrics.histogram(
+    'job_duration_seconds', 'Background job attempt duration', ('job_type',),
+    export_buckets=(1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+)
+
+ACTIVE_STATUSES = ('queued', 'running')
+FINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+# المعالج يستقبل معاملات المهمة ودالة للإبلاغ عن التقدم، ويعيد نتيجة تُحفظ مع المهمة
+JobHandler = Callable[[Dict[str, Any], Callable[[Dict[str, Any]], Awaitable[None]]], Awaitable[Any]]
+
+class JobType:
+    def __init__(self, handler: JobHandler, max_concurrency: int, max_attempts: int):
+        self.handler = handler
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+
+class JobQueue:
+    """طابور مهام دائم في MongoDB لأعمال الجمع والاستخراج الطويلة
+
+    الطلب ينشئ المهمة ويعيد معرفها فوراً، وحلقة في كل عامل تحجز المهام المنتظرة ذرياً
+    (find_one_and_update) وتنفذها في الخلفية ضمن حصة الدفعات. المهمة الجارية تجدد نبضها
+    دورياً، فإن توقف عاملها أعيدت للطابور بعد انتهاء المهلة بدلاً من أن تضيع.
+
+    سقف التزامن لكل نوع يُفرض بمستندات خانات (job_slots): خانة لكل مهمة متزامنة مسموحة،
+    تُحجز ذرياً قبل حجز المهمة وتُحرر عند انتهائها، وتنتهي مهلتها مع نبض المهمة.
+    """
+
+    def __init__(self):
+        self.enabled = os.environ.get('JOB_QUEUE_ENABLED', 'true').lower() == 'true'
+        self.poll_interval = float(os.environ.get('JOB_POLL_INTERVAL', '2.0'))
+        # مهمة لم يتجدد نبضها خلال هذه المدة يُعتبر عاملها متوقفاً
+        self.lease_seconds = float(os.environ.get('JOB_LEASE_SECONDS', '120'))
+        self.retry_backoff = float(os.environ.get('JOB_RETRY_BACKOFF_SECONDS', '30'))
+        self.retention_days = int(os.environ.get('JOB_RETENTION_DAYS', '7'))
+        self.worker_id = f'{os.getpid()}-{uuid.uuid4().hex[:8]}'
+
+        self.collection = None
+        self.slots = None
+        self._types: Dict[str, JobType] = {}
+        self._running: Dict[str, asyncio.Task] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._stopping = False
+
+    def attach_db(self, db):
+        self.collection = db.jobs
+        self.slots = db.job_slots
+
+    async def ensure_indexes(self):
+        """المعرف، وحجز المنتظر حسب النوع، والمهام المتوقفة، وحذف المنتهية بعد مدة الاحتفاظ"""
+        if self.collection is None:
+            return
+        await self.collection.create_index('job_id', unique=True)
+        await self.collection.create_index([('status', 1), ('job_type', 1), ('run_after', 1)])
+        await self.collection.create_index([('status', 1), ('heartbeat_at', 1)])
+        await self.collection.create_index('finished_at', expireAfterSeconds=self.retention_days * 86400)
+        # مهمة نشطة واحدة لكل (نوع، معاملات): المفتاح موجود فقط ما دامت المهمة منتظرة أو جارية
+        await self.collection.create_index(
+            'dedupe_key', unique=True, partialFilterExpression={'dedupe_key': {'$exists': True}}
+        )
+        await self.slots.create_index([('job_type', 1), ('index', 1)])
+        await self._ensure_slots()
+
+    async def _ensure_slots(self):
+        """خانة لكل مهمة متزامنة مسموحة من كل نوع (تُنشأ مرة واحدة، ولا تُمس إن وُجدت)"""
+        for name, job_type in self._types.items():
+            for index in range(job_type.max_concurrency):
+                await self.slots.update_one(
+                    {'_id': f'{name}:{index}'},
+                    {'$setOnInsert': {'job_type': name, 'index': index, 'job_id': None, 'heartbeat_at': None}},
+                    upsert=True
+                )
+
+    def register(self, job_type: str, handler: JobHandler, max_concurrency: int = 1, max_attempts: int = 3):
+        """تسجيل نوع مهمة؛ السقف يمكن تعديله بـ JOB_<TYPE>_CONCURRENCY"""
+        max_concurrency = int(os.environ.get(f'JOB_{job_type.upper()}_CONCURRENCY', str(max_concurrency)))
+        self._types[job_type] = JobType(handler, max_concurrency, max_attempts)
+
+    def start(self):
+        if self.enabled and self._task is None and self.collection is not None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._poll_loop())
+
+    async def stop(self):
+        """إيقاف الحلقة وإعادة المهام الجارية هنا للطابور ليكملها عامل آخر"""
+        self._stopping = True
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for task in list(self._running.values()):
+            task.cancel()
+        if self._running:
+            await asyncio.gather(*self._running.values(), return_exceptions=True)
+
+    async def submit(self, job_type: str, params: Optional[Dict[str, Any]] = None, unique: bool = True) -> Dict[str, Any]:
+        """إنشاء مهمة وإعادتها فوراً؛ unique يعيد المهمة النشطة المطابقة بدلاً من تكرار العمل"""
+        if job_type not in self._types:
+            raise ValueError(f"نوع مهمة غير معروف: {job_type}")
+        params = params or {}
+        dedupe_key = f'{job_type}:{json.dumps(params, sort_keys=True, ensure_ascii=False)}' if unique else None
+
+        # الفهرس الفريد الجزئي يحسم تزامن طلبين متطابقين؛ المحاولة الثانية لمهمة انتهت بينهما
+        for _ in range(2):
+            job = self._new_job(job_type, params, dedupe_key)
+            try:
+                await self.collection.insert_one(dict(job))
+            except DuplicateKeyError:
+                existing = await self.collection.find_one({'dedupe_key': dedupe_key}, {'_id': 0})
+                if existing:
+                    return existing
+                continue
+            self._wake.set()
+            return job
+        raise RuntimeError(f"تعذر إنشاء المهمة: {job_type}")
+
+    def _new_job(self, job_type: str, params: Dict[str, Any], dedupe_key: Optional[str]) -> Dict[str, Any]:
+        now = datetime.utcnow()
+        job = {
+            'job_id': str(uuid.uuid4()),
+            'job_type': job_type,
+            'params': params,
+            'status': 'queued',
+            'attempts': 0,
+            'max_attempts': self._types[job_type].max_attempts,
+            'progress': {},
+            'result': None,
+            'error': None,
+            'cancel_requested': False,
+            'created_at': now,
+            'run_after': now,
+            'started_at': None,
+            'heartbeat_at': None,
+            'finished_at': None,
+            'worker_id': None
+        }
+        if dedupe_key is not None:
+            job['dedupe_key'] = dedupe_key
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await self.collection.find_one({'job_id': job_id}, {'_id': 0})
+
+    async def list_jobs(self, job_type: Optional[str] = None, status: Optional[str] = None, limit: int = 20) -> List[Dict[str, Any]]:
+        query = {key: value for key, value in (('job_type', job_type), ('status', status)) if value}
+        cursor = self.collection.find(query, {'_id': 0, 'result': 0}).sort('created_at', -1).limit(limit)
+        return await cursor.to_list(limit)
+
+    async def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """المنتظرة تُلغى فوراً، والجارية يُطلب إيقافها فيلتقط عاملها الطلب في الدورة التالية"""
+        now = datetime.utcnow()
+        job = await self.collection.find_one_and_update(
+            {'job_id': job_id, 'status': 'queued'},
+            {'$set': {'status': 'cancelled', 'finished_at': now}, '$unset': {'dedupe_key': ''}},
+            projection={'_id': 0}, return_document=ReturnDocument.AFTER
+        )
+        if job:
+            jobs_finished.inc(job_type=job['job_type'], status='cancelled')
+            return job
+        job = await self.collection.find_one_and_update(
+            {'job_id': job_id, 'status': 'running'},
+            {'$set': {'cancel_requested': True}},
+            projection={'_id': 0}, return_document=ReturnDocument.AFTER
+        )
+        if job and job_id in self._running:
+            self._running[job_id].cancel()
+        return job or await self.get(job_id)
+
+    async def get_queue_stats(self) -> Dict[str, Any]:
+        """عدد المهام حسب النوع والحالة، وما يجري على هذا العامل"""
+        counts: Dict[str, Dict[str, int]] = {}
+        async for row in self.collection.aggregate([
+            {'$group': {'_id': {'job_type': '$job_type', 'status': '$status'}, 'count': {'$sum': 1}}}
+        ]):
+            counts.setdefault(row['_id']['job_type'], {})[row['_id']['status']] = row['count']
+        return {
+            'enabled': self.enabled,
+            'worker_id': self.worker_id,
+            'running_here': len(self._running),
+            'job_types': {
+                name: {'max_concurrency': job_type.max_concurrency, 'max_attempts': job_type.max_attempts, **counts.get(name, {})}
+                for name, job_type in self._types.items()
+            }
+        }
+
+    async def _poll_loop(self):
+        try:
+            await self._ensure_slots()
+        except Exception as e:
+            logger.error(f"خطأ في إنشاء خانات طابور المهام: {e}")
+        while True:
+            try:
+                await self._heartbeat()
+                await self._recover_stale()
+                await self._claim_available()
+            except Exception as e:
+                logger.error(f"خطأ في حلقة طابور المهام: {e}")
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _heartbeat(self):
+        """تجديد نبض المهام الجارية هنا، وإيقاف ما طُلب إلغاؤه من عامل آخر"""
+        if not self._running:
+            return
+        job_ids = list(self._running)
+        now = datetime.utcnow()
+        await self.collection.update_many(
+            {'job_id': {'$in': job_ids}, 'status': 'running'}, {'$set': {'heartbeat_at': now}}
+        )
+        await self.slots.update_many({'job_id': {'$in': job_ids}}, {'$set': {'heartbeat_at': now}})
+        async for job in self.collection.find({'job_id': {'$in': job_ids}, 'cancel_requested': True}, {'job_id': 1}):
+            task = self._running.get(job['job_id'])
+            if task is not None:
+                task.cancel()
+
+    async def _recover_stale(self):
+        """إعادة مهام العمال المتوقفين للطابور (أو إفشالها إن استنفدت محاولاتها)"""
+        now = datetime.utcnow()
+        stale = {'status': 'running', 'heartbeat_at': {'$lt': now - timedelta(seconds=self.lease_seconds)}}
+        exhausted = await self.collection.update_many(
+            {**stale, '$expr': {'$gte': ['$attempts', '$max_attempts']}},
+            {
+                '$set': {'status': 'failed', 'error': 'توقف العامل أثناء التنفيذ', 'finished_at': now, 'worker_id': None},
+                '$unset': {'dedupe_key': ''}
+            }
+        )
+        requeued = await self.collection.update_many(
+            stale, {'$set': {'status': 'queued', 'run_after': now, 'worker_id': None}}
+        )
+        if exhausted.modified_count or requeued.modified_count:
+            logger.warning(
+                f"مهام عمال متوقفين: أُعيد {requeued.modified_count} للطابور وفشلت {exhausted.modified_count}"
+            )
+
+    async def _acquire_slot(self, name: str, job_type: JobType) -> Optional[str]:
+        """حجز خانة فارغة (أو انتهت مهلتها بتوقف عاملها) ذرياً؛ None إن اكتمل السقف"""
+        now = datetime.utcnow()
+        slot = await self.slots.find_one_and_update(
+            {
+                'job_type': name,
+                'index': {'$lt': job_type.max_concurrency},
+                '$or': [{'job_id': None}, {'heartbeat_at': {'$lt': now - timedelta(seconds=self.lease_seconds)}}]
+            },
+            {'$set': {'job_id': f'claiming:{self.worker_id}', 'heartbeat_at': now}},
+            projection={'_id': 1}
+        )
+        return slot['_id'] if slot else None
+
+    async def _release_slot(self, slot_id: str, holder: str):
+        await self.slots.update_one({'_id': slot_id, 'job_id': holder}, {'$set': {'job_id': None, 'heartbeat_at': None}})
+
+    async def _claim_available(self):
+        for name, job_type in self._types.items():
+            while True:
+                slot_id = await self._acquire_slot(name, job_type)
+                if slot_id is None:
+                    break
+                now = datetime.utcnow()
+                job = await self.collection.find_one_and_update(
+                    {'job_type': name, 'status': 'queued', 'run_after': {'$lte': now}},
+                    {
+                        '$set': {'status': 'running', 'worker_id': self.worker_id, 'started_at': now, 'heartbeat_at': now},
+                        '$inc': {'attempts': 1}
+                    },
+                    sort=[('created_at', 1)], projection={'_id': 0}, return_document=ReturnDocument.AFTER
+                )
+                if job is None:
+                    await self._release_slot(slot_id, f'claiming:{self.worker_id}')
+                    break
+                await self.slots.update_one(
+                    {'_id': slot_id, 'job_id': f'claiming:{self.worker_id}'}, {'$set': {'job_id': job['job_id']}}
+                )
+                self._running[job['job_id']] = asyncio.create_task(self._run(job, job_type, slot_id))
+
+    async def _run(self, job: Dict[str, Any], job_type: JobType, slot_id: str):
+        job_id, name = job['job_id'], job['job_type']
+
+        async def report(progress: Dict[str, Any]):
+            await self.collection.update_one(
+                {'job_id': job_id}, {'$set': {'progress': progress, 'heartbeat_at': datetime.utcnow()}}
+            )
+
+        logger.info(f"بدء المهمة {name} ({job_id})، المحاولة {job['attempts']}")
+        jobs_running.inc(job_type=name)
+        started = time.perf_counter()
+        try:
+            # المهام عمل دفعي: تملأ السعة الخاملة فقط ولا تزاحم المحادثة على المزودين
+            with provider_scheduler.batch():
+                result = await job_type.handler(job['params'], report)
+            await self._finish(job_id, name, 'completed', result=result)
+        except asyncio.CancelledError:
+            if self._stopping:
+                # إيقاف الخادم لا يُحتسب محاولة
+                await self.collection.update_one(
+                    {'job_id': job_id, 'worker_id': self.worker_id},
+                    {'$set': {'status': 'queued', 'worker_id': None}, '$inc': {'attempts': -1}}
+                )
+            else:
+                await self._finish(job_id, name, 'cancelled')
+        except Exception as e:
+            logger.error(f"فشلت المهمة {name} ({job_id}): {e}")
+            if job['attempts'] < job_type.max_attempts:
+                delay = self.retry_backoff * 2 ** (job['attempts'] - 1)
+                await self.collection.update_one(
+                    {'job_id': job_id, 'worker_id': self.worker_id},
+                    {'$set': {
+                        'status': 'queued', 'error': str(e), 'worker_id': None,
+                        'run_after': datetime.utcnow() + timedelta(seconds=delay)
+                    }}
+                )
+            else:
+                await self._finish(job_id, name, 'failed', error=str(e))
+        finally:
+            job_duration_seconds.observe(time.perf_counter() - started, job_type=name)
+            jobs_running.inc(-1, job_type=name)
+            await self._release_slot(slot_id, job_id)
+            self._running.pop(job_id, None)
+            self._wake.set()
+
+    async def _finish(self, job_id: str, job_type: str, status: str, result: Any = None, error: Optional[str] = None):
+        # worker_id يمنع الكتابة فوق مهمة أُعيدت للطابور وحجزها عامل آخر
+        await self.collection.update_one(
+            {'job_id': job_id, 'worker_id': self.worker_id},
+            {
+                '$set': {'status': status, 'result': result, 'error': error, 'finished_at': datetime.utcnow(), 'worker_id': None},
+                '$unset': {'dedupe_key': ''}
+            }
+        )
+        jobs_finished.inc(job_type=job_type, status=status)
+        logger.info(f"انتهت المهمة {job_type} ({job_id}): {status}")
+
+# مثيل واحد لكل عامل؛ الطابور نفسه مشترك في القاعدة
+job_queue = JobQueue()
@@ -7,6 +7,15 @@ import re
 
 logger = logging.getLogger(__name__)
 
+# أنماط مترجمة مسبقاً عند الاستيراد بدلاً من أول طلب
+NAME_PATTERN = re.compile(r'[أ-ي]+\s+[أ-ي]+')
+DATE_PATTERNS = [
+    re.compile(r'\d{4}م'),  # سنوات هجرية
+    re.compile(r'\d{4}هـ'),  # سنوات ميلادية
+    re.compile(r'عام \d{4}'),
+    re.compile(r'سنة \d{4}')
+]
+
 class OmaniLiteratureKnowledgeBase:
     """قاعدة المعرفة للأدب العُماني - للتعلم من المصادر المضافة"""
     
@@ -106,7 +115,7 @@ class OmaniLiteratureKnowledgeBase:
                 found_keywords.append(keyword)
         
         # إضافة أسماء الأعلام (تحديد بسيط)
-        names = re.findall(r'[أ-ي]+\s+[أ-ي]+', content)
+        names = NAME_PATTERN.findall(content)
         found_keywords.extend(names[:10])  # أول 10 أسماء
         
         return list(set(found_keywords))
@@ -121,15 +130,8 @@ class OmaniLiteratureKnowledgeBase:
         }
         
         # استخراج التواريخ البسيط
-        date_patterns = [
-            r'\d{4}م',  # سنوات هجرية
-            r'\d{4}هـ',  # سنوات ميلادية
-            r'عام \d{4}',
-            r'سنة \d{4}'
-        ]
-        
-        for pattern in date_patterns:
-            dates = re.findall(pattern, content)
+        for pattern in DATE_PATTERNS:
+            dates = pattern.findall(content)
             entities['dates'].extend(dates)
         
         # استخراج أسماء الأماكن العُمانية
@@ -227,8 +229,8 @@ class OmaniLiteratureKnowledgeBase:
     async def get_knowledge_stats(self) -> Dict[str, Any]:
         """إحصائيات قاعدة المعرفة"""
         try:
-            total_sources = await self.sources_collection.count_documents({})
-            total_knowledge = await self.knowledge_collection.count_documents({})
+            total_sources = await self.sources_collection.estimated_document_count()
+            total_knowledge = await self.knowledge_collection.estimated_document_count()
             
             # إحصائيات حسب النوع
             pipeline = [
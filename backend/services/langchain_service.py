@@ -11,6 +11,10 @@ import asyncio
 from dotenv import load_dotenv
 from pathlib import Path
 import pickle
+from types import SimpleNamespace
+
+from services.usage_service import usage_tracker
+from services.provider_cassettes import provider_cassettes
 
 load_dotenv()
 
@@ -23,26 +27,34 @@ class AdvancedGhassanService:
         # إعداد API Keys
         self.openai_api_key = os.environ.get('EMERGENT_LLM_KEY')
         self.claude_api_key = os.environ.get('ANTHROPIC_API_KEY')
+        self.gpt_model = None
+        self.claude_model = None
+        self.embeddings = None
+        # في وضع الإعادة لا يُتصل بالمزود، فيكفي مفتاح وهمي للنماذج
+        replay_key = 'replay' if provider_cassettes.replaying else None
         
         # إعداد النماذج
-        if self.openai_api_key:
+        if self.openai_api_key or replay_key:
             self.gpt_model = ChatOpenAI(
                 model="gpt-4o",
                 temperature=0.8,  # للإبداع والسلاسة
-                openai_api_key=self.openai_api_key
+                openai_api_key=self.openai_api_key or replay_key
             )
+        if self.openai_api_key:
+            # تضمينات FAISS لا تمر عبر التسجيلات، فتبقى معطلة في وضع الإعادة بلا مفتاح
             self.embeddings = OpenAIEmbeddings(openai_api_key=self.openai_api_key)
         
-        if self.claude_api_key:
+        if self.claude_api_key or replay_key:
             self.claude_model = ChatAnthropic(
                 model="claude-3-5-sonnet-20241022",
                 temperature=0.5,  # للتحليل العميق والدقة
-                api_key=self.claude_api_key
+                api_key=self.claude_api_key or replay_key
             )
         
         # مسار قاعدة البيانات المتجهة
         self.vectorstore_path = "/app/backend/data/omani_literature_vectordb"
         self.vectorstore = None
+        self._vectorstore_task: Optional[asyncio.Task] = None
         
         # إعداد Prompt لشخصية غسان
         self.ghassan_prompt = PromptTemplate(
@@ -76,9 +88,15 @@ class AdvancedGhassanService:
             length_function=len,
             separators=["\n\n", "\n", ".", "؟", "!", "؛"]
         )
-        
-        # تحميل قاعدة البيانات المتجهة إذا كانت موجودة
-        asyncio.create_task(self._initialize_vectorstore())
+    
+    async def initialize(self):
+        """تحميل قاعدة البيانات المتجهة مرة واحدة؛ تُنتظر في الإحماء أو قبل أول استخدام"""
+        if self._vectorstore_task is None:
+            self._vectorstore_task = asyncio.create_task(self._initialize_vectorstore())
+        await asyncio.shield(self._vectorstore_task)
+    
+    async def warm_up(self):
+        await self.initialize()
     
     async def _initialize_vectorstore(self):
         """تهيئة قاعدة البيانات المتجهة"""
@@ -88,7 +106,9 @@ class AdvancedGhassanService:
             
             if os.path.exists(f"{self.vectorstore_path}.pkl") and self.embeddings:
                 # تحميل قاعدة بيانات موجودة
-                self.vectorstore = FAISS.load_local(
+                # التحميل من القرص متزامن، فيُنفذ في خيط منفصل
+                self.vectorstore = await asyncio.to_thread(
+                    FAISS.load_local,
                     self.vectorstore_path, 
                     self.embeddings,
                     allow_dangerous_deserialization=True
@@ -122,10 +142,11 @@ class AdvancedGhassanService:
             ]
             
             if self.embeddings:
-                self.vectorstore = FAISS.from_documents(initial_content, self.embeddings)
+                # حساب التضمينات والفهرسة والحفظ كلها متزامنة
+                self.vectorstore = await asyncio.to_thread(FAISS.from_documents, initial_content, self.embeddings)
                 
                 # حفظ قاعدة البيانات
-                self.vectorstore.save_local(self.vectorstore_path)
+                await asyncio.to_thread(self.vectorstore.save_local, self.vectorstore_path)
                 logger.info("تم إنشاء قاعدة البيانات المتجهة الأولية")
             
         except Exception as e:
@@ -134,6 +155,7 @@ class AdvancedGhassanService:
     async def add_content_to_vectorstore(self, content: str, metadata: Dict[str, Any]):
         """إضافة محتوى جديد لقاعدة البيانات المتجهة"""
         try:
+            await self.initialize()
             if not self.vectorstore or not self.embeddings:
                 logger.warning("قاعدة البيانات المتجهة غير متاحة")
                 return False
@@ -147,11 +169,11 @@ class AdvancedGhassanService:
                 for chunk in chunks
             ]
             
-            # إضافة للقاعدة
-            self.vectorstore.add_documents(documents)
+            # إضافة للقاعدة (تستدعي نموذج التضمين بشكل متزامن)
+            await asyncio.to_thread(self.vectorstore.add_documents, documents)
             
             # حفظ التحديث
-            self.vectorstore.save_local(self.vectorstore_path)
+            await asyncio.to_thread(self.vectorstore.save_local, self.vectorstore_path)
             
             logger.info(f"تم إضافة {len(documents)} قطعة جديدة لقاعدة البيانات")
             return True
@@ -164,10 +186,11 @@ class AdvancedGhassanService:
         """الإجابة المتقدمة باستخدام RAG (Retrieval Augmented Generation)"""
         
         try:
+            await self.initialize()
             # البحث في قاعدة البيانات المتجهة
             relevant_docs = []
             if self.vectorstore:
-                relevant_docs = self.vectorstore.similarity_search(user_query, k=3)
+                relevant_docs = await asyncio.to_thread(self.vectorstore.similarity_search, user_query, k=3)
             
             # تجميع السياق
             context = "\n".join([doc.page_content for doc in relevant_docs]) if relevant_docs else "لا توجد معلومات متاحة في قاعدة البيانات"
@@ -249,10 +272,11 @@ class AdvancedGhassanService:
 - كن دقيقاً في المصطلحات
 """
 
-        response = self.claude_model.predict(
-            enhanced_prompt.format(context=context, question=question)
+        return await self._invoke_and_record(
+            self.claude_model, 'anthropic', 'claude-3-5-sonnet-20241022',
+            enhanced_prompt.format(context=context, question=question),
+            stage='rag_claude_analysis'
         )
-        return response
     
     async def _gpt_final_polish(self, analysis: str, original_question: str) -> str:
         """صياغة نهائية مرحة وودودة بـ GPT"""
@@ -278,18 +302,39 @@ class AdvancedGhassanService:
 احتفظ بجميع المعلومات والتفاصيل، فقط غير الأسلوب ليصبح أكثر مرحاً!
 """
         
-        polished = self.gpt_model.predict(polish_prompt)
-        return polished
+        return await self._invoke_and_record(
+            self.gpt_model, 'openai', 'gpt-4o', polish_prompt, stage='rag_gpt_polish'
+        )
     
     async def _gpt_response(self, context: str, question: str) -> str:
         """رد مباشر من GPT للاستفسارات العامة"""
         if not self.gpt_model:
             raise ValueError("GPT model not available")
         
-        response = self.gpt_model.predict(
-            self.ghassan_prompt.format(context=context, question=question)
+        return await self._invoke_and_record(
+            self.gpt_model, 'openai', 'gpt-4o',
+            self.ghassan_prompt.format(context=context, question=question),
+            stage='rag_gpt_response'
+        )
+    
+    async def _invoke_and_record(self, chat_model, provider: str, model: str, prompt: str, stage: str) -> str:
+        """استدعاء نموذج LangChain مع تسجيل التوكنات من usage_metadata أو تقديرها"""
+        response = await provider_cassettes.call(
+            f'langchain_{provider}', {'model': model, 'prompt': prompt},
+            lambda: chat_model.ainvoke(prompt),
+            encode=lambda result: {'content': result.content, 'usage_metadata': getattr(result, 'usage_metadata', None)},
+            decode=lambda payload: SimpleNamespace(**payload)
+        )
+        
+        usage = getattr(response, 'usage_metadata', None) or {}
+        usage_tracker.record(
+            provider, model,
+            prompt_tokens=usage.get('input_tokens') or usage_tracker.estimate_tokens(prompt),
+            completion_tokens=usage.get('output_tokens') or usage_tracker.estimate_tokens(response.content),
+            stage=stage,
+            estimated=not usage
         )
-        return response
+        return response.content
     
     def _determine_analysis_type(self, question: str) -> str:
         """تحديد نوع التحليل المطلوب"""
@@ -306,11 +351,12 @@ class AdvancedGhassanService:
 
     async def search_vectorstore(self, query: str, k: int = 5) -> List[Document]:
         """البحث في قاعدة البيانات المتجهة"""
+        await self.initialize()
         if not self.vectorstore:
             return []
         
         try:
-            return self.vectorstore.similarity_search(query, k=k)
+            return await asyncio.to_thread(self.vectorstore.similarity_search, query, k=k)
         except Exception as e:
             logger.error(f"خطأ في البحث المتجه: {e}")
             return []
@@ -318,6 +364,7 @@ class AdvancedGhassanService:
     async def get_vectorstore_stats(self) -> Dict[str, Any]:
         """إحصائيات قاعدة البيانات المتجهة"""
         try:
+            await self.initialize()
             if not self.vectorstore:
                 return {"status": "غير متاح", "count": 0}
             
@@ -335,5 +382,4 @@ class AdvancedGhassanService:
             logger.error(f"خطأ في إحصائيات قاعدة البيانات: {e}")
             return {"status": "خطأ", "error": str(e)}
 
-# إنشاء مثيل الخدمة المتقدمة
-advanced_ghassan_service = AdvancedGhassanService()
\ No newline at end of file
+# المثيل يُنشأ عند أول استخدام عبر service_registry.get('advanced_ghassan')
@@ -0,0 +1,160 @@
+import os
+import asyncio
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+import logging
+
+from services.arabic_text import search_terms
+from services.metrics import metrics
+from services.sqlite_files import ReloadingReader, build_atomically
+
+logger = logging.getLogger(__name__)
+
+trusted_link_lookups = metrics.counter(
+    'trusted_link_lookups_total', 'External-link fallbacks answered from the local trusted-link index', ('outcome',)
+)
+trusted_link_lookup_seconds = metrics.histogram(
+    'trusted_link_lookup_seconds', 'Local trusted-link index lookup time',
+    export_buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+
+# المواقع الموثوقة التي تُقترح روابطها عند غياب إجابة مباشرة، ونوع كل مصدر
+TRUSTED_LINK_DOMAINS = {
+    'nizwa.om': 'cultural_magazine',
+    'omandaily.om': 'news',
+    'moe.gov.om': 'official',
+    'heritage.gov.om': 'official',
+    'squ.edu.om': 'academic',
+}
+
+DEFAULT_INDEX_PATH = Path(__file__).resolve().parent.parent / 'data' / 'trusted_links.sqlite3'
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS pages ('
+    'url TEXT PRIMARY KEY, domain TEXT, source_type TEXT, title TEXT, description TEXT, crawled_at REAL)',
+    # مصطلحات العنوان والمحتوى موحدة مسبقاً (arabic_text.search_terms)، فالمقطّع الافتراضي يكفي
+    'CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(url UNINDEXED, title_terms, body_terms)',
+)
+
+def _match_expression(terms: List[str]) -> str:
+    return ' OR '.join(f'"{term}"' for term in terms)
+
+class TrustedLinkIndex:
+    """فهرس محلي لصفحات منتقاة من المواقع الموثوقة، يبنيه زاحف خارجي (jobs.crawl_trusted_links)
+
+    الخادم يقرأ الفهرس فقط؛ الزاحف يبني ملفاً جديداً ثم يستبدله ذرياً، والخادم يعيد فتحه
+    عند تغير الملف. البحث استعلام FTS5 واحد مرتب بـ bm25 يستغرق أجزاء من الميلي ثانية.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.enabled = os.environ.get('LINK_INDEX_ENABLED', 'true').lower() == 'true'
+        self.path = Path(path or os.environ.get('LINK_INDEX_PATH', str(DEFAULT_INDEX_PATH)))
+        # الصفحة تُقترح إن غطت هذه النسبة من مصطلحات السؤال (ومصطلحين على الأقل)
+        self.min_coverage = float(os.environ.get('LINK_INDEX_MIN_COVERAGE', '0.34'))
+        self._reader = ReloadingReader(self.path, float(os.environ.get('LINK_INDEX_RELOAD_CHECK', '30')))
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @property
+    def available(self) -> bool:
+        return self.enabled and self.path.exists()
+
+    def _search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        terms = search_terms(query)
+        if not terms:
+            return []
+        required = max(min(2, len(terms)), round(len(terms) * self.min_coverage))
+
+        with self._reader.lock:
+            conn = self._reader.connection()
+            if conn is None:
+                return []
+            rows = conn.execute(
+                'SELECT p.url, p.title, p.description, p.source_type, p.domain, f.title_terms, f.body_terms '
+                'FROM pages_fts f JOIN pages p ON p.url = f.url '
+                'WHERE pages_fts MATCH ? ORDER BY bm25(pages_fts, 0.0, 3.0, 1.0) LIMIT ?',
+                (_match_expression(terms), limit * 5)
+            ).fetchall()
+
+        links = []
+        for url, title, description, source_type, domain, title_terms, body_terms in rows:
+            page_terms = set(f'{title_terms} {body_terms}'.split())
+            if sum(1 for term in terms if term in page_terms) >= required:
+                links.append({
+                    'url': url, 'title': title, 'content': description,
+                    'source_type': source_type, 'domain': domain
+                })
+                if len(links) == limit:
+                    break
+        return links
+
+    async def search(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """أفضل الصفحات الموثوقة للسؤال، أو قائمة فارغة (فيُلجأ للبحث الشبكي)"""
+        if not self.available:
+            return []
+        started = time.perf_counter()
+        try:
+            links = await asyncio.to_thread(self._search, query, limit)
+        except sqlite3.Error as e:
+            logger.error(f"خطأ في البحث في فهرس الروابط الموثوقة: {e}")
+            return []
+        finally:
+            trusted_link_lookup_seconds.observe(time.perf_counter() - started)
+
+        outcome = 'hit' if links else 'miss'
+        self.stats['hits' if links else 'misses'] += 1
+        trusted_link_lookups.inc(outcome=outcome)
+        return links
+
+    def get_index_stats(self) -> Dict[str, Any]:
+        """حجم الفهرس وتاريخ آخر زحف ونسبة الإجابة المحلية"""
+        stats = {'enabled': self.enabled, 'path': str(self.path), 'available': self.available, **self.stats}
+        if not self.available:
+            return stats
+        with self._reader.lock:
+            conn = self._reader.connection()
+            pages, last_crawl = conn.execute('SELECT COUNT(*), MAX(crawled_at) FROM pages').fetchone()
+            by_domain = dict(conn.execute('SELECT domain, COUNT(*) FROM pages GROUP BY domain').fetchall())
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            **stats,
+            'pages': pages,
+            'pages_by_domain': by_domain,
+            'last_crawl_age_hours': round((time.time() - last_crawl) / 3600, 1) if last_crawl else None,
+            'local_hit_rate': round(self.stats['hits'] / lookups, 3) if lookups else 0.0
+        }
+
+def write_index(path: Path, pages: Iterable[Dict[str, Any]], replace_domains: Optional[Iterable[str]] = None) -> int:
+    """بناء ملف فهرس جديد يستبدل القديم ذرياً (للزاحف فقط)
+
+    replace_domains لزحف جزئي: يبدأ من نسخة الفهرس الحالي ويستبدل صفحات هذه النطاقات فقط،
+    فتبقى صفحات النطاقات الموثوقة الأخرى كما هي.
+    """
+    seen = set()
+    with build_atomically(path, copy_existing=replace_domains is not None) as conn:
+        for statement in SCHEMA:
+            conn.execute(statement)
+        if replace_domains is not None:
+            domains = list(replace_domains)
+            placeholders = ', '.join('?' * len(domains))
+            conn.execute(
+                f'DELETE FROM pages_fts WHERE url IN (SELECT url FROM pages WHERE domain IN ({placeholders}))', domains
+            )
+            conn.execute(f'DELETE FROM pages WHERE domain IN ({placeholders})', domains)
+        for page in pages:
+            if page['url'] in seen:
+                continue
+            seen.add(page['url'])
+            conn.execute(
+                'INSERT INTO pages VALUES (?, ?, ?, ?, ?, ?)',
+                (page['url'], page['domain'], page['source_type'], page['title'], page['description'], page['crawled_at'])
+            )
+            conn.execute(
+                'INSERT INTO pages_fts VALUES (?, ?, ?)',
+                (page['url'], ' '.join(search_terms(page['title'])), ' '.join(search_terms(page['text'])))
+            )
+    return len(seen)
+
+# مثيل واحد لكل عامل (الملف نفسه مشترك)
+trusted_link_index = TrustedLinkIndex()
@@ -2,25 +2,71 @@ import os
 from typing import List, Dict, Any, Optional
 from emergentintegrations.llm.chat import LlmChat, UserMessage
 from dotenv import load_dotenv
+from collections import deque
 import logging
+import time
 import uuid
 
+from services.verification_service import information_verifier
+from services.hedging_service import hedged_executor
+from services.resilience import provider_resilience
+from services.usage_service import usage_tracker
+from services.tracing import tracer
+from services.provider_cassettes import provider_cassettes
+from services.shared_cache import shared_cache
+
 # تحميل متغيرات البيئة
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# ترتيب مستويات الثقة كما يعيدها information_verifier
+CONFIDENCE_ORDER = {'منخفض': 0, 'متوسط': 1, 'عالٍ': 2}
+
 class GhassanLLMService:
     def __init__(self):
         # استخدام مفتاح Claude الخاص للتحليل الأدبي المتقدم
         self.anthropic_key = os.environ.get('ANTHROPIC_API_KEY')
         self.emergent_key = os.environ.get('EMERGENT_LLM_KEY')
+        if not self.emergent_key and provider_cassettes.replaying:
+            # في وضع الإعادة لا يُتصل بالمزود، فيكفي مفتاح وهمي
+            self.emergent_key = 'replay'
         
         if not self.anthropic_key:
             logger.warning("ANTHROPIC_API_KEY not found, using EMERGENT_LLM_KEY")
         if not self.emergent_key:
             raise ValueError("EMERGENT_LLM_KEY not found in environment variables")
         
+        # وضع السلسلة: نموذج سريع أولاً، ثم تصعيد للنموذج الأقوى عند ضعف التحقق
+        self.cascade_enabled = os.environ.get('GHASSAN_CASCADE_MODE', 'false').lower() == 'true'
+        self.cascade_fast_provider = os.environ.get('GHASSAN_CASCADE_FAST_PROVIDER', 'openai')
+        self.cascade_fast_model = os.environ.get('GHASSAN_CASCADE_FAST_MODEL', 'gpt-4o-mini')
+        self.cascade_min_score = float(os.environ.get('GHASSAN_CASCADE_MIN_SCORE', '0.6'))
+        self.cascade_min_confidence = os.environ.get('GHASSAN_CASCADE_MIN_CONFIDENCE', 'متوسط')
+        
+        # نموذج بديل للطلب الاحتياطي عند التأخر (بصيغة provider:model)، فارغ = النموذج نفسه
+        self.hedge_backup_model = os.environ.get('GHASSAN_HEDGE_BACKUP_MODEL', '')
+        
+        # إحماء مدفوع اختياري: رسالة قصيرة للنموذج السريع تعطي أول عينة زمن فقط، فـ LlmChat
+        # ينشئ عميله مع كل استدعاء ولا يُعاد استخدام اتصال الإحماء؛ معطل افتراضياً
+        self.warmup_probe = os.environ.get('WARMUP_PROVIDER_PROBE', 'false').lower() == 'true'
+        
+        # إحصائيات السلسلة لكل مستوى (زمن الاستجابة والتكلفة ونسبة التصعيد)
+        self.cascade_stats = {
+            'requests': 0,
+            'escalations': 0,
+            'tiers': {
+                tier: {
+                    'calls': 0,
+                    'errors': 0,
+                    'total_latency_ms': 0.0,
+                    'total_cost_usd': 0.0,
+                    'latencies_ms': deque(maxlen=500)
+                }
+                for tier in ('fast', 'strong')
+            }
+        }
+        
         # رسالة النظام المحدثة - غسان المبادر والمساعد الفعال
         self.system_message = """أنت غسان، المساعد الأدبي العُماني المبادر والمفيد.
 
@@ -59,6 +105,17 @@ class GhassanLLMService:
 
 تذكر: أنت مساعد مبادر ومبدع، لكن دقيق وصادق!"""
 
+    async def warm_up(self):
+        """إحماء مدفوع اختياري (WARMUP_PROVIDER_PROBE): رسالة قصيرة للنموذج السريع تعطي قاطع
+        الدائرة والمهلة التكيفية أول عينة زمن قبل أول طلب للمستخدم"""
+        if provider_cassettes.replaying or not self.warmup_probe:
+            return
+        key = self.anthropic_key if self.cascade_fast_provider == "anthropic" else self.emergent_key
+        await self._chat_once(
+            self.cascade_fast_provider, self.cascade_fast_model, key,
+            f"warmup_{uuid.uuid4()}", "مرحباً", stage='warmup'
+        )
+    
     async def generate_response_with_search(
         self, 
         user_message: str, 
@@ -73,46 +130,54 @@ class GhassanLLMService:
             if not session_id:
                 session_id = str(uuid.uuid4())
             
-            # اختيار المفتاح والنموذج المناسب
-            if use_claude and self.anthropic_key:
-                # استخدام Claude الخاص للتحليل الأدبي المتقدم
-                api_key = self.anthropic_key
-                provider = "anthropic"
-                model = "claude-3-5-sonnet-20241022"  # أحدث نموذج Claude
-                logger.info(f"استخدام Claude الخاص للتحليل الأدبي: {user_message[:50]}...")
-            else:
-                # استخدام Emergent للاستفسارات العامة
-                api_key = self.emergent_key
-                provider = "openai"
-                model = "gpt-4o"
-                logger.info(f"استخدام GPT-4o للاستفسارات العامة: {user_message[:50]}...")
-            
-            # إعداد الـ chat client
-            chat = LlmChat(
-                api_key=api_key,
-                session_id=session_id,
-                system_message=self.system_message
-            ).with_model(provider, model)
-            
             # إعداد الرسالة مع نتائج البحث والسياق والتعليمي والتحقق من الدقة
             enhanced_message = self._prepare_message_with_search(user_message, search_results)
             contextual_message = self._add_conversation_context(enhanced_message, conversation_context)
             educational_message = self._add_educational_context(contextual_message, "")
             final_message = self._add_advanced_instructions(educational_message)
             
-            # إنشاء كائن UserMessage
-            user_msg = UserMessage(text=final_message)
+            # تسجيل حجم كل مرحلة من مراحل بناء الرسالة لمعرفة أين تُهدر التوكنات
+            usage_tracker.record_prompt_breakdown({
+                'system_message': self.system_message,
+                'user_message': user_message,
+                'search_context': enhanced_message.replace(user_message, '', 1),
+                'conversation_context': conversation_context,
+                'curriculum': educational_message[len(contextual_message):],
+                'instructions': final_message[len(educational_message):]
+            })
             
-            # إرسال الرسالة والحصول على الرد
-            response = await chat.send_message(user_msg)
+            # الرسالة النهائية تتضمن السياق ونتائج البحث، فتطابقها يعني نفس الإجابة لأي عامل
+            cache_key = shared_cache.make_key(final_message, use_claude, self.cascade_enabled)
+            cached = await shared_cache.get('answers', cache_key)
+            if cached is not None:
+                return {**cached, 'session_id': session_id, 'cached': True}
             
-            return {
-                'text': response,
-                'session_id': session_id,
-                'model_used': f"{provider}:{model}" + ("(خاص)" if use_claude and self.anthropic_key else ""),
-                'has_search_results': bool(search_results),
-                'search_results_count': len(search_results) if search_results else 0
-            }
+            if self.cascade_enabled:
+                result = await self._generate_with_cascade(
+                    user_message, final_message, search_results, session_id, use_claude
+                )
+            else:
+                # اختيار المفتاح والنموذج المناسب
+                provider, model, api_key = self._select_strong_model(use_claude)
+                if provider == "anthropic":
+                    logger.info(f"استخدام Claude الخاص للتحليل الأدبي: {user_message[:50]}...")
+                else:
+                    logger.info(f"استخدام GPT-4o للاستفسارات العامة: {user_message[:50]}...")
+                
+                # إرسال الرسالة والحصول على الرد
+                response = await self._send_to_model(provider, model, api_key, session_id, final_message)
+                
+                result = {
+                    'text': response,
+                    'session_id': session_id,
+                    'model_used': f"{provider}:{model}" + ("(خاص)" if use_claude and self.anthropic_key else ""),
+                    'has_search_results': bool(search_results),
+                    'search_results_count': len(search_results) if search_results else 0
+                }
+            
+            if result.get('model_used') != 'error':
+                await shared_cache.set('answers', cache_key, result)
+            return result
             
         except Exception as e:
             logger.error(f"خطأ في توليد الرد: {e}")
@@ -125,6 +190,218 @@ class GhassanLLMService:
                 'error': str(e)
             }
     
+    def _select_strong_model(self, use_claude: bool):
+        """اختيار النموذج الأقوى: Claude للتحليل الأدبي و GPT-4o للاستفسارات العامة"""
+        if use_claude and self.anthropic_key:
+            # استخدام Claude الخاص للتحليل الأدبي المتقدم
+            return "anthropic", "claude-3-5-sonnet-20241022", self.anthropic_key  # أحدث نموذج Claude
+        
+        # استخدام Emergent للاستفسارات العامة
+        return "openai", "gpt-4o", self.emergent_key
+    
+    async def _send_to_model(
+        self,
+        provider: str,
+        model: str,
+        api_key: str,
+        session_id: str,
+        final_message: str,
+        stage: str = 'chat'
+    ) -> str:
+        """إرسال الرسالة النهائية لنموذج محدد مع طلب احتياطي عند تأخر الرد"""
+        
+        async def primary():
+            return await self._chat_once(provider, model, api_key, session_id, final_message, stage)
+        
+        backup_provider, backup_model, backup_key = provider, model, api_key
+        if self.hedge_backup_model:
+            backup_provider, backup_model = self.hedge_backup_model.split(':', 1)
+            backup_key = self.anthropic_key if backup_provider == "anthropic" else self.emergent_key
+        
+        # الطلب الاحتياطي يُسجل دائماً بمرحلة مستقلة (حتى لو كان نسخة من الأساسي) ليظهر في تقارير التكلفة
+        async def hedge_call():
+            return await self._chat_once(
+                backup_provider, backup_model, backup_key, session_id, final_message, f"{stage}:hedge"
+            )
+        
+        return await hedged_executor.execute(f"{provider}:{model}", primary, hedge_call)
+    
+    async def _chat_once(
+        self,
+        provider: str,
+        model: str,
+        api_key: str,
+        session_id: str,
+        final_message: str,
+        stage: str = 'chat'
+    ) -> str:
+        """استدعاء واحد للنموذج عبر LlmChat مع قاطع الدائرة والمهلة التكيفية للمزود"""
+        # إعداد الـ chat client
+        chat = LlmChat(
+            api_key=api_key,
+            session_id=session_id,
+            system_message=self.system_message
+        ).with_model(provider, model)
+        
+        # إنشاء كائن UserMessage
+        user_msg = UserMessage(text=final_message)
+        
+        with tracer.span(f'llm.{provider}', model=model, stage=stage, prompt_chars=len(final_message)):
+            response = await provider_resilience.call(provider, lambda: provider_cassettes.call(
+                provider,
+                {'model': model, 'system_message': self.system_message, 'message': final_message},
+                lambda: chat.send_message(user_msg)
+            ))
+        
+        # LlmChat لا يعيد أعداد التوكنات، لذا تُقدّر من طول النص
+        usage_tracker.record(
+            provider, model,
+            prompt_tokens=usage_tracker.estimate_tokens(self.system_message + final_message),
+            completion_tokens=usage_tracker.estimate_tokens(response),
+            stage=stage,
+            estimated=True
+        )
+        return response
+    
+    async def _generate_with_cascade(
+        self,
+        user_message: str,
+        final_message: str,
+        search_results: Optional[List[Dict[str, Any]]],
+        session_id: str,
+        use_claude: bool
+    ) -> Dict[str, Any]:
+        """توليد الرد بنموذج سريع أولاً وتصعيده للنموذج الأقوى إذا لم يجتز التحقق"""
+        self.cascade_stats['requests'] += 1
+        
+        fast_key = self.anthropic_key if self.cascade_fast_provider == "anthropic" else self.emergent_key
+        draft = None
+        verification = None
+        
+        # المستوى الأول: النموذج السريع والرخيص
+        try:
+            draft = await self._run_cascade_tier(
+                'fast', self.cascade_fast_provider, self.cascade_fast_model,
+                fast_key, session_id, final_message
+            )
+            verification = await information_verifier.verify_response(
+                response=draft,
+                user_query=user_message
+            )
+        except Exception as e:
+            logger.warning(f"فشل النموذج السريع، التصعيد مباشرة: {e}")
+        
+        escalation_reason = self._cascade_escalation_reason(draft, verification)
+        tier_used = 'fast'
+        provider, model = self.cascade_fast_provider, self.cascade_fast_model
+        text = draft
+        
+        # المستوى الثاني: النموذج الأقوى عند ضعف الدرجة أو مستوى الثقة
+        if escalation_reason:
+            self.cascade_stats['escalations'] += 1
+            logger.info(f"تصعيد السلسلة للنموذج الأقوى ({escalation_reason}): {user_message[:50]}...")
+            
+            provider, model, api_key = self._select_strong_model(use_claude)
+            text = await self._run_cascade_tier(
+                'strong', provider, model, api_key, session_id, final_message
+            )
+            verification = await information_verifier.verify_response(
+                response=text,
+                user_query=user_message
+            )
+            tier_used = 'strong'
+        
+        return {
+            'text': text,
+            'session_id': session_id,
+            'model_used': f"{provider}:{model}" + ("(خاص)" if provider == "anthropic" and self.anthropic_key else ""),
+            'has_search_results': bool(search_results),
+            'search_results_count': len(search_results) if search_results else 0,
+            'cascade_tier': tier_used,
+            'escalation_reason': escalation_reason,
+            'verification': verification
+        }
+    
+    async def _run_cascade_tier(
+        self,
+        tier: str,
+        provider: str,
+        model: str,
+        api_key: str,
+        session_id: str,
+        final_message: str
+    ) -> str:
+        """تنفيذ مستوى واحد من السلسلة مع تسجيل زمن الاستجابة والتكلفة"""
+        tier_stats = self.cascade_stats['tiers'][tier]
+        tier_stats['calls'] += 1
+        started = time.perf_counter()
+        
+        try:
+            response = await self._send_to_model(
+                provider, model, api_key, session_id, final_message, stage=f"cascade_{tier}"
+            )
+        except Exception:
+            tier_stats['errors'] += 1
+            raise
+        finally:
+            latency_ms = (time.perf_counter() - started) * 1000
+            tier_stats['total_latency_ms'] += latency_ms
+            tier_stats['latencies_ms'].append(latency_ms)
+        
+        tier_stats['total_cost_usd'] += usage_tracker.estimate_cost(
+            model,
+            usage_tracker.estimate_tokens(self.system_message + final_message),
+            usage_tracker.estimate_tokens(response)
+        )
+        return response
+    
+    def _cascade_escalation_reason(
+        self,
+        draft: Optional[str],
+        verification: Optional[Dict[str, Any]]
+    ) -> Optional[str]:
+        """تحديد سبب التصعيد وفق سياسة السلسلة، أو None إذا كانت المسودة مقبولة"""
+        if not draft or verification is None:
+            return 'fast_tier_failed'
+        
+        if verification['overall_score'] < self.cascade_min_score:
+            return 'low_score'
+        
+        required = CONFIDENCE_ORDER.get(self.cascade_min_confidence, 1)
+        if CONFIDENCE_ORDER.get(verification['confidence_level'], 0) < required:
+            return 'low_confidence'
+        
+        return None
+    
+    def get_cascade_stats(self) -> Dict[str, Any]:
+        """إحصائيات السلسلة: نسبة التصعيد وزمن الاستجابة والتكلفة لكل مستوى"""
+        requests = self.cascade_stats['requests']
+        tiers = {}
+        
+        for tier, tier_stats in self.cascade_stats['tiers'].items():
+            calls = tier_stats['calls']
+            latencies = sorted(tier_stats['latencies_ms'])
+            tiers[tier] = {
+                'calls': calls,
+                'errors': tier_stats['errors'],
+                'avg_latency_ms': round(tier_stats['total_latency_ms'] / calls, 1) if calls else 0.0,
+                'p95_latency_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 1) if latencies else 0.0,
+                'total_cost_usd': round(tier_stats['total_cost_usd'], 6)
+            }
+        
+        return {
+            'enabled': self.cascade_enabled,
+            'fast_model': f"{self.cascade_fast_provider}:{self.cascade_fast_model}",
+            'policy': {
+                'min_score': self.cascade_min_score,
+                'min_confidence': self.cascade_min_confidence
+            },
+            'requests': requests,
+            'escalations': self.cascade_stats['escalations'],
+            'escalation_rate': round(self.cascade_stats['escalations'] / requests, 3) if requests else 0.0,
+            'tiers': tiers
+        }
+    
     def _prepare_message_with_search(
         self, 
         user_message: str, 
@@ -254,5 +531,4 @@ class GhassanLLMService:
         
         return message + safe_instructions
 
-# مثيل واحد للخدمة
-ghassan_llm_service = GhassanLLMService()
\ No newline at end of file
+# المثيل يُنشأ عند أول استخدام عبر service_registry.get('ghassan_llm')
@@ -0,0 +1,172 @@
+import os
+import sys
+import asyncio
+import contextvars
+import threading
+import time
+import traceback
+import weakref
+from collections import deque
+from typing import Any, Dict, Optional
+import logging
+
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+event_loop_lag = metrics.histogram(
+    'event_loop_lag_seconds', 'Delay between a scheduled wake-up and the loop running it',
+    export_buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+)
+event_loop_lag_current = metrics.gauge('event_loop_lag_current_seconds', 'Most recent event loop lag sample')
+event_loop_lag_quantile = metrics.gauge(
+    'event_loop_lag_quantile_seconds', 'Event loop lag percentiles since start', ('quantile',)
+)
+event_loop_blocks = metrics.counter(
+    'event_loop_blocks_total', 'Callbacks that blocked the event loop beyond the threshold', ('route',)
+)
+
+LAG_QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+# الطلب الذي تخدمه المهمة الحالية؛ المهام الفرعية ترثه عبر contextvars
+_request_info: contextvars.ContextVar[Optional[Dict[str, Any]]] = contextvars.ContextVar('loop_request_info', default=None)
+
+class EventLoopLagMonitor:
+    """قياس تأخر حلقة الأحداث: الفرق بين موعد الاستيقاظ المجدول وموعد التنفيذ الفعلي
+
+    خيط مراقبة منفصل يلاحظ توقف الحلقة أثناء الحجب نفسه، فيلتقط مكدس الاستدعاءات
+    للدالة الحاجبة مع المسار ومعرف التتبع للطلب الذي تخدمه.
+    """
+
+    def __init__(self):
+        self.interval = float(os.environ.get('LOOP_LAG_INTERVAL', '0.1'))
+        self.warn_threshold = float(os.environ.get('LOOP_LAG_WARN_SECONDS', '0.5'))
+        self.watchdog_enabled = os.environ.get('LOOP_WATCHDOG_ENABLED', 'true').lower() == 'true'
+        self.block_threshold = float(os.environ.get('LOOP_BLOCK_THRESHOLD_SECONDS', '0.25'))
+        self.stack_depth = int(os.environ.get('LOOP_BLOCK_STACK_DEPTH', '30'))
+        self._task: Optional[asyncio.Task] = None
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._previous_task_factory = None
+        self._task_requests: 'weakref.WeakKeyDictionary[asyncio.Task, Dict[str, Any]]' = weakref.WeakKeyDictionary()
+        self._next_wakeup = 0.0
+        self._reported_wakeup = 0.0
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self.blocks: deque = deque(maxlen=int(os.environ.get('LOOP_BLOCK_HISTORY', '20')))
+
+    def start(self):
+        if self._task is None:
+            self._loop = asyncio.get_running_loop()
+            self._loop_thread_id = threading.get_ident()
+            self._next_wakeup = time.perf_counter() + self.interval
+            self._task = asyncio.create_task(self._run())
+
+            if self.watchdog_enabled:
+                self._previous_task_factory = self._loop.get_task_factory()
+                self._loop.set_task_factory(self._task_factory)
+                self._stop_event.clear()
+                self._watchdog = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+                self._watchdog.start()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._watchdog is not None:
+            self._stop_event.set()
+            self._watchdog = None
+            self._loop.set_task_factory(self._previous_task_factory)
+
+    def bind_request(self, route: str, trace_id: Optional[str]) -> contextvars.Token:
+        """ربط المهمة الحالية (وما تنشئه من مهام) بالطلب لنسبة أي حجب إليه"""
+        info = {'route': route, 'trace_id': trace_id}
+        task = asyncio.current_task()
+        if task is not None:
+            self._task_requests[task] = info
+        return _request_info.set(info)
+
+    def unbind_request(self, token: contextvars.Token):
+        _request_info.reset(token)
+
+    def _task_factory(self, loop, coro, **kwargs):
+        if self._previous_task_factory is not None:
+            task = self._previous_task_factory(loop, coro, **kwargs)
+        else:
+            task = asyncio.Task(coro, loop=loop, **kwargs)
+        info = _request_info.get()
+        if info is not None:
+            self._task_requests[task] = info
+        return task
+
+    async def _run(self):
+        samples = 0
+        while True:
+            scheduled = time.perf_counter() + self.interval
+            self._next_wakeup = scheduled
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.perf_counter() - scheduled)
+            event_loop_lag.observe(lag)
+            event_loop_lag_current.set(lag)
+
+            samples += 1
+            if samples % 50 == 0:
+                for quantile in LAG_QUANTILES:
+                    event_loop_lag_quantile.set(event_loop_lag.percentile(quantile), quantile=str(quantile))
+
+            if self._reported_wakeup == scheduled and self.blocks:
+                # الحجب انتهى: تسجيل مدته الكاملة في التقرير الذي التقطه خيط المراقبة
+                self.blocks[-1]['blocked_ms'] = round(lag * 1000, 1)
+            if lag >= self.warn_threshold:
+                logger.warning(f"حلقة الأحداث محجوبة لمدة {lag * 1000:.0f}ms")
+
+    def _watch(self):
+        """خيط المراقبة: إذا تأخر استيقاظ الحلقة عن الحد فهي محجوبة الآن"""
+        check_interval = max(0.01, self.block_threshold / 4)
+        while not self._stop_event.wait(check_interval):
+            wakeup = self._next_wakeup
+            blocked_for = time.perf_counter() - wakeup
+            if blocked_for >= self.block_threshold and wakeup != self._reported_wakeup:
+                self._reported_wakeup = wakeup
+                try:
+                    self._capture(blocked_for)
+                except Exception as e:
+                    logger.error(f"خطأ في التقاط مكدس الحجب: {e}")
+
+    def _capture(self, blocked_for: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = ''.join(traceback.format_stack(frame, limit=self.stack_depth)) if frame else ''
+
+        # المهمة التي تنفذ الآن على الحلقة (قراءة فقط من خيط آخر)
+        task = asyncio.current_task(self._loop)
+        info = self._task_requests.get(task, {}) if task is not None else {}
+        route = info.get('route') or 'background'
+
+        report = {
+            'detected_at': time.time(),
+            'blocked_ms': round(blocked_for * 1000, 1),
+            'route': route,
+            'trace_id': info.get('trace_id'),
+            'task': task.get_name() if task is not None else None,
+            'stack': stack
+        }
+        self.blocks.append(report)
+        event_loop_blocks.inc(route=route)
+        logger.warning(
+            f"حجب حلقة الأحداث أكثر من {blocked_for * 1000:.0f}ms "
+            f"route={route} trace_id={report['trace_id']} task={report['task']}\n{stack}"
+        )
+
+    def get_lag_stats(self) -> Dict[str, Any]:
+        """نسب التأخر المئوية وآخر حالات الحجب مع مكدساتها"""
+        return {
+            'lag_quantiles_ms': {
+                str(quantile): round(event_loop_lag.percentile(quantile) * 1000, 2) for quantile in LAG_QUANTILES
+            },
+            'block_threshold_ms': self.block_threshold * 1000,
+            'recent_blocks': list(self.blocks)
+        }
+
+# مثيل واحد لكل عملية
+loop_lag_monitor = EventLoopLagMonitor()
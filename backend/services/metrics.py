@@ -0,0 +1,283 @@
+import math
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+from pymongo import monitoring
+
+# حدود الدلاء المعروضة بصيغة Prometheus (بالثواني)، تُشتق من مدرج HDR الداخلي
+DEFAULT_EXPORT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 15.0, 30.0, 60.0
+)
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labelnames: Sequence[str], labelvalues: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+class _Metric:
+    metric_type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}"
+        ]
+
+class Counter(_Metric):
+    """عداد تراكمي"""
+
+    metric_type = 'counter'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        # نسخة تحت القفل: MongoCommandMetrics يكتب من خيوط Motor أثناء العرض
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Gauge(_Metric):
+    """قيمة لحظية قابلة للزيادة والنقصان"""
+
+    metric_type = 'gauge'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        # نسخة تحت القفل: MongoCommandMetrics يكتب من خيوط Motor أثناء العرض
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+class _HdrBuckets:
+    """مدرج HDR مبسط: دلاء لوغاريتمية-خطية بدقة نسبية ثابتة (~3%) ومدى واسع"""
+
+    SUB_BUCKETS = 32  # عدد الدلاء الخطية داخل كل قوة من قوى 2
+    UNIT = 1e-6       # أصغر وحدة مسجلة: ميكروثانية
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.total = 0
+        self.sum = 0.0
+
+    def _index(self, value: float) -> int:
+        units = max(1.0, value / self.UNIT)
+        exponent = int(math.log2(units))
+        fraction = units / (1 << exponent) - 1.0
+        return exponent * self.SUB_BUCKETS + int(fraction * self.SUB_BUCKETS)
+
+    def _upper_bound(self, index: int) -> float:
+        exponent, sub = divmod(index, self.SUB_BUCKETS)
+        return (1 << exponent) * (1.0 + (sub + 1) / self.SUB_BUCKETS) * self.UNIT
+
+    def record(self, value: float):
+        index = self._index(value)
+        self.counts[index] = self.counts.get(index, 0) + 1
+        self.total += 1
+        self.sum += value
+
+    def percentile(self, percentile: float) -> float:
+        if not self.total:
+            return 0.0
+        target = percentile * self.total
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= target:
+                return self._upper_bound(index)
+        return self._upper_bound(max(self.counts))
+
+    def cumulative(self, bounds: Sequence[float]) -> List[int]:
+        ordered = sorted(self.counts.items())
+        result, seen, position = [], 0, 0
+        for bound in bounds:
+            while position < len(ordered) and self._upper_bound(ordered[position][0]) <= bound:
+                seen += ordered[position][1]
+                position += 1
+            result.append(seen)
+        return result
+
+class Histogram(_Metric):
+    """مدرج لزمن الاستجابة بدقة HDR، يُعرض بدلاء Prometheus القياسية"""
+
+    metric_type = 'histogram'
+
+    def __init__(self, *args, export_buckets: Sequence[float] = DEFAULT_EXPORT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.export_buckets = tuple(export_buckets)
+        self._series: Dict[Tuple[str, ...], _HdrBuckets] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _HdrBuckets()
+            series.record(value)
+
+    def time(self, **labels):
+        """مدير سياق لقياس زمن كتلة برمجية"""
+        return _Timer(self, labels)
+
+    def percentile(self, percentile: float, **labels) -> float:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series.percentile(percentile) if series else 0.0
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        # الدلاء التراكمية تُحسب تحت القفل، والتنسيق على النسخة خارجه
+        with self._lock:
+            snapshot = [
+                (key, series.cumulative(self.export_buckets), series.total, series.sum)
+                for key, series in sorted(self._series.items())
+            ]
+        for key, cumulative, total, total_sum in snapshot:
+            labels = _format_labels(self.labelnames, key)
+            for bound, count in zip(self.export_buckets, cumulative):
+                bucket_labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            inf_labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {total}")
+            lines.append(f"{self.name}_sum{labels} {total_sum}")
+            lines.append(f"{self.name}_count{labels} {total}")
+        return lines
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+class MetricsRegistry:
+    """سجل مقاييس داخل العملية بتكلفة منخفضة، يُعرض بصيغة Prometheus النصية"""
+
+    def __init__(self, namespace: str = 'ghassan'):
+        self.namespace = namespace
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+        full_name = f"{self.namespace}_{name}"
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = self._metrics[full_name] = cls(full_name, documentation, labelnames, **kwargs)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        export_buckets: Optional[Sequence[float]] = None
+    ) -> Histogram:
+        kwargs = {'export_buckets': export_buckets} if export_buckets else {}
+        return self._get_or_create(Histogram, name, documentation, labelnames, **kwargs)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return '\n'.join(lines) + '\n'
+
+# السجل المشترك لجميع الخدمات
+metrics = MetricsRegistry()
+
+# مقاييس مشتركة تُستخدم في أكثر من خدمة
+http_request_duration = metrics.histogram(
+    'http_request_duration_seconds', 'API request latency', ('method', 'route', 'status')
+)
+http_requests_in_flight = metrics.gauge('http_requests_in_flight', 'API requests being processed')
+provider_call_duration = metrics.histogram(
+    'provider_call_duration_seconds', 'Outbound provider call latency', ('provider', 'outcome')
+)
+cache_requests = metrics.counter('cache_requests_total', 'Cache lookups', ('cache', 'result'))
+mongo_command_duration = metrics.histogram(
+    'mongo_command_duration_seconds', 'MongoDB command latency', ('collection', 'command', 'outcome')
+)
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """مستمع أوامر pymongo يسجل زمن كل أمر لكل مجموعة"""
+
+    def __init__(self):
+        self._pending: Dict[int, Tuple[str, str]] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = '-'
+        self._pending[event.request_id] = (collection, event.command_name)
+
+    def succeeded(self, event):
+        self._finish(event, 'success')
+
+    def failed(self, event):
+        self._finish(event, 'failure')
+
+    def _finish(self, event, outcome: str):
+        collection, command = self._pending.pop(event.request_id, ('-', event.command_name))
+        mongo_command_duration.observe(
+            event.duration_micros / 1_000_000,
+            collection=collection, command=command, outcome=outcome
+        )
@@ -6,6 +6,8 @@ from PyPDF2 import PdfReader
 from io import BytesIO
 import re
 
+from services.resilience import provider_resilience
+
 logger = logging.getLogger(__name__)
 
 class NizwaMagazineExtractor:
@@ -68,11 +70,13 @@ class NizwaMagazineExtractor:
         
         for pdf_url in pdf_urls:
             try:
-                # تنزيل PDF
-                response = requests.get(pdf_url, timeout=30)
+                # تنزيل PDF (في خيط منفصل حتى لا تُحجب حلقة الأحداث)
+                response = await provider_resilience.call(
+                    'nizwa', lambda: asyncio.to_thread(requests.get, pdf_url, timeout=30)
+                )
                 if response.status_code == 200:
-                    # استخراج النص من PDF
-                    content = self._extract_pdf_content(response.content)
+                    # استخراج النص من PDF (تحليل PyPDF2 متزامن وبطيء)
+                    content = await asyncio.to_thread(self._extract_pdf_content, response.content)
                     if content:
                         # تحليل المحتوى
                         analyzed = self._analyze_content(content, issue_num)
@@ -177,5 +181,4 @@ class NizwaMagazineExtractor:
         
         return formatted
 
-# إنشاء مثيل مستخرج نزوى
-nizwa_extractor = NizwaMagazineExtractor()
\ No newline at end of file
+# المثيل يُنشأ عند أول استخدام عبر service_registry.get('nizwa_extractor')
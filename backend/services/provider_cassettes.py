@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+class CassetteMissError(Exception):
+    """لا يوجد تسجيل مطابق للطلب في وضع الإعادة"""
+
+    def __init__(self, provider: str, key: str):
+        super().__init__(f"no recorded {provider} response for request {key[:12]}")
+        self.provider = provider
+        self.key = key
+
+class ProviderCassettes:
+    """تسجيل أزواج الطلب/الرد لمزودي الخدمات الخارجية وإعادتها محلياً بنفس زمن الاستجابة
+
+    الأوضاع (PROVIDER_MODE):
+    - live: استدعاء المزود الحقيقي فقط (الافتراضي)
+    - record: استدعاء المزود الحقيقي وحفظ الطلب والرد وزمن الاستجابة في ملف لكل مزود
+    - replay: عدم الاتصال بالشبكة إطلاقاً وإرجاع الرد المسجل بعد انتظار زمنه الأصلي
+
+    المسجَّل: Tavily (البحث والاستخراج)، LlmChat، Claude المباشر، تضمينات OpenAI، واجهة ويكيبيديا،
+    ونماذج LangChain للمحادثة. غير المسجَّل: تضمينات FAISS في LangChain (تُعطل في الإعادة بلا مفتاح)
+    ومهام الجمع والزحف الخلفية، فلا تُشغل في وضع الإعادة.
+    """
+
+    MODES = ('live', 'record', 'replay')
+
+    def __init__(self):
+        self.mode = os.environ.get('PROVIDER_MODE', 'live').lower()
+        if self.mode not in self.MODES:
+            logger.warning(f"وضع مزود غير معروف '{self.mode}' - سيُستخدم live")
+            self.mode = 'live'
+
+        self.cassette_dir = Path(os.environ.get('PROVIDER_CASSETTE_DIR', '/tmp/ghassan-cassettes'))
+        # عامل تسريع الإعادة: 1.0 = الزمن المسجل نفسه، 0 = بلا انتظار
+        self.replay_speed = float(os.environ.get('PROVIDER_REPLAY_SPEED', '1.0'))
+        # عند غياب تسجيل مطابق: reuse يعيد تسجيلاً حتمياً من نفس المزود، error يرفع استثناء
+        self.on_miss = os.environ.get('PROVIDER_REPLAY_MISS', 'reuse').lower()
+
+        self._entries: Dict[str, Dict[str, List[Dict[str, Any]]]] = {}
+        self._cursors: Dict[str, int] = {}
+        self._write_lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+        if self.mode != 'live':
+            logger.warning(f"مزودو الخدمات في وضع {self.mode} - المجلد: {self.cassette_dir}")
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    def request_key(self, provider: str, request: Dict[str, Any]) -> str:
+        """بصمة حتمية للطلب (المزود + المعاملات مرتبة)"""
+        canonical = json.dumps(request, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(f"{provider}\n{canonical}".encode('utf-8')).hexdigest()
+
+    async def call(
+        self,
+        provider: str,
+        request: Dict[str, Any],
+        live: Callable[[], Awaitable[Any]],
+        encode: Callable[[Any], Any] = lambda response: response,
+        decode: Callable[[Any], Any] = lambda payload: payload
+    ) -> Any:
+        """تنفيذ استدعاء مزود حسب الوضع الحالي
+
+        encode/decode يحولان الرد من وإلى صيغة قابلة للحفظ في JSON (مثل كائنات Anthropic).
+        """
+        if self.mode == 'live':
+            return await live()
+
+        stats = self.stats.setdefault(provider, {'recorded': 0, 'hits': 0, 'reused': 0, 'misses': 0})
+        key = self.request_key(provider, request)
+
+        if self.mode == 'record':
+            started = time.perf_counter()
+            response = await live()
+            await asyncio.to_thread(self._append, provider, {
+                'key': key,
+                'request': request,
+                'response': encode(response),
+                'latency_s': round(time.perf_counter() - started, 4)
+            })
+            stats['recorded'] += 1
+            return response
+
+        entry = self._lookup(provider, key, stats)
+        if self.replay_speed > 0:
+            await asyncio.sleep(entry['latency_s'] / self.replay_speed)
+        return decode(entry['response'])
+
+    def _lookup(self, provider: str, key: str, stats: Dict[str, int]) -> Dict[str, Any]:
+        entries = self._load(provider)
+
+        recordings = entries.get(key)
+        if recordings:
+            stats['hits'] += 1
+            # تدوير التسجيلات المتعددة لنفس الطلب للحفاظ على توزيع زمن الاستجابة
+            cursor = self._cursors.get(key, 0)
+            self._cursors[key] = cursor + 1
+            return recordings[cursor % len(recordings)]
+
+        if self.on_miss == 'reuse' and entries:
+            # اختيار حتمي من البصمة: نفس الطلب يعيد دائماً نفس الرد
+            stats['reused'] += 1
+            all_keys = sorted(entries)
+            return entries[all_keys[int(key, 16) % len(all_keys)]][0]
+
+        stats['misses'] += 1
+        raise CassetteMissError(provider, key)
+
+    def _path(self, provider: str) -> Path:
+        return self.cassette_dir / f"{provider}.jsonl"
+
+    def _load(self, provider: str) -> Dict[str, List[Dict[str, Any]]]:
+        if provider in self._entries:
+            return self._entries[provider]
+
+        entries: Dict[str, List[Dict[str, Any]]] = {}
+        path = self._path(provider)
+        if path.exists():
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        entries.setdefault(entry['key'], []).append(entry)
+            logger.info(f"تم تحميل {sum(len(v) for v in entries.values())} تسجيلاً لـ {provider}")
+        else:
+            logger.warning(f"لا يوجد ملف تسجيلات لـ {provider}: {path}")
+
+        self._entries[provider] = entries
+        return entries
+
+    def _append(self, provider: str, entry: Dict[str, Any]):
+        with self._write_lock:
+            self.cassette_dir.mkdir(parents=True, exist_ok=True)
+            with open(self._path(provider), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False, default=str) + '\n')
+
+    def get_cassette_stats(self) -> Dict[str, Any]:
+        """إحصائيات التسجيل والإعادة لكل مزود"""
+        return {
+            'mode': self.mode,
+            'cassette_dir': str(self.cassette_dir),
+            'replay_speed': self.replay_speed,
+            'providers': self.stats
+        }
+
+# مثيل واحد مشترك لجميع المزودين
+provider_cassettes = ProviderCassettes()
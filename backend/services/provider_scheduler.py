@@ -0,0 +1,159 @@
+import os
+import asyncio
+import contextvars
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Deque, Dict
+import logging
+
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+
+scheduler_in_flight = metrics.gauge(
+    'provider_scheduler_in_flight', 'Outbound provider calls running per class', ('provider', 'priority_class')
+)
+scheduler_queue_depth = metrics.gauge(
+    'provider_scheduler_queue_depth', 'Outbound provider calls waiting per class', ('provider', 'priority_class')
+)
+scheduler_wait = metrics.histogram(
+    'provider_scheduler_wait_seconds', 'Time an outbound provider call waited for a slot', ('priority_class',)
+)
+
+# فئة الأولوية للمهمة الحالية؛ المهام الفرعية ترثها تلقائياً عبر contextvars
+_priority_class: contextvars.ContextVar[str] = contextvars.ContextVar('provider_priority_class', default=INTERACTIVE)
+
+class _ProviderSlots:
+    """مقاعد الاستدعاءات المتزامنة لمزود واحد مع طابور لكل فئة"""
+
+    def __init__(self, capacity: int, batch_share: float):
+        self.capacity = capacity
+        # الدفعات لا تشغل أكثر من حصتها، فيبقى للمحادثة دائماً مقاعد فارغة
+        self.batch_limit = max(1, int(capacity * batch_share))
+        self.in_flight = {INTERACTIVE: 0, BATCH: 0}
+        self.waiters: Dict[str, Deque[asyncio.Future]] = {INTERACTIVE: deque(), BATCH: deque()}
+        self.completed = {INTERACTIVE: 0, BATCH: 0}
+
+    @property
+    def total_in_flight(self) -> int:
+        return self.in_flight[INTERACTIVE] + self.in_flight[BATCH]
+
+    def can_start(self, priority_class: str) -> bool:
+        if self.total_in_flight >= self.capacity:
+            return False
+        if priority_class == INTERACTIVE:
+            return True
+        # الدفعات تملأ السعة الخاملة فقط: لا محادثة تنتظر، وضمن الحصة المسموحة
+        return not self.waiters[INTERACTIVE] and self.in_flight[BATCH] < self.batch_limit
+
+class ProviderScheduler:
+    """جدولة الاستدعاءات الخارجية بفئتي أولوية: المحادثة التفاعلية تسبق دائماً الجمع في الخلفية"""
+
+    def __init__(self):
+        self.enabled = os.environ.get('SCHEDULER_ENABLED', 'true').lower() == 'true'
+        self.default_capacity = int(os.environ.get('PROVIDER_CONCURRENCY', '8'))
+        self.batch_share = float(os.environ.get('SCHEDULER_BATCH_SHARE', '0.5'))
+        self._slots: Dict[str, _ProviderSlots] = {}
+
+    def _get(self, provider: str) -> _ProviderSlots:
+        slots = self._slots.get(provider)
+        if slots is None:
+            # سعة خاصة بمزود معين، مثل PROVIDER_CONCURRENCY_TAVILY=4
+            capacity = int(os.environ.get(f'PROVIDER_CONCURRENCY_{provider.upper()}', str(self.default_capacity)))
+            slots = self._slots[provider] = _ProviderSlots(capacity, self.batch_share)
+        return slots
+
+    @contextmanager
+    def batch(self):
+        """تعليم كل الاستدعاءات الخارجية داخل الكتلة (والمهام المنشأة فيها) كعمل دفعي"""
+        token = _priority_class.set(BATCH)
+        try:
+            yield
+        finally:
+            _priority_class.reset(token)
+
+    @property
+    def current_class(self) -> str:
+        return _priority_class.get()
+
+    @asynccontextmanager
+    async def slot(self, provider: str):
+        """حجز مقعد لاستدعاء خارجي حسب فئة المهمة الحالية"""
+        if not self.enabled:
+            yield
+            return
+
+        priority_class = _priority_class.get()
+        slots = self._get(provider)
+        started = time.perf_counter()
+
+        if slots.can_start(priority_class) and not slots.waiters[priority_class]:
+            self._start(provider, slots, priority_class)
+        else:
+            future = asyncio.get_running_loop().create_future()
+            slots.waiters[priority_class].append(future)
+            self._publish(provider, slots)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self._finish(provider, slots, priority_class)
+                else:
+                    slots.waiters[priority_class].remove(future)
+                    self._publish(provider, slots)
+                raise
+
+        scheduler_wait.observe(time.perf_counter() - started, priority_class=priority_class)
+        try:
+            yield
+        finally:
+            self._finish(provider, slots, priority_class)
+
+    def _start(self, provider: str, slots: _ProviderSlots, priority_class: str):
+        slots.in_flight[priority_class] += 1
+        self._publish(provider, slots)
+
+    def _finish(self, provider: str, slots: _ProviderSlots, priority_class: str):
+        slots.in_flight[priority_class] -= 1
+        slots.completed[priority_class] += 1
+        self._dispatch(provider, slots)
+
+    def _dispatch(self, provider: str, slots: _ProviderSlots):
+        """تسليم المقاعد المتاحة: المحادثة أولاً ثم الدفعات ضمن حصتها"""
+        for priority_class in (INTERACTIVE, BATCH):
+            queue = slots.waiters[priority_class]
+            while queue and slots.can_start(priority_class):
+                future = queue.popleft()
+                if not future.done():
+                    slots.in_flight[priority_class] += 1
+                    future.set_result(True)
+        self._publish(provider, slots)
+
+    def _publish(self, provider: str, slots: _ProviderSlots):
+        for priority_class in (INTERACTIVE, BATCH):
+            scheduler_in_flight.set(slots.in_flight[priority_class], provider=provider, priority_class=priority_class)
+            scheduler_queue_depth.set(len(slots.waiters[priority_class]), provider=provider, priority_class=priority_class)
+
+    def get_scheduler_stats(self) -> Dict[str, Any]:
+        """السعة والاستدعاءات الجارية والمنتظرة لكل مزود وفئة"""
+        return {
+            'enabled': self.enabled,
+            'batch_share': self.batch_share,
+            'providers': {
+                provider: {
+                    'capacity': slots.capacity,
+                    'batch_limit': slots.batch_limit,
+                    'in_flight': dict(slots.in_flight),
+                    'queued': {name: len(queue) for name, queue in slots.waiters.items()},
+                    'completed': dict(slots.completed)
+                }
+                for provider, slots in self._slots.items()
+            }
+        }
+
+# مجدول مشترك لكل الاستدعاءات الخارجية في هذا العامل
+provider_scheduler = ProviderScheduler()
@@ -4,8 +4,8 @@ from datetime import datetime
 
 from models.literature_models import Author, LiteraryWork, AcademicSource
 from services.embeddings_service import EmbeddingsService
-from services.academic_collector import academic_collector
-from services.tavily_service import tavily_search_service
+from services.registry import service_registry
+from services.provider_scheduler import provider_scheduler
 
 logger = logging.getLogger(__name__)
 
@@ -34,7 +34,7 @@ class AdvancedRAGService:
             await self._log_search_query(user_query, session_id)
             
             # تحليل نوع الاستعلام
-            query_analysis = self._analyze_query_type(user_query)
+            query_analysis = await self._analyze_query_type(user_query)
             
             # البحث المتعدد المصادر
             search_results = await self._multi_source_search(user_query, query_analysis)
@@ -74,7 +74,7 @@ class AdvancedRAGService:
                 'sources_found': 0
             }
     
-    def _analyze_query_type(self, query: str) -> Dict[str, Any]:
+    async def _analyze_query_type(self, query: str) -> Dict[str, Any]:
         """تحليل نوع الاستعلام لتحسين البحث"""
         
         query_lower = query.lower()
@@ -88,7 +88,7 @@ class AdvancedRAGService:
         }
         
         # فحص إذا كان السؤال عن مؤلف معين
-        for author in academic_collector.known_omani_authors:
+        for author in (await service_registry.aget('academic_collector')).known_omani_authors:
             if author.lower() in query_lower:
                 analysis['type'] = 'author_specific'
                 analysis['target_author'] = author
@@ -122,12 +122,12 @@ class AdvancedRAGService:
             # البحث الخارجي بـ Tavily
             if query_analysis['target_author']:
                 # بحث مخصص للمؤلف
-                tavily_results = await tavily_search_service.search_specific_author(
+                tavily_results = await (await service_registry.aget('tavily_search')).search_specific_author(
                     query_analysis['target_author']
                 )
             else:
                 # بحث عام
-                tavily_results = await tavily_search_service.search_omani_literature_advanced(query)
+                tavily_results = await (await service_registry.aget('tavily_search')).search_omani_literature_advanced(query)
             
             search_results['results'] = tavily_results.get('results', [])
             search_results['sources'].append('tavily_advanced')
@@ -302,7 +302,7 @@ class AdvancedRAGService:
                 'query_text': query,
                 'user_session': session_id,
                 'timestamp': datetime.utcnow(),
-                'search_type': self._analyze_query_type(query)['type']
+                'search_type': (await self._analyze_query_type(query))['type']
             }
             
             await self.queries_collection.insert_one(query_record)
@@ -371,15 +371,20 @@ class AdvancedRAGService:
         try:
             logger.info("بدء الجمع التلقائي للمصادر الأكاديمية...")
             
-            # جمع المصادر الشاملة
-            collection_results = await academic_collector.collect_comprehensive_sources()
-            
-            # معالجة ومعداتة النتائج
-            processing_stats = await self._process_collected_sources(collection_results)
+            # جمع المصادر الشاملة ومعالجتها كعمل دفعي لا يزاحم المحادثة
+            with provider_scheduler.batch():
+                academic_collector = await service_registry.aget('academic_collector')
+                # نقاط الحفظ تجعل الإعادة بعد انقطاع تكمل ما بقي بدلاً من البدء من الصفر
+                academic_collector.attach_db(self.db)
+                collection_results = await academic_collector.collect_comprehensive_sources()
+                
+                # معالجة ومعداتة النتائج
+                processing_stats = await self._process_collected_sources(collection_results)
             
             return {
                 'collection_completed': True,
                 'sources_collected': collection_results['total_collected'],
+                'crawl': collection_results.get('crawl', {}),
                 'sources_processed': processing_stats['processed_count'],
                 'embeddings_created': processing_stats['embeddings_count'],
                 'completion_date': datetime.utcnow().isoformat()
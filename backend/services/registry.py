@@ -0,0 +1,152 @@
+import os
+import asyncio
+import importlib
+import inspect
+import threading
+import time
+from typing import Any, Dict
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ServiceUnavailableError(RuntimeError):
+    """تعذر إنشاء الخدمة (مفتاح مفقود أو اعتمادية غير مثبتة)"""
+
+    def __init__(self, name: str, reason: str):
+        super().__init__(f"service '{name}' unavailable: {reason}")
+        self.name = name
+        self.reason = reason
+
+class ServiceRegistry:
+    """سجل الخدمات الثقيلة: لا يُستورد الموديول ولا يُنشأ المثيل إلا عند أول استخدام
+
+    الخدمات تُسجل بمسار نصي 'module:attribute' حتى لا تُستورد اعتمادياتها
+    (tavily، anthropic، langchain، PyPDF2...) عند استيراد server.py.
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, str] = {}
+        self._instances: Dict[str, Any] = {}
+        self._load_times: Dict[str, float] = {}
+        self._errors: Dict[str, str] = {}
+        # فشل الإنشاء يُحفظ حتى لا يُعاد الاستيراد والإنشاء مع كل طلب؛ المهلة تتضاعف مع تكرار الفشل
+        self.retry_backoff = float(os.environ.get('SERVICE_RETRY_BACKOFF_SECONDS', '5'))
+        self.max_retry_backoff = float(os.environ.get('SERVICE_RETRY_MAX_BACKOFF_SECONDS', '300'))
+        self._failures: Dict[str, int] = {}
+        self._retry_at: Dict[str, float] = {}
+        # الإحماء قد ينشئ الخدمات في خيط منفصل بالتزامن مع الطلبات
+        self._lock = threading.RLock()
+        # مسارات الحلقة تنتظر على قفل asyncio لكل خدمة بدلاً من قفل الخيوط، فلا تُحجب الحلقة
+        self._async_locks: Dict[str, asyncio.Lock] = {}
+
+    def register(self, name: str, factory_path: str):
+        self._factories[name] = factory_path
+
+    def get(self, name: str) -> Any:
+        """إرجاع مثيل الخدمة وإنشاؤه عند أول طلب"""
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        if name not in self._factories:
+            raise KeyError(f"unknown service '{name}'")
+
+        if time.monotonic() < self._retry_at.get(name, 0.0):
+            raise ServiceUnavailableError(name, self._errors[name])
+
+        with self._lock:
+            instance = self._instances.get(name)
+            if instance is not None:
+                return instance
+            if time.monotonic() < self._retry_at.get(name, 0.0):
+                raise ServiceUnavailableError(name, self._errors[name])
+
+            module_path, attribute = self._factories[name].split(':')
+            started = time.perf_counter()
+            try:
+                factory = getattr(importlib.import_module(module_path), attribute)
+                instance = factory()
+            except Exception as e:
+                self._errors[name] = f"{type(e).__name__}: {e}"
+                self._failures[name] = self._failures.get(name, 0) + 1
+                backoff = min(self.max_retry_backoff, self.retry_backoff * 2 ** (self._failures[name] - 1))
+                self._retry_at[name] = time.monotonic() + backoff
+                logger.error(f"تعذر إنشاء الخدمة {name}: {e} - إعادة المحاولة بعد {backoff:.0f}s")
+                raise ServiceUnavailableError(name, str(e)) from e
+
+            self._load_times[name] = time.perf_counter() - started
+            self._errors.pop(name, None)
+            self._failures.pop(name, None)
+            self._retry_at.pop(name, None)
+            self._instances[name] = instance
+        logger.info(f"تم إنشاء الخدمة {name} خلال {self._load_times[name] * 1000:.0f}ms")
+        return instance
+
+    async def aget(self, name: str) -> Any:
+        """get لمسارات الحلقة: الاستيراد والإنشاء في خيط منفصل، والانتظار على قفل asyncio
+
+        get المتزامن من الحلقة يحجبها طوال الاستيراد (ثوانٍ لـ LangChain/FAISS)، أو طوال
+        انتظار قفل الخيوط إن كان خيط الإحماء ينشئ الخدمة نفسها.
+        """
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        lock = self._async_locks.setdefault(name, asyncio.Lock())
+        async with lock:
+            return await asyncio.to_thread(self.get, name)
+
+    async def aavailable(self, name: str) -> bool:
+        try:
+            await self.aget(name)
+            return True
+        except ServiceUnavailableError:
+            return False
+
+    def available(self, name: str) -> bool:
+        """هل يمكن استخدام الخدمة؟ (ينشئها إن لم تكن منشأة)"""
+        try:
+            self.get(name)
+            return True
+        except ServiceUnavailableError:
+            return False
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    async def shutdown(self):
+        """إغلاق موارد الخدمات المنشأة فقط (الجلسات والعملاء)"""
+        for name, instance in list(self._instances.items()):
+            close = getattr(instance, 'aclose', None) or getattr(instance, 'close', None)
+            if close is None:
+                continue
+            try:
+                result = close()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.error(f"خطأ في إغلاق الخدمة {name}: {e}")
+        self._instances.clear()
+
+    def get_registry_stats(self) -> Dict[str, Any]:
+        """حالة كل خدمة: منشأة أم لا، وزمن إنشائها، وآخر خطأ"""
+        return {
+            name: {
+                'loaded': name in self._instances,
+                'load_time_ms': round(self._load_times[name] * 1000, 1) if name in self._load_times else None,
+                'error': self._errors.get(name),
+                'retry_in_s': round(max(0.0, self._retry_at[name] - time.monotonic()), 1) if name in self._retry_at else None
+            }
+            for name in sorted(self._factories)
+        }
+
+# السجل المشترك؛ المصانع تستدعي أصناف الخدمات مباشرة
+service_registry = ServiceRegistry()
+service_registry.register('tavily_search', 'services.tavily_service:TavilyAdvancedSearchService')
+service_registry.register('web_search', 'services.search_service:WebSearchService')
+service_registry.register('ghassan_llm', 'services.llm_service:GhassanLLMService')
+service_registry.register('claude_direct', 'services.claude_service:ClaudeDirectService')
+service_registry.register('nizwa_extractor', 'services.nizwa_extractor:NizwaMagazineExtractor')
+service_registry.register('simple_collector', 'services.simple_collector:SimpleSourceCollector')
+service_registry.register('academic_collector', 'services.academic_collector:AcademicSourceCollector')
+service_registry.register('advanced_ghassan', 'services.langchain_service:AdvancedGhassanService')
@@ -0,0 +1,304 @@
+import os
+import asyncio
+import contextvars
+import functools
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, Optional
+import logging
+
+from services.metrics import provider_call_duration, metrics
+from services.provider_scheduler import provider_scheduler
+
+logger = logging.getLogger(__name__)
+
+provider_short_circuits = metrics.counter(
+    'provider_short_circuits_total', 'Calls rejected by an open circuit breaker', ('provider',)
+)
+
+class CircuitOpenError(Exception):
+    """المزود متوقف مؤقتاً لأن قاطع الدائرة مفتوح"""
+
+    def __init__(self, provider: str, retry_in: float):
+        super().__init__(f"{provider} circuit open, retry in {retry_in:.0f}s")
+        self.provider = provider
+        self.retry_in = retry_in
+
+class ProviderSaturatedError(Exception):
+    """كل خيوط المزود مشغولة باستدعاءات عالقة (مهلتها انتهت لكن الخيط ما زال يعمل)"""
+
+    def __init__(self, provider: str, busy: int):
+        super().__init__(f"{provider} thread pool saturated ({busy} calls still running)")
+        self.provider = provider
+        self.busy = busy
+
+class CircuitBreaker:
+    """قاطع دائرة لمزود خارجي واحد: مغلق ← مفتوح ← نصف مفتوح"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        failure_rate: float = 0.5,
+        window_size: int = 20,
+        reset_timeout: float = 30.0
+    ):
+        self.failure_threshold = failure_threshold
+        self.failure_rate = failure_rate
+        self.reset_timeout = reset_timeout
+        self.outcomes = deque(maxlen=window_size)
+
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.times_opened = 0
+
+    def allow_request(self) -> bool:
+        """هل يُسمح بطلب جديد الآن؟ في الحالة نصف المفتوحة يُسمح بطلب تجريبي واحد"""
+        if self.state == self.CLOSED:
+            return True
+
+        if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = self.HALF_OPEN
+            self.probe_in_flight = False
+
+        if self.state == self.HALF_OPEN and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+
+        return False
+
+    def retry_in(self) -> float:
+        """الثواني المتبقية قبل السماح بطلب تجريبي"""
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self):
+        self.outcomes.append(True)
+        self.consecutive_failures = 0
+        if self.state != self.CLOSED:
+            logger.info("قاطع الدائرة: عودة المزود للعمل")
+        self.state = self.CLOSED
+        self.probe_in_flight = False
+
+    def record_failure(self):
+        self.outcomes.append(False)
+        self.consecutive_failures += 1
+
+        failures = self.outcomes.count(False)
+        rate_exceeded = (
+            len(self.outcomes) >= self.outcomes.maxlen // 2
+            and failures / len(self.outcomes) >= self.failure_rate
+        )
+
+        if (
+            self.state == self.HALF_OPEN
+            or self.consecutive_failures >= self.failure_threshold
+            or rate_exceeded
+        ):
+            self._open()
+
+    def _open(self):
+        if self.state != self.OPEN:
+            self.times_opened += 1
+        self.state = self.OPEN
+        self.opened_at = time.monotonic()
+        self.probe_in_flight = False
+
+class AdaptiveTimeout:
+    """مهلة تُتعلم من مئين زمن الاستجابة الأخير لمزود"""
+
+    def __init__(
+        self,
+        initial: float,
+        minimum: float,
+        maximum: float,
+        percentile: float = 0.99,
+        multiplier: float = 1.5,
+        min_samples: int = 20
+    ):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.percentile = percentile
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self.samples = deque(maxlen=200)
+
+    def record(self, latency: float):
+        self.samples.append(latency)
+
+    def current(self) -> float:
+        """المهلة الحالية بالثواني"""
+        if len(self.samples) < self.min_samples:
+            return self.initial
+
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile))
+        return min(self.maximum, max(self.minimum, ordered[index] * self.multiplier))
+
+class ProviderResilience:
+    """طبقة مرونة مشتركة: قاطع دائرة ومهلة تكيفية لكل مزود خارجي"""
+
+    # (المهلة الأولية، الحد الأدنى، الحد الأقصى) بالثواني
+    PROVIDER_TIMEOUTS = {
+        'tavily': (15.0, 3.0, 30.0),
+        'openai': (45.0, 5.0, 90.0),
+        'anthropic': (60.0, 5.0, 120.0),
+        'wikipedia': (5.0, 1.0, 10.0),
+        'nizwa': (30.0, 5.0, 60.0),
+    }
+
+    def __init__(self):
+        self.failure_threshold = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', '5'))
+        self.reset_timeout = float(os.environ.get('BREAKER_RESET_TIMEOUT', '30'))
+
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.timeouts: Dict[str, AdaptiveTimeout] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+
+        # عملاء المزودين المتزامنون (مثل TavilyClient) يعملون في مجمع خيوط خاص بكل مزود: انتهاء
+        # المهلة لا يوقف الخيط، فلو شاركوا المجمع الافتراضي لملأته الخيوط العالقة وتعطلت معها
+        # كل القراءات المحلية عبر asyncio.to_thread (التخزين المشترك، الفهارس، التضمينات)
+        self.default_threads = int(os.environ.get('PROVIDER_THREADS', '8'))
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+        self._busy_threads: Dict[str, int] = {}
+        self._thread_limits: Dict[str, int] = {}
+
+    async def run_blocking(self, provider: str, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """تشغيل استدعاء متزامن لمزود في مجمع خيوطه المحدود، ورفضه فوراً عند امتلاء المجمع"""
+        executor = self._executors.get(provider)
+        if executor is None:
+            threads = int(os.environ.get(f'PROVIDER_THREADS_{provider.upper()}', str(self.default_threads)))
+            self._thread_limits[provider] = threads
+            executor = self._executors[provider] = ThreadPoolExecutor(
+                max_workers=threads, thread_name_prefix=f'provider-{provider}'
+            )
+
+        busy = self._busy_threads.get(provider, 0)
+        if busy >= self._thread_limits[provider]:
+            raise ProviderSaturatedError(provider, busy)
+
+        # الخيط يُحتسب مشغولاً حتى ينتهي فعلاً، لا حتى تنتهي مهلة المستدعي
+        self._busy_threads[provider] = busy + 1
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        future = executor.submit(functools.partial(context.run, func, *args, **kwargs))
+        # رد النداء على مستقبل الخيط نفسه: يُستدعى عند انتهاء الاستدعاء فعلاً حتى بعد إلغاء المنتظر
+        future.add_done_callback(lambda _: self._release_from_thread(loop, provider))
+        return await asyncio.wrap_future(future)
+
+    def _release_from_thread(self, loop: asyncio.AbstractEventLoop, provider: str):
+        try:
+            loop.call_soon_threadsafe(self._release_thread, provider)
+        except RuntimeError:  # الحلقة أُغلقت عند إيقاف الخادم
+            pass
+
+    def _release_thread(self, provider: str):
+        self._busy_threads[provider] -= 1
+
+    def shutdown(self):
+        """إيقاف مجمعات خيوط المزودين دون انتظار الاستدعاءات العالقة"""
+        for executor in self._executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        self._executors.clear()
+
+    def _get(self, provider: str):
+        if provider not in self.breakers:
+            initial, minimum, maximum = self.PROVIDER_TIMEOUTS.get(provider, (30.0, 3.0, 60.0))
+            self.breakers[provider] = CircuitBreaker(
+                failure_threshold=self.failure_threshold,
+                reset_timeout=self.reset_timeout
+            )
+            self.timeouts[provider] = AdaptiveTimeout(initial, minimum, maximum)
+            self.stats[provider] = {
+                'calls': 0, 'successes': 0, 'failures': 0, 'timeouts': 0, 'short_circuited': 0
+            }
+        return self.breakers[provider], self.timeouts[provider], self.stats[provider]
+
+    def is_available(self, provider: str) -> bool:
+        """فحص سريع دون استهلاك الطلب التجريبي: هل المزود متاح؟"""
+        breaker, _, _ = self._get(provider)
+        if breaker.state == CircuitBreaker.CLOSED:
+            return True
+        if breaker.state == CircuitBreaker.HALF_OPEN:
+            return not breaker.probe_in_flight
+        return breaker.retry_in() == 0.0
+
+    async def call(
+        self,
+        provider: str,
+        func: Callable[[], Awaitable[Any]],
+        fallback: Optional[Callable[[], Any]] = None
+    ) -> Any:
+        """تنفيذ استدعاء خارجي عبر قاطع الدائرة والمهلة التكيفية مع بديل سريع اختياري"""
+        breaker, adaptive_timeout, stats = self._get(provider)
+        stats['calls'] += 1
+
+        if not breaker.allow_request():
+            stats['short_circuited'] += 1
+            provider_short_circuits.inc(provider=provider)
+            if fallback is not None:
+                return fallback()
+            raise CircuitOpenError(provider, breaker.retry_in())
+
+        try:
+            # الانتظار في المجدول لا يُحتسب من مهلة المزود ولا من زمن الاستجابة
+            async with provider_scheduler.slot(provider):
+                timeout = adaptive_timeout.current()
+                started = time.perf_counter()
+                result = await asyncio.wait_for(func(), timeout=timeout)
+        except asyncio.CancelledError:
+            # الإلغاء (مثل خسارة طلب احتياطي) ليس فشلاً للمزود
+            breaker.probe_in_flight = False
+            raise
+        except asyncio.TimeoutError:
+            stats['timeouts'] += 1
+            stats['failures'] += 1
+            breaker.record_failure()
+            provider_call_duration.observe(time.perf_counter() - started, provider=provider, outcome='timeout')
+            logger.warning(f"انتهت مهلة {provider} بعد {timeout:.1f} ثانية")
+            if fallback is not None:
+                return fallback()
+            raise
+        except Exception:
+            stats['failures'] += 1
+            breaker.record_failure()
+            provider_call_duration.observe(time.perf_counter() - started, provider=provider, outcome='error')
+            if fallback is not None:
+                return fallback()
+            raise
+
+        latency = time.perf_counter() - started
+        adaptive_timeout.record(latency)
+        provider_call_duration.observe(latency, provider=provider, outcome='success')
+        stats['successes'] += 1
+        breaker.record_success()
+        return result
+
+    def get_breaker_states(self) -> Dict[str, Any]:
+        """حالة قواطع الدائرة والمهل الحالية لكل مزود"""
+        providers = {}
+        for provider, breaker in self.breakers.items():
+            providers[provider] = {
+                'state': breaker.state,
+                'consecutive_failures': breaker.consecutive_failures,
+                'times_opened': breaker.times_opened,
+                'retry_in_seconds': round(breaker.retry_in(), 1) if breaker.state != CircuitBreaker.CLOSED else 0.0,
+                'current_timeout_seconds': round(self.timeouts[provider].current(), 2),
+                'busy_threads': self._busy_threads.get(provider, 0),
+                **self.stats[provider]
+            }
+
+        return {
+            'failure_threshold': self.failure_threshold,
+            'reset_timeout_seconds': self.reset_timeout,
+            'providers': providers
+        }
+
+# مثيل واحد مشترك لجميع الخدمات
+provider_resilience = ProviderResilience()
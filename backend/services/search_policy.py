@@ -0,0 +1,217 @@
+import os
+import math
+import random
+import re
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+import logging
+
+from services.metrics import metrics
+from services.provider_scheduler import provider_scheduler, BATCH
+
+logger = logging.getLogger(__name__)
+
+search_policy_decisions = metrics.counter(
+    'search_policy_decisions_total', 'Search plans chosen per query class and depth', ('query_class', 'depth')
+)
+search_policy_credits_saved = metrics.counter(
+    'search_policy_credits_saved_total', 'Tavily credits saved against always-advanced search'
+)
+search_policy_latency_saved = metrics.counter(
+    'search_policy_latency_saved_seconds_total', 'Estimated search latency saved against always-advanced search'
+)
+
+# تكلفة Tavily بالرصيد لكل بحث حسب العمق
+DEPTH_CREDITS = {'basic': 1, 'advanced': 2}
+
+DEFINITION_PATTERN = re.compile(r'^\s*(?:ما هو|ما هي|من هو|من هي|ما معنى|ما المقصود|عرّف|عرف|تعريف)')
+ANALYSIS_PATTERN = re.compile(r'حلل|تحليل|نقد|قارن|مقارنة|أسلوب|رمزية|دلالة|اتجاهات|تطور')
+
+class SearchPolicy:
+    """اختيار عمق البحث وعدد النتائج والنطاقات لكل فئة استعلام، والتعلم من فائدة النتائج السابقة
+
+    الفائدة = نسبة النتائج المعادة التي استُخدمت فعلاً: المنعكسة في نص إجابة المحادثة، أو الروابط
+    المعروضة للمستخدم، أو العناصر المحفوظة في الجمع (لا كل ما دخل رسالة النموذج).
+    البحث المتقدم يُختار فقط عندما تتفوق فائدته على الأساسي بهامش كافٍ وضمن ميزانية الزمن.
+    """
+
+    # الإعدادات الابتدائية لكل فئة قبل توفر عينات كافية
+    DEFAULT_PLANS = {
+        'definition': {'search_depth': 'basic', 'max_results': 3, 'domains': 'journalism'},
+        'analysis': {'search_depth': 'advanced', 'max_results': 5, 'domains': 'journalism'},
+        'general': {'search_depth': 'basic', 'max_results': 5, 'domains': 'journalism'},
+        'external_links': {'search_depth': 'basic', 'max_results': 6, 'domains': 'journalism'},
+        'collection': {'search_depth': 'advanced', 'max_results': 3, 'domains': 'scholarly'},
+    }
+
+    def __init__(self):
+        self.enabled = os.environ.get('SEARCH_POLICY_ENABLED', 'true').lower() == 'true'
+        self.min_samples = int(os.environ.get('SEARCH_POLICY_MIN_SAMPLES', '10'))
+        self.advanced_min_gain = float(os.environ.get('SEARCH_POLICY_ADVANCED_GAIN', '0.1'))
+        self.exploration_rate = float(os.environ.get('SEARCH_POLICY_EXPLORATION', '0.1'))
+        # زمن البحث المتقدم المفترض قبل قياسه فعلياً
+        self.advanced_latency_estimate = float(os.environ.get('SEARCH_POLICY_ADVANCED_LATENCY', '3.0'))
+
+        self.stats: Dict[str, Dict[str, Dict[str, float]]] = {}
+        self._pending: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self.savings = {'searches': 0, 'credits_used': 0, 'credits_saved': 0, 'latency_saved_seconds': 0.0}
+
+    def classify(self, query: str) -> str:
+        """فئة الاستعلام من نصه وسياق التنفيذ"""
+        if provider_scheduler.current_class == BATCH:
+            return 'collection'
+        if DEFINITION_PATTERN.search(query):
+            return 'definition'
+        if ANALYSIS_PATTERN.search(query):
+            return 'analysis'
+        return 'general'
+
+    def _bucket(self, query_class: str, depth: str) -> Dict[str, float]:
+        return self.stats.setdefault(query_class, {}).setdefault(depth, {
+            'searches': 0, 'latency_sum': 0.0, 'results_returned': 0,
+            'reported_searches': 0, 'reported_returned': 0, 'results_used': 0
+        })
+
+    def usefulness(self, query_class: str, depth: str) -> Optional[float]:
+        bucket = self._bucket(query_class, depth)
+        if bucket['reported_searches'] < self.min_samples:
+            return None
+        if not bucket['reported_returned']:
+            return 0.0
+        return bucket['results_used'] / bucket['reported_returned']
+
+    def mean_latency(self, query_class: str, depth: str) -> Optional[float]:
+        bucket = self._bucket(query_class, depth)
+        return bucket['latency_sum'] / bucket['searches'] if bucket['searches'] else None
+
+    def _advanced_latency(self, query_class: str) -> float:
+        latency = self.mean_latency(query_class, 'advanced')
+        if latency is None:
+            measured = [
+                self.mean_latency(name, 'advanced') for name in self.stats
+                if self.mean_latency(name, 'advanced') is not None
+            ]
+            latency = sum(measured) / len(measured) if measured else self.advanced_latency_estimate
+        return latency
+
+    def plan(
+        self,
+        query: str,
+        query_class: Optional[str] = None,
+        max_results: int = 5,
+        latency_budget: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """خطة البحث: العمق وعدد النتائج وفئة النطاقات"""
+        query_class = query_class or self.classify(query)
+        default = self.DEFAULT_PLANS.get(query_class, self.DEFAULT_PLANS['general'])
+        plan = {
+            'plan_id': uuid.uuid4().hex,
+            'query_class': query_class,
+            'search_depth': 'advanced',
+            'max_results': max_results,
+            'domains': default['domains'],
+            'reason': 'policy_disabled'
+        }
+        if not self.enabled:
+            return plan
+
+        depth, reason = self._choose_depth(query_class, default['search_depth'])
+
+        # ميزانية الزمن تتقدم على الفائدة: لا بحث متقدم إن كان متوسطه يتجاوزها
+        if depth == 'advanced' and latency_budget is not None and self._advanced_latency(query_class) > latency_budget:
+            depth, reason = 'basic', 'latency_budget'
+
+        plan.update(search_depth=depth, reason=reason, max_results=self._result_budget(query_class, depth, max_results))
+        search_policy_decisions.inc(query_class=query_class, depth=depth)
+        return plan
+
+    def _choose_depth(self, query_class: str, default_depth: str):
+        basic = self.usefulness(query_class, 'basic')
+        advanced = self.usefulness(query_class, 'advanced')
+
+        if basic is None or advanced is None:
+            # عينات غير كافية: الإعداد الافتراضي مع استكشاف أعلى لجمع المقارنة
+            if random.random() < max(self.exploration_rate, 0.2):
+                return ('advanced' if default_depth == 'basic' else 'basic'), 'exploration'
+            return default_depth, 'default'
+
+        best = 'advanced' if advanced - basic >= self.advanced_min_gain else 'basic'
+        if random.random() < self.exploration_rate:
+            return ('advanced' if best == 'basic' else 'basic'), 'exploration'
+        return best, 'learned'
+
+    def _result_budget(self, query_class: str, depth: str, requested: int) -> int:
+        """عدد النتائج المطلوب: ما يُستخدم فعلاً في المتوسط مع هامش، ولا يتجاوز ما طلبه المستدعي"""
+        bucket = self._bucket(query_class, depth)
+        if bucket['reported_searches'] < self.min_samples:
+            return requested
+        used_per_search = bucket['results_used'] / bucket['reported_searches']
+        return max(2, min(requested, math.ceil(used_per_search * 1.5) + 1))
+
+    def record_search(self, plan: Dict[str, Any], latency: float, results_returned: int):
+        """تسجيل زمن البحث وعدد نتائجه، وحساب التوفير مقارنة بالبحث المتقدم دائماً"""
+        if not self.enabled:
+            return
+        query_class, depth = plan['query_class'], plan['search_depth']
+        bucket = self._bucket(query_class, depth)
+        bucket['searches'] += 1
+        bucket['latency_sum'] += latency
+        bucket['results_returned'] += results_returned
+
+        self.savings['searches'] += 1
+        self.savings['credits_used'] += DEPTH_CREDITS[depth]
+        if depth == 'basic':
+            credits_saved = DEPTH_CREDITS['advanced'] - DEPTH_CREDITS['basic']
+            latency_saved = max(0.0, self._advanced_latency(query_class) - latency)
+            self.savings['credits_saved'] += credits_saved
+            self.savings['latency_saved_seconds'] += latency_saved
+            search_policy_credits_saved.inc(credits_saved)
+            search_policy_latency_saved.inc(latency_saved)
+
+        self._pending[plan['plan_id']] = {'query_class': query_class, 'depth': depth, 'returned': results_returned}
+        if len(self._pending) > 1000:
+            self._pending.popitem(last=False)
+
+    def record_usage(self, search_result: Dict[str, Any], results_used: int):
+        """تسجيل عدد نتائج بحث معين وصلت للسياق النهائي (مرة واحدة لكل بحث)"""
+        plan = (search_result or {}).get('search_plan') or {}
+        pending = self._pending.pop(plan.get('plan_id'), None)
+        if pending is None:
+            return
+        bucket = self._bucket(pending['query_class'], pending['depth'])
+        bucket['reported_searches'] += 1
+        bucket['reported_returned'] += pending['returned']
+        bucket['results_used'] += min(results_used, pending['returned'])
+
+    def get_policy_stats(self) -> Dict[str, Any]:
+        """الفائدة والزمن لكل فئة وعمق، والتوفير مقارنة بالبحث المتقدم دائماً"""
+        classes = {}
+        for query_class, depths in self.stats.items():
+            classes[query_class] = {}
+            for depth, bucket in depths.items():
+                usefulness = self.usefulness(query_class, depth)
+                latency = self.mean_latency(query_class, depth)
+                classes[query_class][depth] = {
+                    'searches': bucket['searches'],
+                    'mean_latency_ms': round(latency * 1000, 1) if latency is not None else None,
+                    'usage_reports': bucket['reported_searches'],
+                    'usefulness': round(usefulness, 3) if usefulness is not None else None
+                }
+
+        always_advanced_credits = self.savings['searches'] * DEPTH_CREDITS['advanced']
+        return {
+            'enabled': self.enabled,
+            'classes': classes,
+            'savings': {
+                **self.savings,
+                'latency_saved_seconds': round(self.savings['latency_saved_seconds'], 2),
+                'always_advanced_credits': always_advanced_credits,
+                'credit_savings_rate': round(
+                    self.savings['credits_saved'] / always_advanced_credits, 3
+                ) if always_advanced_credits else 0.0
+            }
+        }
+
+# مثيل واحد لكل عامل
+search_policy = SearchPolicy()
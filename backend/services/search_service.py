@@ -1,18 +1,59 @@
+import os
 import asyncio
 import aiohttp
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import logging
 from urllib.parse import quote
 import re
 import random
+import time
+
+from services.resilience import provider_resilience
+from services.provider_cassettes import provider_cassettes
+from services.metrics import metrics
+from services.wiki_mirror import wikipedia_mirror
 
 logger = logging.getLogger(__name__)
 
+web_search_leg_seconds = metrics.histogram(
+    'web_search_leg_seconds', 'Duration of each source lookup in a web search', ('leg',)
+)
+web_search_deadline_misses = metrics.counter(
+    'web_search_deadline_misses_total', 'Source lookups cancelled by the web search deadline', ('leg',)
+)
+
 class WebSearchService:
     def __init__(self):
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
         }
+        # مهلة إجمالية للبحث: المصادر تُستعلم معاً وما لم ينتهِ قبلها يُلغى
+        self.deadline = float(os.environ.get('WEB_SEARCH_DEADLINE', '4.0'))
+        self.request_timeout = float(os.environ.get('WEB_SEARCH_REQUEST_TIMEOUT', '8.0'))
+        self.connection_limit = int(os.environ.get('WEB_SEARCH_MAX_CONNECTIONS', '20'))
+        self.connection_limit_per_host = int(os.environ.get('WEB_SEARCH_MAX_CONNECTIONS_PER_HOST', '5'))
+        self.dns_cache_ttl = int(os.environ.get('WEB_SEARCH_DNS_CACHE_TTL', '300'))
+        self.keepalive_timeout = float(os.environ.get('WEB_SEARCH_KEEPALIVE', '30'))
+        self._session: Optional[aiohttp.ClientSession] = None
+    
+    def _get_session(self) -> aiohttp.ClientSession:
+        """جلسة HTTP مشتركة طويلة العمر: ذاكرة DNS، واتصالات مُبقاة، وحدود للاتصالات والمهلات"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.connection_limit,
+                limit_per_host=self.connection_limit_per_host,
+                ttl_dns_cache=self.dns_cache_ttl,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            timeout = aiohttp.ClientTimeout(total=self.request_timeout, connect=min(3.0, self.request_timeout))
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout, headers=self.headers)
+        return self._session
+    
+    async def aclose(self):
+        """إغلاق الجلسة المشتركة عند إيقاف الخادم (عبر service_registry.shutdown)"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
     
     async def search_omani_literature(self, query: str) -> List[Dict[str, Any]]:
         """البحث الدقيق في مصادر الأدب العُماني الموثوقة"""
@@ -20,20 +61,19 @@ class WebSearchService:
             # تحسين الاستعلام للحصول على نتائج أكثر دقة
             enhanced_query = self._enhance_query_for_accuracy(query)
             
-            # البحث في ويكيبيديا العربية أولاً
-            wikipedia_results = await self._search_arabic_wikipedia(enhanced_query)
-            
-            # البحث في مصادر أكاديمية عُمانية
-            academic_results = await self._search_academic_sources(enhanced_query)
-            
-            # البحث في المصادر الحكومية العُمانية
-            official_results = await self._search_official_omani_sources(enhanced_query)
+            # ويكيبيديا العربية والمصادر الأكاديمية والحكومية العُمانية معاً:
+            # زمن البحث زمن أبطأ مصدر (حتى المهلة الإجمالية) لا مجموع الأزمنة
+            legs = await self._gather_with_deadline({
+                'wikipedia': self._search_arabic_wikipedia(enhanced_query, local_query=query),
+                'academic': self._search_academic_sources(enhanced_query),
+                'official': self._search_official_omani_sources(enhanced_query)
+            })
             
             # دمج النتائج مع ترجيح المصادر الموثوقة
             all_results = self._prioritize_reliable_sources([
-                *wikipedia_results,
-                *academic_results, 
-                *official_results
+                *legs.get('wikipedia', []),
+                *legs.get('academic', []),
+                *legs.get('official', [])
             ])
             
             return all_results[:3]  # أفضل 3 نتائج موثوقة فقط
@@ -42,6 +82,31 @@ class WebSearchService:
             logger.error(f"خطأ في البحث: {e}")
             return []
     
+    async def _gather_with_deadline(self, legs: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+        """تشغيل المصادر بالتوازي وإرجاع ما انتهى منها قبل المهلة؛ الباقي يُلغى"""
+        started = time.perf_counter()
+        
+        async def timed(name, coroutine):
+            try:
+                return await coroutine
+            finally:
+                web_search_leg_seconds.observe(time.perf_counter() - started, leg=name)
+        
+        tasks = {name: asyncio.create_task(timed(name, coroutine)) for name, coroutine in legs.items()}
+        await asyncio.wait(tasks.values(), timeout=self.deadline)
+        
+        results = {}
+        for name, task in tasks.items():
+            if not task.done():
+                task.cancel()
+                web_search_deadline_misses.inc(leg=name)
+                logger.warning(f"تجاوز مصدر البحث {name} المهلة الإجمالية ({self.deadline:.1f} ثانية)")
+            elif task.exception() is not None:
+                logger.error(f"خطأ في مصدر البحث {name}: {task.exception()}")
+            else:
+                results[name] = task.result()
+        return results
+    
     def _enhance_query_for_accuracy(self, query: str) -> str:
         """تحسين الاستعلام للحصول على نتائج دقيقة"""
         # إضافة كلمات مفتاحية للدقة
@@ -148,9 +213,20 @@ class WebSearchService:
         
         return sorted_results
     
-    async def _search_arabic_wikipedia(self, query: str) -> List[Dict[str, Any]]:
-        """البحث في ويكيبيديا العربية"""
+    async def _search_arabic_wikipedia(self, query: str, local_query: Optional[str] = None) -> List[Dict[str, Any]]:
+        """البحث في ويكيبيديا العربية (النسخة المحلية أولاً، ثم الواجهة الشبكية)"""
         results = []
+        # السؤال الأصلي للنسخة المحلية: إضافات تحسين الاستعلام تخفض تغطية المصطلحات
+        articles = await wikipedia_mirror.search(local_query or query)
+        if articles:
+            return [{
+                'title': article['title'],
+                'content': article['summary'][:500],
+                'url': article['url'],
+                'source': 'ويكيبيديا العربية',
+                'relevance_score': 0.9
+            } for article in articles]
+        
         try:
             # إضافة كلمات مفتاحية عُمانية للبحث
             omani_query = f"{query} عُمان أدب عُماني"
@@ -159,18 +235,24 @@ class WebSearchService:
             # API ويكيبيديا العربية
             wikipedia_api = f"https://ar.wikipedia.org/api/rest_v1/page/summary/{encoded_query}"
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(wikipedia_api, headers=self.headers) as response:
+            async def fetch_summary():
+                async with self._get_session().get(wikipedia_api) as response:
                     if response.status == 200:
-                        data = await response.json()
-                        if 'extract' in data:
-                            results.append({
-                                'title': data.get('title', ''),
-                                'content': data.get('extract', '')[:500],
-                                'url': data.get('content_urls', {}).get('desktop', {}).get('page', ''),
-                                'source': 'ويكيبيديا العربية',
-                                'relevance_score': 0.9
-                            })
+                        return await response.json()
+                    return {}
+            
+            # تخطي ويكيبيديا فوراً إذا كان قاطع الدائرة مفتوحاً
+            data = await provider_resilience.call('wikipedia', lambda: provider_cassettes.call(
+                'wikipedia', {'url': wikipedia_api}, fetch_summary
+            ), fallback=dict)
+            if 'extract' in data:
+                results.append({
+                    'title': data.get('title', ''),
+                    'content': data.get('extract', '')[:500],
+                    'url': data.get('content_urls', {}).get('desktop', {}).get('page', ''),
+                    'source': 'ويكيبيديا العربية',
+                    'relevance_score': 0.9
+                })
         except Exception as e:
             logger.error(f"خطأ في البحث في ويكيبيديا: {e}")
         
@@ -237,5 +319,4 @@ class WebSearchService:
         
         return key_terms[:3]  # أهم 3 مصطلحات
 
-# مثيل واحد للخدمة
-web_search_service = WebSearchService()
\ No newline at end of file
+# المثيل يُنشأ عند أول استخدام عبر service_registry.get('web_search')
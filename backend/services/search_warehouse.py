@@ -0,0 +1,454 @@
+import os
+import asyncio
+import hashlib
+import re
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import logging
+
+from pymongo import UpdateOne
+
+from services.metrics import metrics
+from services.provider_scheduler import provider_scheduler, BATCH
+from services.registry import service_registry
+
+try:
+    import numpy as np
+except ImportError:  # بدون numpy يعمل المستودع بالفهرس النصي فقط
+    np = None
+
+logger = logging.getLogger(__name__)
+
+warehouse_lookups = metrics.counter(
+    'search_warehouse_lookups_total', 'Searches answered from (or missed by) the local warehouse', ('outcome',)
+)
+warehouse_documents = metrics.counter(
+    'search_warehouse_documents_total', 'Fetched results written to the local warehouse', ('outcome',)
+)
+warehouse_refresh_queue = metrics.gauge('search_warehouse_refresh_queue', 'Stale queries waiting for a background refresh')
+
+# معاملات التتبع لا تغير الصفحة، فتُحذف من الرابط الموحد
+TRACKING_PARAMS = re.compile(r'^(utm_\w+|fbclid|gclid|mc_cid|mc_eid|ref|ref_src)$')
+# المحتوى الأقصر من هذا قد يتكرر في صفحات مختلفة (مقتطفات عامة)، فلا يُطابق بالبصمة
+MIN_HASHED_CONTENT = 200
+
+# حقول النتيجة المعالجة التي تُحفظ؛ درجة الصلة والكلمات العُمانية تُحسب من جديد لكل استعلام
+STORED_FIELDS = (
+    'title', 'content', 'url', 'score', 'journalism_score', 'source_type',
+    'reliability_rating', 'published_date', 'raw_content'
+)
+
+def canonical_url(url: str) -> str:
+    """رابط موحد للمقارنة: نطاق بأحرف صغيرة بلا www، بلا معاملات تتبع أو مرساة أو شرطة أخيرة"""
+    try:
+        parts = urlsplit(url.strip())
+        host = (parts.hostname or '').lower()
+        port = parts.port
+    except ValueError:
+        return url.strip()
+
+    if host.startswith('www.'):
+        host = host[4:]
+    if port and port not in (80, 443):
+        host = f'{host}:{port}'
+
+    path = re.sub(r'/{2,}', '/', parts.path or '/')
+    if len(path) > 1:
+        path = path.rstrip('/')
+    query = urlencode(sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not TRACKING_PARAMS.match(key.lower())
+    ))
+    scheme = 'https' if parts.scheme in ('http', 'https') else parts.scheme
+    return urlunsplit((scheme, host, path, query, ''))
+
+def content_hash(text: str) -> str:
+    """بصمة المحتوى بعد توحيد المسافات وحالة الأحرف"""
+    normalized = ' '.join((text or '').lower().split())
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()
+
+class SearchWarehouse:
+    """مستودع محلي دائم لكل نتيجة بحث مجلوبة من الشبكة
+
+    كل نتيجة تُحفظ مرة واحدة حسب رابطها الموحد، والصفحات المكررة بروابط مختلفة
+    تُدمج حسب بصمة المحتوى. البحث اللاحق يُجاب من المستودع (فهرس نصي في MongoDB،
+    ومتجهات في الذاكرة كاحتياط) قبل الذهاب للشبكة، والنتائج القديمة تُقدم مع
+    جدولة تحديث استعلامها في الخلفية.
+    """
+
+    def __init__(self):
+        self.enabled = os.environ.get('SEARCH_WAREHOUSE_ENABLED', 'true').lower() == 'true'
+        # النتيجة حديثة خلال هذه المدة، وتُقدم قديمةً (مع تحديث في الخلفية) حتى الحد الأقصى
+        self.fresh_for = timedelta(hours=float(os.environ.get('SEARCH_WAREHOUSE_FRESH_HOURS', '168')))
+        self.max_age = timedelta(days=float(os.environ.get('SEARCH_WAREHOUSE_MAX_AGE_DAYS', '30')))
+        self.retention_days = int(os.environ.get('SEARCH_WAREHOUSE_RETENTION_DAYS', '180'))
+        # شروط الإجابة محلياً: عدد نتائج كافٍ، وكل نتيجة تغطي معظم كلمات الاستعلام
+        self.min_hits = int(os.environ.get('SEARCH_WAREHOUSE_MIN_HITS', '3'))
+        self.min_coverage = float(os.environ.get('SEARCH_WAREHOUSE_MIN_COVERAGE', '0.6'))
+        self.min_similarity = float(os.environ.get('SEARCH_WAREHOUSE_MIN_SIMILARITY', '0.75'))
+
+        self.vectors_enabled = np is not None and os.environ.get('SEARCH_WAREHOUSE_VECTORS', 'true').lower() == 'true'
+        self.vector_limit = int(os.environ.get('SEARCH_WAREHOUSE_VECTOR_LIMIT', '20000'))
+        self.maintenance_interval = float(os.environ.get('SEARCH_WAREHOUSE_MAINTENANCE_INTERVAL', '300'))
+        self.refresh_batch = int(os.environ.get('SEARCH_WAREHOUSE_REFRESH_BATCH', '5'))
+        self.embed_batch = int(os.environ.get('SEARCH_WAREHOUSE_EMBED_BATCH', '50'))
+
+        self.db = None
+        self.collection = None
+        self._embeddings = None
+        self._task: Optional[asyncio.Task] = None
+        self._writes: Set[asyncio.Task] = set()
+        self._refresh_queue: 'OrderedDict[str, None]' = OrderedDict()
+        # آخر تحديث لكل استعلام، حتى لا يُعاد استعلام لم تتغير نتائجه في كل دورة
+        self._refreshed_at: 'OrderedDict[str, datetime]' = OrderedDict()
+        # استعلامات محادثة يُحسب تضمينها في الخلفية لاستخدامه في المرة القادمة
+        self._embedding_queries: Set[str] = set()
+
+        # فهرس المتجهات في الذاكرة: (معرفات المستندات، صفوف مطبّعة) يُستبدلان معاً
+        self._vector_index = ([], None)
+        self._vector_rows: Dict[str, int] = {}
+        self._vectors_loaded_at = datetime.min
+
+        self.stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'vector_assisted': 0, 'refreshed': 0, 'embedded': 0}
+
+    def attach_db(self, db):
+        self.db = db
+        self.collection = db.search_documents
+
+    async def ensure_indexes(self):
+        """فهرس نصي للبحث، وبصمة المحتوى للدمج، وحذف تلقائي لما لم يظهر منذ مدة الاحتفاظ"""
+        if self.collection is None:
+            return
+        # اللغة none: تقطيع بلا اشتقاق (MongoDB لا يدعم اشتقاق العربية)
+        await self.collection.create_index(
+            [('title', 'text'), ('content', 'text')],
+            weights={'title': 3, 'content': 1}, default_language='none', name='search_text'
+        )
+        await self.collection.create_index('content_hash')
+        await self.collection.create_index('fetched_at')
+        await self.collection.create_index('last_seen_at', expireAfterSeconds=self.retention_days * 86400)
+
+    def start(self):
+        """بدء الصيانة الدورية: تحديث الاستعلامات القديمة وتضمين المستندات الجديدة"""
+        if self.enabled and self._task is None and self.collection is not None:
+            self._task = asyncio.create_task(self._maintenance_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._writes:
+            await asyncio.gather(*self._writes, return_exceptions=True)
+
+    async def lookup(
+        self,
+        query: str,
+        max_results: int,
+        include_domains: Optional[List[str]] = None
+    ) -> Optional[List[Dict[str, Any]]]:
+        """نتائج محلية كافية للاستعلام، أو None للذهاب للشبكة"""
+        if not self.enabled or self.collection is None:
+            return None
+
+        words = [word for word in query.lower().split() if len(word) > 2]
+        if not words:
+            return None
+        needed = max(1, min(max_results, self.min_hits))
+
+        try:
+            now = datetime.utcnow()
+            documents = await self._lexical_candidates(words, max_results * 4, now - self.max_age)
+            documents = [doc for doc in documents if self._matches_domains(doc, include_domains)]
+
+            if len(documents) < needed and self._vector_index[0]:
+                extra = await self._vector_candidates(query, max_results * 2, now - self.max_age)
+                seen = {doc['_id'] for doc in documents}
+                extra = [doc for doc in extra if doc['_id'] not in seen and self._matches_domains(doc, include_domains)]
+                if extra:
+                    self.stats['vector_assisted'] += 1
+                documents += extra
+
+            if len(documents) < needed:
+                self.stats['misses'] += 1
+                warehouse_lookups.inc(outcome='miss')
+                return None
+
+            documents = documents[:max_results * 2]
+            stale_queries = [
+                doc['queries'][-1] for doc in documents
+                if doc['fetched_at'] < now - self.fresh_for and doc.get('queries')
+            ]
+            for stale_query in stale_queries:
+                self._schedule_refresh(stale_query)
+
+            outcome = 'stale_hit' if stale_queries else 'hit'
+            self.stats['stale_hits' if stale_queries else 'hits'] += 1
+            warehouse_lookups.inc(outcome=outcome)
+            return [{field: doc.get(field) for field in STORED_FIELDS} for doc in documents]
+
+        except Exception as e:
+            logger.error(f"خطأ في البحث في المستودع المحلي: {e}")
+            return None
+
+    async def _lexical_candidates(self, words: List[str], limit: int, oldest: datetime) -> List[Dict[str, Any]]:
+        """مرشحو الفهرس النصي مرتبين بالدرجة، مع استبعاد ما لا يغطي معظم كلمات الاستعلام"""
+        cursor = self.collection.find(
+            {'$text': {'$search': ' '.join(words)}, 'fetched_at': {'$gte': oldest}},
+            {'score': {'$meta': 'textScore'}, 'embedding': 0}
+        ).sort([('score', {'$meta': 'textScore'})]).limit(limit)
+
+        documents = []
+        async for doc in cursor:
+            text = f"{doc.get('title', '')} {doc.get('content', '')}".lower()
+            coverage = sum(1 for word in words if word in text) / len(words)
+            if coverage >= self.min_coverage:
+                documents.append(doc)
+        return documents
+
+    async def _vector_candidates(self, query: str, limit: int, oldest: datetime) -> List[Dict[str, Any]]:
+        embeddings = self._get_embeddings()
+        if embeddings is None:
+            return []
+        if provider_scheduler.current_class == BATCH:
+            query_vector = await embeddings._generate_embedding(query)
+        else:
+            # مسار المحادثة لا ينتظر استدعاء التضمين: المتجه المخزن فقط، والحساب للمرة القادمة في الخلفية
+            query_vector = await embeddings.cached_embedding(query)
+            if query_vector is None:
+                self._embed_query_in_background(embeddings, query)
+        if not query_vector:
+            return []
+
+        scored = await asyncio.to_thread(self._nearest, query_vector, limit)
+        ids = [doc_id for doc_id, similarity in scored if similarity >= self.min_similarity]
+        if not ids:
+            return []
+
+        cursor = self.collection.find({'_id': {'$in': ids}, 'fetched_at': {'$gte': oldest}}, {'embedding': 0})
+        by_id = {doc['_id']: doc async for doc in cursor}
+        return [by_id[doc_id] for doc_id in ids if doc_id in by_id]
+
+    def _embed_query_in_background(self, embeddings, query: str):
+        if query in self._embedding_queries or len(self._embedding_queries) >= 100:
+            return
+        self._embedding_queries.add(query)
+        with provider_scheduler.batch():
+            task = asyncio.create_task(embeddings._generate_embedding(query))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+        task.add_done_callback(lambda _: self._embedding_queries.discard(query))
+
+    def _nearest(self, query_vector: List[float], limit: int):
+        ids, matrix = self._vector_index
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if not norm:
+            return []
+        scores = matrix @ (query / norm)
+        top = np.argsort(-scores)[:limit]
+        return [(ids[index], float(scores[index])) for index in top]
+
+    @staticmethod
+    def _matches_domains(doc: Dict[str, Any], include_domains: Optional[List[str]]) -> bool:
+        if not include_domains:
+            return True
+        domain = doc.get('domain', '')
+        return any(domain == allowed or domain.endswith(f'.{allowed}') for allowed in include_domains)
+
+    def store_in_background(self, query: str, results: List[Dict[str, Any]]):
+        """حفظ النتائج دون إبطاء الطلب الحالي"""
+        if not self.enabled or self.collection is None or not results:
+            return
+        task = asyncio.create_task(self.store(query, results))
+        self._writes.add(task)
+        task.add_done_callback(self._writes.discard)
+
+    async def store(self, query: str, results: List[Dict[str, Any]]):
+        """إدراج النتائج أو تحديث طوابعها الزمنية، مع دمج المكرر حسب الرابط الموحد وبصمة المحتوى"""
+        try:
+            now = datetime.utcnow()
+            incoming: Dict[str, Dict[str, Any]] = {}
+            for result in results:
+                if not result.get('url'):
+                    continue
+                doc_id = canonical_url(result['url'])
+                incoming.setdefault(doc_id, {
+                    **{field: result.get(field) for field in STORED_FIELDS},
+                    'domain': urlsplit(doc_id).hostname or '',
+                    'content_hash': content_hash(result.get('content', ''))
+                })
+            if not incoming:
+                return
+
+            hashes = [
+                doc['content_hash'] for doc in incoming.values()
+                if len(doc.get('content') or '') >= MIN_HASHED_CONTENT
+            ]
+            existing = {}
+            async for doc in self.collection.find(
+                {'$or': [{'_id': {'$in': list(incoming)}}, {'content_hash': {'$in': hashes}}]},
+                {'content_hash': 1}
+            ):
+                existing[doc['_id']] = doc.get('content_hash')
+            owner_by_hash = {content: doc_id for doc_id, content in existing.items() if content in hashes}
+
+            operations = []
+            for doc_id, fields in incoming.items():
+                owner = owner_by_hash.get(fields['content_hash'])
+                seen = {'last_seen_at': now, 'fetched_at': now}
+                remember_query = {'$push': {'queries': {'$each': [query], '$slice': -5}}}
+
+                if owner is not None and owner != doc_id:
+                    # نفس المحتوى برابط آخر: تسجيل الرابط كاسم بديل للمستند الموجود
+                    operations.append(UpdateOne({'_id': owner}, {
+                        '$set': seen, '$addToSet': {'alias_urls': fields['url']}, **remember_query
+                    }))
+                    warehouse_documents.inc(outcome='duplicate')
+                elif doc_id in existing and existing[doc_id] == fields['content_hash']:
+                    operations.append(UpdateOne({'_id': doc_id}, {'$set': seen, **remember_query}))
+                    warehouse_documents.inc(outcome='unchanged')
+                else:
+                    update = {
+                        '$set': {**fields, **seen},
+                        '$setOnInsert': {'first_seen_at': now},
+                        **remember_query
+                    }
+                    if doc_id in existing:
+                        # المحتوى تغير: التضمين القديم لم يعد يمثله
+                        update['$unset'] = {'embedding': '', 'embedded_at': ''}
+                    operations.append(UpdateOne({'_id': doc_id}, update, upsert=True))
+                    if fields['content_hash'] in hashes:
+                        owner_by_hash.setdefault(fields['content_hash'], doc_id)
+                    warehouse_documents.inc(outcome='updated' if doc_id in existing else 'inserted')
+
+            await self.collection.bulk_write(operations, ordered=False)
+
+        except Exception as e:
+            logger.error(f"خطأ في حفظ نتائج البحث في المستودع المحلي: {e}")
+
+    def _schedule_refresh(self, query: str):
+        refreshed_at = self._refreshed_at.get(query)
+        if refreshed_at is not None and refreshed_at > datetime.utcnow() - self.fresh_for:
+            return
+        self._refresh_queue[query] = None
+        self._refresh_queue.move_to_end(query)
+        while len(self._refresh_queue) > 500:
+            self._refresh_queue.popitem(last=False)
+        warehouse_refresh_queue.set(len(self._refresh_queue))
+
+    async def _maintenance_loop(self):
+        # تحميل فهرس المتجهات المحفوظ عند الإقلاع، لا بعد أول دورة صيانة
+        if self.vectors_enabled and self._get_embeddings() is not None:
+            try:
+                await self._load_vectors()
+                logger.info(f"تم تحميل {len(self._vector_index[0])} متجهاً لفهرس المستودع المحلي")
+            except Exception as e:
+                logger.error(f"خطأ في تحميل فهرس متجهات المستودع المحلي: {e}")
+
+        while True:
+            await asyncio.sleep(self.maintenance_interval)
+            # أعمال الصيانة تستهلك حصة الدفعات فقط ولا تزاحم المحادثة
+            with provider_scheduler.batch():
+                try:
+                    await self._refresh_stale()
+                    if self.vectors_enabled:
+                        await self._embed_new_documents()
+                        await self._load_vectors()
+                except Exception as e:
+                    logger.error(f"خطأ في صيانة المستودع المحلي: {e}")
+
+    async def _refresh_stale(self):
+        """إعادة تنفيذ الاستعلامات التي قُدمت نتائجها قديمة، فيُحدّث البحث المستودع"""
+        for _ in range(min(self.refresh_batch, len(self._refresh_queue))):
+            query, _ = self._refresh_queue.popitem(last=False)
+            warehouse_refresh_queue.set(len(self._refresh_queue))
+            await (await service_registry.aget('tavily_search')).search_omani_literature_advanced(query, refresh=True)
+            self._refreshed_at[query] = datetime.utcnow()
+            if len(self._refreshed_at) > 5000:
+                self._refreshed_at.popitem(last=False)
+            self.stats['refreshed'] += 1
+
+    def _get_embeddings(self):
+        if self._embeddings is None and self.vectors_enabled and self.db is not None:
+            try:
+                from services.embeddings_service import EmbeddingsService
+                self._embeddings = EmbeddingsService(self.db)
+            except ImportError as e:
+                logger.warning(f"فهرس المتجهات للمستودع غير متاح: {e}")
+                self.vectors_enabled = False
+                return None
+            if not self._embeddings.openai_api_key:
+                self.vectors_enabled = False
+                self._embeddings = None
+        return self._embeddings
+
+    async def _embed_new_documents(self):
+        embeddings = self._get_embeddings()
+        if embeddings is None:
+            return
+        cursor = self.collection.find(
+            {'embedding': {'$exists': False}}, {'title': 1, 'content': 1}
+        ).sort('fetched_at', -1).limit(self.embed_batch)
+        async for doc in cursor:
+            vector = await embeddings._generate_embedding(f"{doc.get('title', '')}\n{doc.get('content', '')}")
+            if vector:
+                await self.collection.update_one(
+                    {'_id': doc['_id']}, {'$set': {'embedding': vector, 'embedded_at': datetime.utcnow()}}
+                )
+                self.stats['embedded'] += 1
+
+    async def _load_vectors(self):
+        """إضافة المتجهات الجديدة أو المحدثة منذ آخر تحميل إلى الفهرس في الذاكرة"""
+        since = self._vectors_loaded_at
+        cursor = self.collection.find(
+            {'embedded_at': {'$gt': since}}, {'embedding': 1, 'embedded_at': 1}
+        ).sort('embedded_at', 1).limit(self.vector_limit)
+        updates = [(doc['_id'], doc['embedding'], doc['embedded_at']) async for doc in cursor]
+        if updates:
+            await asyncio.to_thread(self._merge_vectors, updates)
+            self._vectors_loaded_at = updates[-1][2]
+
+    def _merge_vectors(self, updates):
+        vectors = np.asarray([vector for _, vector, _ in updates], dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+        ids, matrix = self._vector_index
+        ids = list(ids)
+        matrix = None if matrix is None else matrix.copy()
+        added = []
+        for (doc_id, _, _), vector in zip(updates, vectors):
+            row = self._vector_rows.get(doc_id)
+            if row is not None:
+                matrix[row] = vector
+            else:
+                self._vector_rows[doc_id] = len(ids)
+                ids.append(doc_id)
+                added.append(vector)
+
+        if added:
+            matrix = np.vstack(added) if matrix is None else np.vstack([matrix, np.vstack(added)])
+        # استبدال الفهرس كاملاً، فالبحث الجاري في خيط آخر يرى النسخة القديمة أو الجديدة فقط
+        self._vector_index = (ids, matrix)
+
+    async def get_warehouse_stats(self) -> Dict[str, Any]:
+        """حجم المستودع وحداثته ونسبة الإجابة المحلية"""
+        if self.collection is None:
+            return {'enabled': False}
+        now = datetime.utcnow()
+        lookups = self.stats['hits'] + self.stats['stale_hits'] + self.stats['misses']
+        return {
+            'enabled': self.enabled,
+            'documents': await self.collection.estimated_document_count(),
+            'fresh_documents': await self.collection.count_documents({'fetched_at': {'$gte': now - self.fresh_for}}),
+            'vector_index_size': len(self._vector_index[0]),
+            'vectors_enabled': self.vectors_enabled,
+            'refresh_queue': len(self._refresh_queue),
+            'local_answer_rate': round((self.stats['hits'] + self.stats['stale_hits']) / lookups, 3) if lookups else 0.0,
+            **self.stats
+        }
+
+# مثيل واحد لكل عامل (المستندات نفسها مشتركة في MongoDB)
+search_warehouse = SearchWarehouse()
@@ -0,0 +1,384 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import logging
+
+from services.metrics import metrics, cache_requests
+
+try:
+    import lmdb
+except ImportError:  # اعتمادية اختيارية؛ البديل sqlite المدمج
+    lmdb = None
+
+logger = logging.getLogger(__name__)
+
+worker_memory = metrics.gauge('worker_resident_memory_bytes', 'Resident memory of this worker process')
+
+def _resident_memory_bytes() -> int:
+    """الذاكرة المقيمة للعملية الحالية (RSS)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class _SqliteBackend:
+    """مخزن مشترك بين العمليات عبر sqlite بوضع WAL (قفل الملفات يتولاه sqlite)"""
+
+    name = 'sqlite'
+
+    def __init__(self, directory: Path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(directory / 'shared_cache.sqlite3'), check_same_thread=False, timeout=5)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS entries ('
+            'namespace TEXT, key TEXT, value TEXT, created_at REAL, expires_at REAL, '
+            'PRIMARY KEY (namespace, key))'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS entries_age ON entries (namespace, created_at)')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS worker_stats ('
+            'pid INTEGER, namespace TEXT, hits INTEGER, misses INTEGER, memory_bytes INTEGER, updated_at REAL, '
+            'PRIMARY KEY (pid, namespace))'
+        )
+        self._conn.commit()
+
+    def get(self, namespace: str, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?', (namespace, key)
+            ).fetchone()
+        return {'value': row[0], 'expires_at': row[1]} if row else None
+
+    def put(self, namespace: str, key: str, value: str, expires_at: float):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)',
+                (namespace, key, value, time.time(), expires_at)
+            )
+            self._conn.commit()
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._conn.execute('DELETE FROM entries WHERE namespace = ? AND key = ?', (namespace, key))
+            self._conn.commit()
+
+    def prune(self, namespace: str, max_entries: int) -> int:
+        """حذف المنتهي ثم الأقدم حتى لا يتجاوز العدد الحد الأقصى"""
+        with self._lock:
+            removed = self._conn.execute(
+                'DELETE FROM entries WHERE namespace = ? AND expires_at < ?', (namespace, time.time())
+            ).rowcount
+            count = self._conn.execute('SELECT COUNT(*) FROM entries WHERE namespace = ?', (namespace,)).fetchone()[0]
+            if count > max_entries:
+                removed += self._conn.execute(
+                    'DELETE FROM entries WHERE rowid IN ('
+                    'SELECT rowid FROM entries WHERE namespace = ? ORDER BY created_at LIMIT ?)',
+                    (namespace, count - max_entries)
+                ).rowcount
+            self._conn.commit()
+        return removed
+
+    def count(self, namespace: str) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM entries WHERE namespace = ?', (namespace,)).fetchone()[0]
+
+    def report_worker(self, namespace: str, hits: int, misses: int, memory_bytes: int):
+        with self._lock:
+            self._conn.execute(
+                'INSERT INTO worker_stats VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT (pid, namespace) DO UPDATE SET '
+                'hits = hits + excluded.hits, misses = misses + excluded.misses, '
+                'memory_bytes = excluded.memory_bytes, updated_at = excluded.updated_at',
+                (os.getpid(), namespace, hits, misses, memory_bytes, time.time())
+            )
+            self._conn.commit()
+
+    def worker_rows(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT pid, namespace, hits, misses, memory_bytes, updated_at FROM worker_stats'
+            ).fetchall()
+        return [dict(zip(('pid', 'namespace', 'hits', 'misses', 'memory_bytes', 'updated_at'), row)) for row in rows]
+
+    def prune_workers(self, older_than: float) -> int:
+        with self._lock:
+            removed = self._conn.execute('DELETE FROM worker_stats WHERE updated_at < ?', (older_than,)).rowcount
+            self._conn.commit()
+        return removed
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class _LmdbBackend:
+    """مخزن مشترك عبر LMDB: قراءات متزامنة بلا أقفال وكاتب واحد في كل لحظة"""
+
+    name = 'lmdb'
+
+    def __init__(self, directory: Path, map_size: int):
+        self._env = lmdb.open(str(directory / 'shared_cache.lmdb'), map_size=map_size, max_dbs=16, subdir=True)
+        self._dbs: Dict[str, Any] = {}
+        self._stats_db = self._db('__worker_stats__')
+
+    def _db(self, namespace: str):
+        if namespace not in self._dbs:
+            self._dbs[namespace] = self._env.open_db(namespace.encode())
+        return self._dbs[namespace]
+
+    def get(self, namespace: str, key: str) -> Optional[Dict[str, Any]]:
+        with self._env.begin(db=self._db(namespace)) as txn:
+            raw = txn.get(key.encode())
+        return json.loads(raw) if raw else None
+
+    def put(self, namespace: str, key: str, value: str, expires_at: float):
+        record = json.dumps({'value': value, 'created_at': time.time(), 'expires_at': expires_at})
+        with self._env.begin(db=self._db(namespace), write=True) as txn:
+            txn.put(key.encode(), record.encode())
+
+    def delete(self, namespace: str, key: str):
+        with self._env.begin(db=self._db(namespace), write=True) as txn:
+            txn.delete(key.encode())
+
+    def prune(self, namespace: str, max_entries: int) -> int:
+        now = time.time()
+        removed = 0
+        with self._env.begin(db=self._db(namespace), write=True) as txn:
+            live = []
+            for key, raw in txn.cursor():
+                record = json.loads(raw)
+                if record['expires_at'] < now:
+                    txn.delete(key)
+                    removed += 1
+                else:
+                    live.append((record['created_at'], key))
+            if len(live) > max_entries:
+                for _, key in sorted(live)[:len(live) - max_entries]:
+                    txn.delete(key)
+                    removed += 1
+        return removed
+
+    def count(self, namespace: str) -> int:
+        with self._env.begin(db=self._db(namespace)) as txn:
+            return txn.stat(self._db(namespace))['entries']
+
+    def report_worker(self, namespace: str, hits: int, misses: int, memory_bytes: int):
+        key = f"{os.getpid()}:{namespace}".encode()
+        with self._env.begin(db=self._stats_db, write=True) as txn:
+            raw = txn.get(key)
+            row = json.loads(raw) if raw else {'pid': os.getpid(), 'namespace': namespace, 'hits': 0, 'misses': 0}
+            row['hits'] += hits
+            row['misses'] += misses
+            row['memory_bytes'] = memory_bytes
+            row['updated_at'] = time.time()
+            txn.put(key, json.dumps(row).encode())
+
+    def worker_rows(self) -> List[Dict[str, Any]]:
+        with self._env.begin(db=self._stats_db) as txn:
+            return [json.loads(raw) for _, raw in txn.cursor()]
+
+    def prune_workers(self, older_than: float) -> int:
+        removed = 0
+        with self._env.begin(db=self._stats_db, write=True) as txn:
+            for key, raw in list(txn.cursor()):
+                if json.loads(raw).get('updated_at', 0) < older_than:
+                    txn.delete(key)
+                    removed += 1
+        return removed
+
+    def close(self):
+        self._env.close()
+
+class SharedCache:
+    """طبقة تخزين مؤقت مشتركة بين عمال uvicorn على نفس الجهاز (نتائج البحث، التضمينات، الإجابات)"""
+
+    # مدة الصلاحية الافتراضية (ثوانٍ) والحد الأقصى للمدخلات وأقصى حجم تقديري للمدخل (بايت) لكل نطاق
+    # التضمينات تُخزن float32 مرمزة base64 (‏1536 بعداً ≈ 8KB، و12KB بعد تقريب صفحات LMDB)
+    NAMESPACES = {
+        'search': (6 * 3600, 5000, 32 * 1024),
+        'embeddings': (30 * 24 * 3600, 50000, 12 * 1024),
+        'answers': (3600, 2000, 16 * 1024),
+    }
+
+    def __init__(self):
+        self.enabled = os.environ.get('SHARED_CACHE_ENABLED', 'true').lower() == 'true'
+        self.directory = Path(os.environ.get('SHARED_CACHE_DIR', '/tmp/ghassan-cache'))
+        self.requested_backend = os.environ.get('SHARED_CACHE_BACKEND', 'auto').lower()
+        # حجم خريطة LMDB الافتراضي يتسع لكل النطاقات عند حدودها القصوى مع هامش 25%
+        self.required_map_size = int(sum(cap * entry_bytes for _, cap, entry_bytes in self.NAMESPACES.values()) * 1.25)
+        self.map_size = int(os.environ.get('SHARED_CACHE_LMDB_MAP_SIZE', str(self.required_map_size)))
+        self.prune_every = int(os.environ.get('SHARED_CACHE_PRUNE_EVERY', '200'))
+        self.report_interval = float(os.environ.get('SHARED_CACHE_REPORT_INTERVAL', '10'))
+        # عامل لم ينشر تقريراً خلال هذه المدة انتهى (إعادة تشغيل أو تدوير)، فلا تُحسب ذاكرته ولا عداداته
+        self.worker_stale_after = self.report_interval * 3
+
+        self._backend = None
+        self._open_lock = threading.Lock()
+        self._writes: Dict[str, int] = {}
+        # عدادات هذا العامل منذ آخر تقرير للمخزن المشترك
+        self._pending: Dict[str, Dict[str, int]] = {}
+        self._totals: Dict[str, Dict[str, int]] = {}
+        self._report_task: Optional[asyncio.Task] = None
+
+    def _open(self):
+        if self._backend is None:
+            with self._open_lock:
+                if self._backend is None:
+                    self.directory.mkdir(parents=True, exist_ok=True)
+                    use_lmdb = lmdb is not None and self.requested_backend in ('auto', 'lmdb')
+                    if self.requested_backend == 'lmdb' and lmdb is None:
+                        logger.warning("LMDB غير مثبت - استخدام sqlite للتخزين المشترك")
+                    if use_lmdb and self.map_size < self.required_map_size:
+                        logger.warning(
+                            f"حجم خريطة LMDB ({self.map_size // (1024 * 1024)}MB) أصغر من حدود النطاقات "
+                            f"({self.required_map_size // (1024 * 1024)}MB) - قد تفشل الكتابة قبل التقليم"
+                        )
+                    self._backend = _LmdbBackend(self.directory, self.map_size) if use_lmdb else _SqliteBackend(self.directory)
+                    logger.info(f"التخزين المؤقت المشترك: {self._backend.name} في {self.directory}")
+        return self._backend
+
+    async def _backend_ready(self):
+        """المخزن المفتوح؛ الفتح الأول (إنشاء الملفات وتهيئة LMDB/sqlite) يُنفذ في خيط منفصل لا في الحلقة"""
+        if self._backend is not None:
+            return self._backend
+        return await asyncio.to_thread(self._open)
+
+    async def open(self):
+        """فتح المخزن وبدء التقرير الدوري (يُستدعى في الإحماء)"""
+        if not self.enabled:
+            return
+        await self._backend_ready()
+        if self._report_task is None:
+            self._report_task = asyncio.create_task(self._periodic_report())
+
+    async def close(self):
+        if self._report_task is not None:
+            self._report_task.cancel()
+            self._report_task = None
+        if self._backend is not None:
+            await self._report()
+            self._backend.close()
+            self._backend = None
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        canonical = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+    async def get(self, namespace: str, key: str) -> Optional[Any]:
+        """القيمة المخزنة أو None عند عدم وجودها أو انتهاء صلاحيتها"""
+        if not self.enabled:
+            return None
+        try:
+            backend = await self._backend_ready()
+            record = await asyncio.to_thread(backend.get, namespace, key)
+        except Exception as e:
+            logger.error(f"خطأ في قراءة التخزين المشترك: {e}")
+            return None
+
+        if record is None or record['expires_at'] < time.time():
+            self._count(namespace, 'miss')
+            return None
+
+        self._count(namespace, 'hit')
+        return json.loads(record['value'])
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float] = None):
+        if not self.enabled:
+            return
+        default_ttl, max_entries, _ = self.NAMESPACES.get(namespace, (3600, 1000, 0))
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+        try:
+            backend = await self._backend_ready()
+            await asyncio.to_thread(backend.put, namespace, key, payload, time.time() + (ttl or default_ttl))
+
+            self._writes[namespace] = self._writes.get(namespace, 0) + 1
+            if self._writes[namespace] % self.prune_every == 0:
+                await asyncio.to_thread(backend.prune, namespace, max_entries)
+        except Exception as e:
+            logger.error(f"خطأ في الكتابة للتخزين المشترك: {e}")
+
+    def _count(self, namespace: str, result: str):
+        cache_requests.inc(cache=namespace, result=result)
+        for counters in (self._pending, self._totals):
+            bucket = counters.setdefault(namespace, {'hit': 0, 'miss': 0})
+            bucket[result] += 1
+
+    async def _report(self):
+        """نشر عدادات هذا العامل وذاكرته في المخزن المشترك لحساب المجموع عبر العمال"""
+        memory = _resident_memory_bytes()
+        worker_memory.set(memory)
+        pending, self._pending = self._pending, {}
+        for namespace in set(pending) | {'memory'}:
+            counts = pending.get(namespace, {'hit': 0, 'miss': 0})
+            try:
+                backend = await self._backend_ready()
+                await asyncio.to_thread(backend.report_worker, namespace, counts['hit'], counts['miss'], memory)
+            except Exception as e:
+                logger.error(f"خطأ في نشر إحصائيات التخزين: {e}")
+        try:
+            backend = await self._backend_ready()
+            await asyncio.to_thread(backend.prune_workers, time.time() - self.worker_stale_after)
+        except Exception as e:
+            logger.error(f"خطأ في حذف إحصائيات العمال المنتهية: {e}")
+
+    async def _periodic_report(self):
+        while True:
+            await asyncio.sleep(self.report_interval)
+            await self._report()
+
+    async def get_cache_stats(self) -> Dict[str, Any]:
+        """نسبة الإصابة لهذا العامل ومجموع كل العمال، وذاكرة كل عامل"""
+        if not self.enabled:
+            return {'enabled': False}
+
+        await self._report()
+        backend = await self._backend_ready()
+        live_after = time.time() - self.worker_stale_after
+        rows = [row for row in await asyncio.to_thread(backend.worker_rows) if row.get('updated_at', 0) >= live_after]
+
+        aggregate: Dict[str, Dict[str, Any]] = {}
+        workers: Dict[int, Dict[str, Any]] = {}
+        for row in rows:
+            workers.setdefault(row['pid'], {'pid': row['pid'], 'memory_bytes': row['memory_bytes']})
+            if row['namespace'] == 'memory':
+                continue
+            totals = aggregate.setdefault(row['namespace'], {'hits': 0, 'misses': 0})
+            totals['hits'] += row['hits']
+            totals['misses'] += row['misses']
+
+        for namespace, totals in aggregate.items():
+            lookups = totals['hits'] + totals['misses']
+            totals['hit_rate'] = round(totals['hits'] / lookups, 3) if lookups else 0.0
+            totals['entries'] = await asyncio.to_thread(backend.count, namespace)
+
+        this_worker = {
+            namespace: {
+                **counts,
+                'hit_rate': round(counts['hit'] / (counts['hit'] + counts['miss']), 3) if counts['hit'] + counts['miss'] else 0.0
+            }
+            for namespace, counts in self._totals.items()
+        }
+
+        return {
+            'enabled': True,
+            'backend': backend.name,
+            'directory': str(self.directory),
+            'pid': os.getpid(),
+            'this_worker': this_worker,
+            'aggregate': aggregate,
+            'workers': sorted(workers.values(), key=lambda w: w['pid']),
+            'total_worker_memory_bytes': sum(w['memory_bytes'] for w in workers.values())
+        }
+
+# مثيل واحد لكل عامل؛ المخزن نفسه مشترك بين جميع العمال
+shared_cache = SharedCache()
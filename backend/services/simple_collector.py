@@ -1,7 +1,12 @@
-from typing import Dict, Any, List
+import os
+import asyncio
+import time
+from typing import Dict, Any, List, Awaitable, Callable, Optional
 import logging
 from datetime import datetime
-from services.tavily_service import tavily_search_service
+from services.admission import TokenBucket
+from services.registry import service_registry
+from services.search_policy import search_policy
 
 logger = logging.getLogger(__name__)
 
@@ -15,19 +20,39 @@ class SimpleSourceCollector:
             'سعيد الصقلاوي', 'محمد الحارثي', 'بدرية الشحي', 'عبدالله الطائي',
             'زاهر الغافري', 'سالم الراشدي', 'أحمد بلال', 'فاطمة الشيدي'
         ]
+        
+        # حد معدل طلبات البحث لكل الجمع (مشترك بين المؤلفين المتزامنين) مع سعة للدفعات
+        self.search_rate = float(os.environ.get('COLLECTOR_SEARCH_RATE_PER_SECOND', '2.0'))
+        self.search_burst = float(os.environ.get('COLLECTOR_SEARCH_BURST', '6'))
+        # عدد المؤلفين الذين تُجمع مصادرهم في الوقت نفسه
+        self.author_concurrency = int(os.environ.get('COLLECTOR_AUTHOR_CONCURRENCY', '4'))
+        self._search_bucket = TokenBucket(self.search_rate, self.search_burst)
+        # رموز الدلو المستهلكة فعلاً (البحث الذي يخضع لحد المعدل) لقياس الإنتاجية
+        self.search_slots_acquired = 0
+    
+    async def _acquire_search_slot(self):
+        wait = self._search_bucket.try_acquire()
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self._search_bucket.try_acquire()
+        self.search_slots_acquired += 1
+    
+    async def _search(self, query: str) -> Dict[str, Any]:
+        """بحث Tavily بعد انتظار رمز من دلو المعدل"""
+        await self._acquire_search_slot()
+        return await (await service_registry.aget('tavily_search')).search_omani_literature_advanced(query, max_results=3)
     
     async def collect_sources_for_author(self, author_name: str) -> Dict[str, Any]:
         """جمع مصادر لمؤلف واحد"""
         
+        started = time.perf_counter()
         try:
-            # البحث عن مقابلات
-            interviews = await self._find_interviews(author_name)
-            
-            # البحث عن مقالات أكاديمية
-            articles = await self._find_articles(author_name)
-            
-            # البحث عن معلومات الكتب
-            books_info = await self._find_books_info(author_name)
+            # المقابلات والمقالات الأكاديمية ومعلومات الكتب معاً (كل منها يلتزم بحد المعدل)
+            interviews, articles, books_info = await asyncio.gather(
+                self._find_interviews(author_name),
+                self._find_articles(author_name),
+                self._find_books_info(author_name)
+            )
             
             return {
                 'author': author_name,
@@ -35,7 +60,8 @@ class SimpleSourceCollector:
                 'articles': articles,
                 'books_info': books_info,
                 'total_sources': len(interviews) + len(articles) + len(books_info),
-                'collection_date': datetime.utcnow().isoformat()
+                'collection_date': datetime.utcnow().isoformat(),
+                'duration_seconds': round(time.perf_counter() - started, 2)
             }
             
         except Exception as e:
@@ -46,14 +72,15 @@ class SimpleSourceCollector:
                 'articles': [],
                 'books_info': [],
                 'total_sources': 0,
-                'error': str(e)
+                'error': str(e),
+                'duration_seconds': round(time.perf_counter() - started, 2)
             }
     
     async def _find_interviews(self, author_name: str) -> List[Dict[str, Any]]:
         """البحث عن مقابلات"""
         try:
             query = f'مقابلة مع "{author_name}" OR حوار مع "{author_name}" الأدب العُماني'
-            results = await tavily_search_service.search_omani_literature_advanced(query, max_results=3)
+            results = await self._search(query)
             
             interviews = []
             for result in results.get('results', []):
@@ -67,6 +94,7 @@ class SimpleSourceCollector:
                         'reliability': result.get('reliability_rating', 0.7)
                     })
             
+            search_policy.record_usage(results, len(interviews))
             return interviews
             
         except Exception as e:
@@ -77,7 +105,7 @@ class SimpleSourceCollector:
         """البحث عن مقالات أكاديمية"""
         try:
             query = f'"{author_name}" الأدب العُماني مقال أكاديمي OR academic article'
-            results = await tavily_search_service.search_omani_literature_advanced(query, max_results=3)
+            results = await self._search(query)
             
             articles = []
             for result in results.get('results', []):
@@ -91,6 +119,7 @@ class SimpleSourceCollector:
                         'reliability': result.get('reliability_rating', 0.8)
                     })
             
+            search_policy.record_usage(results, len(articles))
             return articles
             
         except Exception as e:
@@ -101,7 +130,7 @@ class SimpleSourceCollector:
         """البحث عن معلومات الكتب والدواوين"""
         try:
             query = f'كتب "{author_name}" OR مؤلفات "{author_name}" OR دواوين "{author_name}" الأدب العُماني'
-            results = await tavily_search_service.search_omani_literature_advanced(query, max_results=3)
+            results = await self._search(query)
             
             books = []
             for result in results.get('results', []):
@@ -115,14 +144,20 @@ class SimpleSourceCollector:
                         'reliability': result.get('reliability_rating', 0.6)
                     })
             
+            search_policy.record_usage(results, len(books))
             return books
             
         except Exception as e:
             logger.error(f"خطأ في البحث عن كتب {author_name}: {e}")
             return []
     
-    async def bulk_collect_all_authors(self) -> Dict[str, Any]:
-        """جمع شامل لجميع المؤلفين المعروفين"""
+    async def bulk_collect_all_authors(
+        self, progress: Optional[Callable[[Dict[str, Any]], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """جمع شامل لجميع المؤلفين المعروفين بتزامن محدود وضمن حد معدل البحث
+
+        progress (اختياري) يُستدعى بعد كل مؤلف بعدد المنجز والإجمالي (لطابور المهام).
+        """
         
         collection_summary = {
             'authors_processed': 0,
@@ -132,12 +167,26 @@ class SimpleSourceCollector:
             'detailed_results': [],
             'start_time': datetime.utcnow().isoformat()
         }
+        started = time.perf_counter()
+        slots_before = self.search_slots_acquired
+        semaphore = asyncio.Semaphore(self.author_concurrency)
+        done = {'authors_done': 0, 'authors_total': len(self.known_authors), 'sources_found': 0}
         
-        try:
-            for author in self.known_authors[:6]:  # أول 6 للاختبار
+        async def collect(author: str) -> Dict[str, Any]:
+            async with semaphore:
                 logger.info(f"جمع مصادر للمؤلف: {author}")
-                
                 author_results = await self.collect_sources_for_author(author)
+            done['authors_done'] += 1
+            done['sources_found'] += author_results.get('total_sources', 0)
+            if progress is not None:
+                await progress(dict(done))
+            return author_results
+        
+        try:
+            # النتائج بترتيب القائمة مهما كان ترتيب الانتهاء
+            author_results_list = await asyncio.gather(*(collect(author) for author in self.known_authors))
+            
+            for author_results in author_results_list:
                 collection_summary['detailed_results'].append(author_results)
                 collection_summary['authors_processed'] += 1
                 
@@ -146,14 +195,27 @@ class SimpleSourceCollector:
                     collection_summary['total_sources_found'] += author_results['total_sources']
                 else:
                     collection_summary['failed_collections'] += 1
-                
-                # تأخير بين الطلبات
-                await __import__('asyncio').sleep(3)
             
+            duration = time.perf_counter() - started
+            searches = self.search_slots_acquired - slots_before
+            author_durations = [result.get('duration_seconds', 0.0) for result in author_results_list]
+            collection_summary['throughput'] = {
+                'duration_seconds': round(duration, 2),
+                'authors_per_minute': round(len(author_results_list) * 60 / duration, 2) if duration else 0.0,
+                'searches': searches,
+                'searches_per_second': round(searches / duration, 2) if duration else 0.0,
+                'average_author_seconds': round(sum(author_durations) / len(author_durations), 2) if author_durations else 0.0,
+                'slowest_author_seconds': max(author_durations, default=0.0),
+                'rate_limit_per_second': self.search_rate,
+                'author_concurrency': self.author_concurrency
+            }
             collection_summary['completion_time'] = datetime.utcnow().isoformat()
             collection_summary['collection_completed'] = True
             
-            logger.info(f"اكتمل الجمع: {collection_summary['total_sources_found']} مصدر من {collection_summary['authors_processed']} مؤلف")
+            logger.info(
+                f"اكتمل الجمع: {collection_summary['total_sources_found']} مصدر من "
+                f"{collection_summary['authors_processed']} مؤلف خلال {duration:.1f}s"
+            )
             
         except Exception as e:
             logger.error(f"خطأ في الجمع الشامل: {e}")
@@ -162,5 +224,4 @@ class SimpleSourceCollector:
         
         return collection_summary
 
-# إنشاء مثيل واحد
-simple_collector = SimpleSourceCollector()
\ No newline at end of file
+# المثيل يُنشأ عند أول استخدام عبر service_registry.get('simple_collector')
@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+class ReloadingReader:
+    """اتصال قراءة فقط بملف sqlite تبنيه مهمة خارجية، يُعاد فتحه عندما تستبدل المهمة الملف
+
+    الاستدعاءات تتم تحت self.lock لأن الاتصال مشترك بين خيوط asyncio.to_thread.
+    """
+
+    def __init__(self, path: Path, check_interval: float = 30.0):
+        self.path = path
+        self.check_interval = check_interval
+        self.lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+
+    def connection(self) -> Optional[sqlite3.Connection]:
+        now = time.monotonic()
+        if self._conn is not None and now - self._checked_at < self.check_interval:
+            return self._conn
+
+        self._checked_at = now
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            return None
+        if self._conn is None or mtime != self._mtime:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True, check_same_thread=False)
+            self._mtime = mtime
+            logger.info(f"تم تحميل الملف المحلي: {self.path}")
+        return self._conn
+
+@contextmanager
+def build_atomically(path: Path, copy_existing: bool = False):
+    """بناء ملف sqlite جديد بجانب القديم ثم استبداله ذرياً عند النجاح فقط
+
+    copy_existing يبدأ من نسخة الملف الحالي (للتحديثات الجزئية)، والقراء لا يرون
+    إلا الملف القديم كاملاً أو الجديد كاملاً.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_suffix('.building')
+    temporary.unlink(missing_ok=True)
+
+    conn = sqlite3.connect(str(temporary))
+    try:
+        if copy_existing and path.exists():
+            source = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+            try:
+                source.backup(conn)
+            finally:
+                source.close()
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.close()
+        temporary.unlink(missing_ok=True)
+        raise
+    conn.close()
+    os.replace(temporary, path)
@@ -1,23 +1,92 @@
 import os
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from functools import lru_cache
 from tavily import TavilyClient
 import logging
 from dotenv import load_dotenv
 import asyncio
+import time
+
+from services.resilience import provider_resilience
+from services.tracing import tracer
+from services.provider_cassettes import provider_cassettes
+from services.shared_cache import shared_cache
+from services.term_matcher import TermMatcher
+from services.metrics import metrics
+from services.search_policy import search_policy
+from services.search_warehouse import search_warehouse
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+tavily_payload_bytes = metrics.histogram(
+    'tavily_payload_bytes', 'Approximate size of Tavily response text fields', ('operation', 'fetch_mode'),
+    export_buckets=(1e3, 5e3, 1e4, 2.5e4, 5e4, 1e5, 2.5e5, 5e5, 1e6)
+)
+tavily_processing_seconds = metrics.histogram(
+    'tavily_processing_seconds', 'Time spent measuring and filtering a Tavily response', ('fetch_mode',)
+)
+
+def _payload_bytes(response: Dict[str, Any]) -> int:
+    """تقدير حجم الرد المنقول من حقول النص (العميل لا يكشف حجم الرد الخام)"""
+    size = len((response.get('answer') or '').encode('utf-8'))
+    for result in response.get('results', []):
+        for value in result.values():
+            if isinstance(value, str):
+                size += len(value.encode('utf-8'))
+    return size
+
+# كلمات مفتاحية تدل على المحتوى الصحفي والمقابلات
+JOURNALISM_KEYWORDS = [
+    'مقابلة', 'حوار', 'لقاء', 'interview', 'مقال', 'article',
+    'تقرير', 'report', 'دراسة', 'study', 'صحيفة', 'newspaper',
+    'مجلة', 'magazine', 'منشور', 'published', 'نشر', 'publish'
+]
+TRUSTED_NEWS_SITES = ['observer', 'daily', 'shabiba', 'watan', 'times']
+SOCIAL_MEDIA_SITES = ['facebook', 'twitter', 'instagram', 'tiktok']
+
+# مصطلحات درجة الصلة
+RELEVANCE_OMANI_KEYWORDS = ['عُمان', 'عُماني', 'oman', 'omani', 'سلطنة']
+LITERARY_TERMS = ['أدب', 'شعر', 'رواية', 'قصة', 'شاعر', 'literature', 'poetry']
+
+OMANI_SPECIFIC_TERMS = [
+    'عُمان', 'عُماني', 'عُمانية', 'مسقط', 'صلالة', 'نزوى', 'صحار',
+    'الباطنة', 'ظفار', 'الداخلية', 'مسندم', 'الوسطى',
+    'سلطنة', 'سلطان', 'قابوس', 'هيثم', 'آل سعيد',
+    'خنجر', 'عنزة', 'هجن', 'نخيل', 'لبان', 'بخور',
+    'فرقة', 'رزحة', 'برعة', 'فن', 'تراث'
+]
+
+# كل مصطلحات المحتوى في آلة واحدة، وكل مؤشرات الروابط في أخرى
+CONTENT_TERMS = JOURNALISM_KEYWORDS + RELEVANCE_OMANI_KEYWORDS + LITERARY_TERMS + OMANI_SPECIFIC_TERMS
+URL_MATCHER = TermMatcher(TRUSTED_NEWS_SITES + SOCIAL_MEDIA_SITES)
+OMANI_TERMS_MATCHER = TermMatcher(OMANI_SPECIFIC_TERMS)
+
+@lru_cache(maxsize=256)
+def _content_matcher(query_words: Tuple[str, ...]) -> TermMatcher:
+    """آلة مطابقة المحتوى مع كلمات الاستعلام (تُبنى مرة لكل استعلام مختلف)"""
+    return TermMatcher(CONTENT_TERMS + list(query_words))
+
+def _query_words(query: str) -> List[str]:
+    return [word for word in query.lower().split() if len(word) > 2]
+
 class TavilyAdvancedSearchService:
     """خدمة البحث المتقدمة باستخدام Tavily للأدب العُماني"""
     
     def __init__(self):
         self.api_key = os.environ.get('TAVILY_API_KEY')
-        if not self.api_key:
+        if not self.api_key and not provider_cassettes.replaying:
             raise ValueError("TAVILY_API_KEY not found in environment variables")
         
-        self.client = TavilyClient(api_key=self.api_key)
+        self.client = TavilyClient(api_key=self.api_key or 'replay')
+        
+        # lazy: مقتطفات فقط، والمحتوى الخام يُجلب عند الطلب للنتائج المستخدمة
+        # eager: المحتوى الخام لكل النتائج مع الرد (السلوك السابق)
+        self.fetch_mode = os.environ.get('TAVILY_FETCH_MODE', 'lazy').lower()
+        # إحماء مدفوع اختياري (بحث أساسي برصيد واحد)؛ الافتراضي فحص الوصول عبر مصافحة TLS فقط
+        self.warmup_probe = os.environ.get('WARMUP_PROVIDER_PROBE', 'false').lower() == 'true'
+        self.warmup_host = os.environ.get('TAVILY_API_HOST', 'api.tavily.com')
         
         # مجالات البحث المتخصصة للأدب العُماني
         self.search_domains = {
@@ -39,38 +108,101 @@ class TavilyAdvancedSearchService:
         self, 
         query: str, 
         max_results: int = 5,
-        include_domains: List[str] = None
+        include_domains: List[str] = None,
+        query_class: Optional[str] = None,
+        latency_budget: Optional[float] = None,
+        refresh: bool = False
     ) -> Dict[str, Any]:
-        """البحث المتقدم في المقابلات والمقالات الأدبية العُمانية المنشورة"""
+        """البحث المتقدم في المقابلات والمقالات الأدبية العُمانية المنشورة
+
+        عمق البحث وعدد النتائج والنطاقات تحددها search_policy حسب فئة الاستعلام
+        وميزانية الزمن؛ المستدعي يبلغ عن النتائج المستخدمة عبر search_policy.record_usage.
+        يُجاب من المستودع المحلي أولاً إن وُجدت نتائج كافية، وrefresh يتجاوزه ويتجاوز
+        التخزين المؤقت لتحديث المستودع من الشبكة.
+        """
         
         try:
+            plan = search_policy.plan(query, query_class, max_results, latency_budget)
+            effective_domains = include_domains or self._get_plan_domains(plan['domains'])
+            
+            # نتائج البحث مشتركة بين عمال uvicorn عبر التخزين المؤقت المشترك؛ المفتاح بعد التخطيط
+            # حتى لا يتشارك بحث دفعي أو أكاديمي وبحث محادثة بنطاقات مختلفة مدخلاً واحداً. العمق وعدد
+            # النتائج اختيار السياسة داخل الفئة (ويتغيران بالاستكشاف)، فلا يدخلان المفتاح وإلا فات
+            # التخزين المؤقت كل استعلام مستكشَف ودُفع عنه بحث ثانٍ
+            cache_key = shared_cache.make_key(
+                query, plan['query_class'], max_results, sorted(effective_domains), self.fetch_mode
+            )
+            if not refresh:
+                cached = await shared_cache.get('search', cache_key)
+                if cached is not None:
+                    return cached
+                
+                local_results = await search_warehouse.lookup(query, plan['max_results'], effective_domains)
+                if local_results is not None:
+                    return self._warehouse_result(query, local_results, plan['max_results'])
+            
             # تحسين استعلام البحث للمقابلات والمقالات
             enhanced_query = self._enhance_query_for_omani_literature(query)
             
             # بحث مخصص للمحتوى الصحفي والأكاديمي المنشور
-            search_response = self.client.search(
-                query=enhanced_query,
-                search_depth="advanced",  # بحث عميق
-                max_results=max_results * 2,  # ضاعف النتائج للتصفية
-                include_answer=True,
-                include_domains=include_domains or self._get_journalism_domains(),
-                exclude_domains=["facebook.com", "twitter.com", "instagram.com"],  # تجنب وسائل التواصل
-                include_raw_content=True,
-                max_tokens=8000  # محتوى أطول للمقالات
-            )
+            # (العميل متزامن، لذا يُنفذ في خيط منفصل عبر قاطع الدائرة والمهلة التكيفية)
+            with tracer.span(
+                'tavily.search', max_results=plan['max_results'] * 2,
+                depth=plan['search_depth'], query_class=plan['query_class']
+            ) as span:
+                search_params = dict(
+                    query=enhanced_query,
+                    search_depth=plan['search_depth'],
+                    max_results=plan['max_results'] * 2,  # ضاعف النتائج للتصفية
+                    include_answer=True,
+                    include_domains=effective_domains,
+                    exclude_domains=["facebook.com", "twitter.com", "instagram.com"],  # تجنب وسائل التواصل
+                )
+                if self.fetch_mode == 'eager':
+                    search_params.update(
+                        include_raw_content=True,
+                        max_tokens=8000  # محتوى أطول للمقالات
+                    )
+                fetch_started = time.perf_counter()
+                search_response = await provider_resilience.call('tavily', lambda: provider_cassettes.call(
+                    'tavily', search_params,
+                    lambda: provider_resilience.run_blocking('tavily', self.client.search, **search_params)
+                ))
+                fetch_seconds = time.perf_counter() - fetch_started
+                if span is not None:
+                    span.set_attribute('results', len(search_response.get('results', [])))
             
             # تصفية وترتيب النتائج للتركيز على المحتوى الصحفي
+            processing_started = time.perf_counter()
+            payload_bytes = _payload_bytes(search_response)
             filtered_results = self._filter_for_journalism_content(search_response, query)
+            processing_seconds = time.perf_counter() - processing_started
             
-            return {
+            tavily_payload_bytes.observe(payload_bytes, operation='search', fetch_mode=self.fetch_mode)
+            tavily_processing_seconds.observe(processing_seconds, fetch_mode=self.fetch_mode)
+            search_policy.record_search(plan, fetch_seconds, len(filtered_results))
+            search_warehouse.store_in_background(query, filtered_results)
+            
+            result = {
                 'query': query,
                 'enhanced_query': enhanced_query,
                 'results': filtered_results,
                 'total_found': len(filtered_results),
                 'search_engine': 'tavily_journalism_focused',
                 'answer_summary': search_response.get('answer', ''),
-                'search_type': 'articles_and_interviews'
+                'search_type': 'articles_and_interviews',
+                'payload_stats': {
+                    'fetch_mode': self.fetch_mode,
+                    'bytes': payload_bytes,
+                    'results_received': len(search_response.get('results', [])),
+                    # زمن الاستدعاء يشمل النقل وتحليل JSON داخل العميل
+                    'fetch_ms': round(fetch_seconds * 1000, 1),
+                    'processing_ms': round(processing_seconds * 1000, 1)
+                },
+                'search_plan': plan
             }
+            await shared_cache.set('search', cache_key, result)
+            return result
             
         except Exception as e:
             logger.error(f"خطأ في بحث Tavily المحسن: {e}")
@@ -82,6 +214,63 @@ class TavilyAdvancedSearchService:
                 'search_engine': 'tavily_journalism_error'
             }
     
+    def _warehouse_result(self, query: str, documents: List[Dict[str, Any]], max_results: int) -> Dict[str, Any]:
+        """نتيجة بنفس شكل بحث Tavily من مستندات المستودع (الدرجات تُحسب للاستعلام الحالي)"""
+        filtered_results = self._filter_for_journalism_content({'results': documents}, query)[:max_results]
+        return {
+            'query': query,
+            'enhanced_query': query,
+            'results': filtered_results,
+            'total_found': len(filtered_results),
+            'search_engine': 'local_warehouse',
+            'answer_summary': '',
+            'search_type': 'articles_and_interviews'
+        }
+    
+    async def warm_up(self):
+        """فحص الوصول للمزود بمصافحة TLS (بلا رصيد)؛ ومع WARMUP_PROVIDER_PROBE بحث أساسي
+        مدفوع بنتيجة واحدة يعطي قاطع الدائرة أول عينة زمن"""
+        if provider_cassettes.replaying:
+            return
+        
+        if self.warmup_probe:
+            params = {'query': 'الأدب العُماني', 'search_depth': 'basic', 'max_results': 1}
+            with tracer.span('tavily.warm_up'):
+                await provider_resilience.call('tavily', lambda: provider_resilience.run_blocking('tavily', self.client.search, **params))
+            return
+        
+        # TavilyClient لا يحتفظ بمجمع اتصالات، فالمصافحة هنا تتحقق من الوصول وتسخن ذاكرة DNS فقط
+        _, writer = await asyncio.open_connection(self.warmup_host, 443, ssl=True)
+        writer.close()
+        await writer.wait_closed()
+    
+    async def hydrate_raw_content(self, results: List[Dict[str, Any]], max_chars: int = 400) -> List[Dict[str, Any]]:
+        """جلب المحتوى الخام عند الطلب للنتائج التي ستوضع فعلاً في الرسالة فقط
+
+        في وضع lazy لا يأتي المحتوى الخام مع البحث؛ هذه الدالة تجلبه بطلب extract واحد
+        للروابط الناقصة وتملأ raw_content (مقتطعاً إلى max_chars) في نفس القواميس.
+        """
+        missing = [result for result in results if result.get('url') and not result.get('raw_content')]
+        if not missing:
+            return results
+        
+        try:
+            extract_params = {'urls': list(dict.fromkeys(result['url'] for result in missing))}
+            with tracer.span('tavily.extract', urls=len(extract_params['urls'])):
+                response = await provider_resilience.call('tavily', lambda: provider_cassettes.call(
+                    'tavily_extract', extract_params,
+                    lambda: provider_resilience.run_blocking('tavily', self.client.extract, **extract_params)
+                ))
+            tavily_payload_bytes.observe(_payload_bytes(response), operation='extract', fetch_mode=self.fetch_mode)
+            
+            raw_by_url = {item.get('url'): item.get('raw_content') or '' for item in response.get('results', [])}
+            for result in missing:
+                result['raw_content'] = raw_by_url.get(result['url'], '')[:max_chars]
+        except Exception as e:
+            logger.error(f"خطأ في جلب المحتوى الخام من Tavily: {e}")
+        
+        return results
+    
     def _enhance_query_for_omani_literature(self, query: str) -> str:
         """تحسين استعلام البحث للتركيز على المقابلات والمقالات المنشورة"""
         
@@ -132,6 +321,15 @@ class TavilyAdvancedSearchService:
         
         return priority_domains
     
+    def _get_plan_domains(self, domains: str) -> List[str]:
+        """قائمة النطاقات لفئة خطة البحث"""
+        if domains == 'scholarly':
+            # الجمع يشمل المواقع الأكاديمية والثقافية إضافة للصحفية
+            return list(dict.fromkeys(
+                self._get_journalism_domains() + self.search_domains['academic'] + self.search_domains['cultural']
+            ))
+        return self._get_journalism_domains()
+    
     def _get_journalism_domains(self) -> List[str]:
         """الحصول على النطاقات المتخصصة في الصحافة والمقالات الأدبية"""
         journalism_domains = []
@@ -166,9 +364,11 @@ class TavilyAdvancedSearchService:
         raw_results = search_response.get('results', [])
         processed_results = []
         
-        for result in raw_results:
-            # تقييم صلة النتيجة بالأدب العُماني
-            relevance_score = self._calculate_relevance_score(result, original_query)
+        # تقييم صلة كل النتائج بالأدب العُماني في مسح واحد
+        scored = self._score_results(raw_results, original_query, content_limit=600)
+        
+        for result, tags in zip(raw_results, scored):
+            relevance_score = tags['relevance_score']
             
             if relevance_score > 0.3:  # عتبة الصلة
                 processed_result = {
@@ -180,14 +380,11 @@ class TavilyAdvancedSearchService:
                     'source_type': self._identify_source_type(result.get('url', '')),
                     'reliability_rating': self._rate_source_reliability(result.get('url', '')),
                     'published_date': result.get('published_date'),
-                    'raw_content': result.get('raw_content', '')[:200]  # محتوى خام قصير
+                    'raw_content': (result.get('raw_content') or '')[:200],  # محتوى خام قصير
+                    # الكلمات المفتاحية العُمانية في المحتوى المعروض
+                    'omani_keywords': tags['omani_keywords']
                 }
                 
-                # إضافة تحليل المحتوى للكلمات المفتاحية
-                processed_result['omani_keywords'] = self._extract_omani_keywords(
-                    processed_result['content']
-                )
-                
                 processed_results.append(processed_result)
         
         # ترتيب النتائج حسب الصلة والموثوقية
@@ -208,59 +405,29 @@ class TavilyAdvancedSearchService:
         raw_results = search_response.get('results', [])
         journalism_results = []
         
-        # كلمات مفتاحية تدل على المحتوى الصحفي والمقابلات
-        journalism_keywords = [
-            'مقابلة', 'حوار', 'لقاء', 'interview', 'مقال', 'article',
-            'تقرير', 'report', 'دراسة', 'study', 'صحيفة', 'newspaper',
-            'مجلة', 'magazine', 'منشور', 'published', 'نشر', 'publish'
-        ]
+        # وسم كل النتائج بالكلمات الصحفية والمواقع والمصطلحات العُمانية في مسح واحد
+        scored = self._score_results(raw_results, original_query, content_limit=800)
         
-        for result in raw_results:
-            content = (result.get('content', '') + ' ' + result.get('title', '')).lower()
-            url = result.get('url', '').lower()
-            
-            # تقييم المحتوى الصحفي
-            journalism_score = 0.0
-            
-            # نقاط للكلمات المفتاحية الصحفية
-            for keyword in journalism_keywords:
-                if keyword.lower() in content:
-                    journalism_score += 0.2
-            
-            # نقاط إضافية للمواقع الصحفية الموثوقة
-            trusted_news_sites = ['observer', 'daily', 'shabiba', 'watan', 'times']
-            for site in trusted_news_sites:
-                if site in url:
-                    journalism_score += 0.3
-            
-            # تجنب المحتوى من وسائل التواصل الاجتماعي
-            social_media_sites = ['facebook', 'twitter', 'instagram', 'tiktok']
-            if any(site in url for site in social_media_sites):
-                journalism_score -= 0.5
+        for result, tags in zip(raw_results, scored):
+            journalism_score = tags['journalism_score']
             
             # إضافة النتيجة إذا كانت تحتوي على محتوى صحفي
             if journalism_score > 0.2:
-                # حساب درجة الصلة العامة
-                relevance_score = self._calculate_relevance_score(result, original_query)
-                
                 processed_result = {
                     'title': result.get('title', ''),
                     'content': result.get('content', '')[:800],  # محتوى أطول للمقالات
                     'url': result.get('url', ''),
                     'score': result.get('score', 0),
-                    'relevance_score': relevance_score,
+                    'relevance_score': tags['relevance_score'],
                     'journalism_score': journalism_score,
                     'source_type': self._identify_source_type(result.get('url', '')),
                     'reliability_rating': self._rate_source_reliability(result.get('url', '')),
                     'published_date': result.get('published_date'),
-                    'raw_content': result.get('raw_content', '')[:400]  # محتوى خام أطول
+                    'raw_content': (result.get('raw_content') or '')[:400],  # محتوى خام أطول
+                    # الكلمات المفتاحية العُمانية في المحتوى المعروض
+                    'omani_keywords': tags['omani_keywords']
                 }
                 
-                # إضافة تحليل المحتوى للكلمات المفتاحية
-                processed_result['omani_keywords'] = self._extract_omani_keywords(
-                    processed_result['content']
-                )
-                
                 journalism_results.append(processed_result)
         
         # ترتيب النتائج حسب النقاط الصحفية والصلة
@@ -271,34 +438,90 @@ class TavilyAdvancedSearchService:
         
         return journalism_results[:10]  # أفضل 10 نتائج
     
-    def _calculate_relevance_score(self, result: Dict[str, Any], query: str) -> float:
-        """حساب درجة صلة النتيجة بالاستعلام والأدب العُماني"""
-        
-        content = (result.get('content', '') + ' ' + result.get('title', '')).lower()
-        query_lower = query.lower()
+    def _score_results(
+        self,
+        results: List[Dict[str, Any]],
+        query: str,
+        content_limit: int
+    ) -> List[Dict[str, Any]]:
+        """حساب كل الدرجات لمجموعة النتائج دفعة واحدة
+
+        نص كل نتيجة (المحتوى + العنوان) يُحوّل لأحرف صغيرة مرة واحدة، ثم تُمسح كل النصوص
+        بآلة مطابقة واحدة تشمل الكلمات الصحفية والعُمانية والأدبية وكلمات الاستعلام،
+        وتُمسح الروابط بآلة ثانية. الدرجات تُشتق من نتائج المسح دون إعادة قراءة النص.
+        """
+        query_words = _query_words(query)
+        matcher = _content_matcher(tuple(sorted(set(query_words))))
+        
+        contents = [result.get('content', '').lower() for result in results]
+        content_hits = matcher.match_batch([
+            content + ' ' + result.get('title', '').lower()
+            for content, result in zip(contents, results)
+        ])
+        url_hits = URL_MATCHER.match_batch([result.get('url', '').lower() for result in results])
         
+        scored = []
+        for result, content, hits, url_found in zip(results, contents, content_hits, url_hits):
+            # المصطلحات العُمانية تُستخرج من المحتوى المعروض فقط (أول content_limit حرف)
+            visible_length = len(result.get('content', '')[:content_limit].lower())
+            
+            scored.append({
+                'journalism_score': self._journalism_score(hits, url_found),
+                'relevance_score': self._relevance_from_hits(hits, query_words),
+                'omani_keywords': [
+                    term for term in OMANI_SPECIFIC_TERMS
+                    if term in hits and hits[term] + len(term) <= visible_length
+                ]
+            })
+        return scored
+    
+    @staticmethod
+    def _journalism_score(hits: Dict[str, int], url_hits: Dict[str, int]) -> float:
+        journalism_score = 0.0
+        
+        # نقاط للكلمات المفتاحية الصحفية
+        for keyword in JOURNALISM_KEYWORDS:
+            if keyword in hits:
+                journalism_score += 0.2
+        
+        # نقاط إضافية للمواقع الصحفية الموثوقة
+        for site in TRUSTED_NEWS_SITES:
+            if site in url_hits:
+                journalism_score += 0.3
+        
+        # تجنب المحتوى من وسائل التواصل الاجتماعي
+        if any(site in url_hits for site in SOCIAL_MEDIA_SITES):
+            journalism_score -= 0.5
+        return journalism_score
+    
+    @staticmethod
+    def _relevance_from_hits(hits: Dict[str, int], query_words: List[str]) -> float:
         score = 0.0
         
         # نقاط للكلمات المفتاحية العُمانية
-        omani_keywords = ['عُمان', 'عُماني', 'oman', 'omani', 'سلطنة']
-        for keyword in omani_keywords:
-            if keyword.lower() in content:
+        for keyword in RELEVANCE_OMANI_KEYWORDS:
+            if keyword in hits:
                 score += 0.3
         
         # نقاط للمصطلحات الأدبية
-        literary_terms = ['أدب', 'شعر', 'رواية', 'قصة', 'شاعر', 'literature', 'poetry']
-        for term in literary_terms:
-            if term.lower() in content:
+        for term in LITERARY_TERMS:
+            if term in hits:
                 score += 0.2
         
         # نقاط لتطابق كلمات الاستعلام
-        query_words = query_lower.split()
         for word in query_words:
-            if len(word) > 2 and word in content:
+            if word in hits:
                 score += 0.1
         
         return min(1.0, score)  # حد أقصى 1.0
     
+    def _calculate_relevance_score(self, result: Dict[str, Any], query: str) -> float:
+        """حساب درجة صلة النتيجة بالاستعلام والأدب العُماني"""
+        query_words = _query_words(query)
+        content = (result.get('content', '') + ' ' + result.get('title', '')).lower()
+        hits = _content_matcher(tuple(sorted(set(query_words)))).match(content)
+        return self._relevance_from_hits(hits, query_words)
+    
     def _identify_source_type(self, url: str) -> str:
         """تحديد نوع المصدر من الرابط"""
         url_lower = url.lower()
@@ -332,23 +555,8 @@ class TavilyAdvancedSearchService:
     
     def _extract_omani_keywords(self, content: str) -> List[str]:
         """استخراج الكلمات المفتاحية العُمانية من المحتوى"""
-        
-        omani_specific_terms = [
-            'عُمان', 'عُماني', 'عُمانية', 'مسقط', 'صلالة', 'نزوى', 'صحار',
-            'الباطنة', 'ظفار', 'الداخلية', 'مسندم', 'الوسطى',
-            'سلطنة', 'سلطان', 'قابوس', 'هيثم', 'آل سعيد',
-            'خنجر', 'عنزة', 'هجن', 'نخيل', 'لبان', 'بخور',
-            'فرقة', 'رزحة', 'برعة', 'فن', 'تراث'
-        ]
-        
-        found_keywords = []
-        content_lower = content.lower()
-        
-        for term in omani_specific_terms:
-            if term.lower() in content_lower:
-                found_keywords.append(term)
-        
-        return found_keywords
+        hits = OMANI_TERMS_MATCHER.match(content.lower())
+        return [term for term in OMANI_SPECIFIC_TERMS if term in hits]
     
     async def search_specific_author(self, author_name: str) -> Dict[str, Any]:
         """بحث متخصص عن مؤلف عُماني معين"""
@@ -405,5 +613,4 @@ class TavilyAdvancedSearchService:
         
         return formatted
 
-# إنشاء مثيل خدمة Tavily
-tavily_search_service = TavilyAdvancedSearchService()
\ No newline at end of file
+# المثيل يُنشأ عند أول استخدام عبر service_registry.get('tavily_search')
@@ -0,0 +1,65 @@
+from bisect import bisect_right
+from typing import Dict, List, Sequence
+
+try:
+    import ahocorasick
+except ImportError:  # اعتمادية اختيارية؛ البديل بحث str.find المدمج
+    ahocorasick = None
+
+# فاصل بين النصوص عند مسحها دفعة واحدة؛ لا يظهر في أي مصطلح
+_SEPARATOR = '\x00'
+
+class TermMatcher:
+    """مطابقة مجموعة ثابتة من المصطلحات مع نصوص كثيرة دفعة واحدة
+
+    النتيجة لكل نص: كل مصطلح ظهر فيه كنص جزئي (مثل `term in text`) مع أول موضع له،
+    فتُشتق منها كل الدرجات دون إعادة قراءة النص.
+
+    مع pyahocorasick تُبنى آلة Aho-Corasick تمسح كل النصوص في مرور واحد. بدونها يُبحث
+    عن كل مصطلح فريد مرة واحدة بـ str.find، وهو أسرع في CPython من آلة مبنية على re
+    (re تجرب المطابقة عند كل حرف، وstr.find يقفز بخوارزمية بحث مُحسّنة).
+    """
+
+    def __init__(self, terms: Sequence[str]):
+        self.terms = list(dict.fromkeys(term.lower() for term in terms if term))
+        self.backend = 'ahocorasick' if ahocorasick is not None and self.terms else 'find'
+
+        if self.backend == 'ahocorasick':
+            self._automaton = ahocorasick.Automaton()
+            for term in self.terms:
+                self._automaton.add_word(term, term)
+            self._automaton.make_automaton()
+
+    def match(self, text: str) -> Dict[str, int]:
+        return self.match_batch([text])[0]
+
+    def match_batch(self, texts: Sequence[str]) -> List[Dict[str, int]]:
+        """كل النصوص (بعد تحويلها لأحرف صغيرة مسبقاً): مصطلح ← أول موضع له في النص"""
+        if self.backend == 'ahocorasick':
+            return self._match_automaton(texts)
+
+        hits: List[Dict[str, int]] = []
+        for text in texts:
+            find = text.find
+            hits.append({term: position for term in self.terms if (position := find(term)) >= 0})
+        return hits
+
+    def _match_automaton(self, texts: Sequence[str]) -> List[Dict[str, int]]:
+        hits: List[Dict[str, int]] = [{} for _ in texts]
+        if not texts:
+            return hits
+
+        starts = []
+        position = 0
+        for text in texts:
+            starts.append(position)
+            position += len(text) + 1
+
+        # التطابقات تصل مرتبة حسب موضع النهاية، فأول ظهور لكل مصطلح يُسجل أولاً
+        for end, term in self._automaton.iter(_SEPARATOR.join(texts)):
+            start = end - len(term) + 1
+            index = bisect_right(starts, start) - 1
+            text_hits = hits[index]
+            if term not in text_hits:
+                text_hits[term] = start - starts[index]
+        return hits
@@ -0,0 +1,209 @@
+import os
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# المقطع (span) الحالي في سياق المهمة، لربط المقاطع الفرعية بالأب ومعرف التتبع
+_current_span: contextvars.ContextVar = contextvars.ContextVar('current_span', default=None)
+
+class Span:
+    """مقطع زمني واحد ضمن تتبع طلب"""
+
+    def __init__(self, name: str, trace: 'Trace', parent: Optional['Span'], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = 'ok'
+        self.error: Optional[str] = None
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns or time.time_ns()
+        return (end_ns - self.start_ns) / 1_000_000
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'trace_id': self.trace.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'start_ns': self.start_ns,
+            'end_ns': self.end_ns,
+            'duration_ms': round(self.duration_ms, 2),
+            'status': self.status,
+            'error': self.error,
+            'attributes': self.attributes
+        }
+
+class Trace:
+    """جميع مقاطع طلب واحد، مع قرار أخذ العينة"""
+
+    MAX_SPANS = 500
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.spans: List[Span] = []
+
+    def add(self, span: Span):
+        if len(self.spans) < self.MAX_SPANS:
+            self.spans.append(span)
+
+    def render_tree(self) -> str:
+        """تمثيل نصي لشجرة المقاطع لسجل الطلبات البطيئة"""
+        children: Dict[Optional[str], List[Span]] = {}
+        for span in self.spans:
+            children.setdefault(span.parent_id, []).append(span)
+
+        lines = []
+
+        def walk(parent_id: Optional[str], depth: int):
+            for span in sorted(children.get(parent_id, []), key=lambda s: s.start_ns):
+                status = '' if span.status == 'ok' else f" [{span.status}: {span.error}]"
+                lines.append(f"{'  ' * depth}- {span.name} {span.duration_ms:.1f}ms{status}")
+                walk(span.span_id, depth + 1)
+
+        walk(None, 0)
+        return '\n'.join(lines)
+
+class _ExportWorker:
+    """تصدير المقاطع في خيط خلفي حتى لا تُحجب حلقة الأحداث"""
+
+    def __init__(self, exporter: str, file_path: str, otlp_endpoint: str):
+        self.exporter = exporter
+        self.file_path = file_path
+        self.otlp_endpoint = otlp_endpoint.rstrip('/')
+        self.queue: queue.Queue = queue.Queue(maxsize=1000)
+        threading.Thread(target=self._run, name='trace-exporter', daemon=True).start()
+
+    def submit(self, trace: Trace):
+        try:
+            self.queue.put_nowait([span.to_dict() for span in trace.spans])
+        except queue.Full:
+            logger.warning("طابور تصدير التتبع ممتلئ - تم تجاهل تتبع")
+
+    def _run(self):
+        while True:
+            spans = self.queue.get()
+            try:
+                if self.exporter == 'otlp':
+                    self._export_otlp(spans)
+                else:
+                    self._export_file(spans)
+            except Exception as e:
+                logger.error(f"خطأ في تصدير التتبع: {e}")
+
+    def _export_file(self, spans: List[Dict[str, Any]]):
+        with open(self.file_path, 'a', encoding='utf-8') as f:
+            for span in spans:
+                f.write(json.dumps(span, ensure_ascii=False, default=str) + '\n')
+
+    def _export_otlp(self, spans: List[Dict[str, Any]]):
+        """إرسال المقاطع بصيغة OTLP/HTTP JSON"""
+        import requests
+
+        def attribute(key, value):
+            return {'key': key, 'value': {'stringValue': str(value)}}
+
+        payload = {'resourceSpans': [{
+            'resource': {'attributes': [attribute('service.name', 'ghassan-backend')]},
+            'scopeSpans': [{
+                'scope': {'name': 'ghassan.tracing'},
+                'spans': [{
+                    'traceId': span['trace_id'],
+                    'spanId': span['span_id'],
+                    'parentSpanId': span['parent_id'] or '',
+                    'name': span['name'],
+                    'kind': 1,
+                    'startTimeUnixNano': str(span['start_ns']),
+                    'endTimeUnixNano': str(span['end_ns'] or span['start_ns']),
+                    'attributes': [attribute(k, v) for k, v in span['attributes'].items()],
+                    'status': {'code': 2 if span['status'] == 'error' else 1, 'message': span['error'] or ''}
+                } for span in spans]
+            }]
+        }]}
+        requests.post(f"{self.otlp_endpoint}/v1/traces", json=payload, timeout=5)
+
+class Tracer:
+    """تتبع الطلبات من البداية للنهاية عبر الدردشة والبحث والنماذج وقاعدة البيانات"""
+
+    def __init__(self):
+        self.enabled = os.environ.get('TRACING_ENABLED', 'true').lower() == 'true'
+        self.sample_rate = float(os.environ.get('TRACE_SAMPLE_RATE', '0.1'))
+        self.slow_request_ms = float(os.environ.get('TRACE_SLOW_REQUEST_MS', '10000'))
+
+        exporter = os.environ.get('TRACE_EXPORTER', 'file')
+        self._worker = None
+        if self.enabled and exporter in ('file', 'otlp'):
+            self._worker = _ExportWorker(
+                exporter,
+                os.environ.get('TRACE_FILE', '/tmp/ghassan-traces.jsonl'),
+                os.environ.get('OTLP_ENDPOINT', 'http://localhost:4318')
+            )
+
+    def current_span(self) -> Optional[Span]:
+        return _current_span.get()
+
+    def current_trace_id(self) -> Optional[str]:
+        span = _current_span.get()
+        return span.trace.trace_id if span else None
+
+    @contextmanager
+    def span(self, name: str, trace_id: Optional[str] = None, **attributes):
+        """فتح مقطع جديد؛ يصبح مقطعاً جذرياً (تتبعاً جديداً) إذا لم يوجد مقطع أب"""
+        if not self.enabled:
+            yield None
+            return
+
+        parent = _current_span.get()
+        if parent is not None:
+            trace = parent.trace
+        else:
+            # كل التتبعات تُسجل في الذاكرة، وقرار التصدير يؤخذ في النهاية (عينة أو طلب بطيء)
+            trace = Trace(trace_id or uuid.uuid4().hex, random.random() < self.sample_rate)
+
+        span = Span(name, trace, parent, attributes)
+        trace.add(span)
+        token = _current_span.set(span)
+
+        try:
+            yield span
+        except BaseException as e:
+            span.status = 'error'
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            _current_span.reset(token)
+            if parent is None:
+                self._finish_trace(span)
+
+    def _finish_trace(self, root: Span):
+        is_slow = root.duration_ms >= self.slow_request_ms
+        if is_slow:
+            logger.warning(
+                f"طلب بطيء ({root.duration_ms:.0f}ms) trace_id={root.trace.trace_id}\n"
+                f"{root.trace.render_tree()}"
+            )
+
+        if self._worker and (root.trace.sampled or is_slow):
+            self._worker.submit(root.trace)
+
+# مثيل التتبع المشترك
+tracer = Tracer()
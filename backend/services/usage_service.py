@@ -0,0 +1,238 @@
+import os
+import asyncio
+import contextvars
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# أسعار تقريبية للنماذج (دولار لكل مليون توكن: مدخلات، مخرجات)
+MODEL_PRICING = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+    'claude-3-5-haiku-20241022': (0.80, 4.00),
+    'claude-3-5-sonnet-20241022': (3.00, 15.00),
+    'text-embedding-3-large': (0.13, 0.0),
+}
+
+# سياق الطلب الحالي (معرف الطلب والجلسة والمجاميع) لربط كل استدعاء بطلبه
+_current_request: contextvars.ContextVar = contextvars.ContextVar('usage_request', default=None)
+
+def _percentile(values: List[float], percentile: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percentile))]
+
+class UsageTracker:
+    """تسجيل التوكنات والتكلفة لكل استدعاء نموذج، مجمعة لكل طلب وجلسة ونموذج"""
+
+    def __init__(self):
+        self.collection = None
+        self.batch_size = int(os.environ.get('USAGE_BATCH_SIZE', '50'))
+        self.flush_interval = float(os.environ.get('USAGE_FLUSH_INTERVAL', '30'))
+
+        self._buffer: List[Dict[str, Any]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+        # نوافذ حديثة في الذاكرة لحساب المئينات دون الرجوع لقاعدة البيانات
+        self._recent_requests = deque(maxlen=2000)
+        self._recent_stages: Dict[str, deque] = {}
+
+    def attach_db(self, db):
+        """ربط المتتبع بقاعدة البيانات لحفظ السجلات على دفعات"""
+        self.collection = db.llm_usage
+
+    async def ensure_indexes(self):
+        """فهرس ملخصات الاستهلاك حسب النوع والجلسة والأحدث أولاً"""
+        if self.collection is not None:
+            await self.collection.create_index([('kind', 1), ('session_id', 1), ('timestamp', -1)])
+
+    def start(self):
+        """بدء مهمة الحفظ الدوري في الخلفية"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._periodic_flush())
+
+    async def stop(self):
+        """إيقاف الحفظ الدوري وحفظ ما تبقى في الذاكرة"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    def begin_request(self, session_id: Optional[str] = None) -> contextvars.Token:
+        """بدء تجميع استهلاك طلب جديد"""
+        return _current_request.set({
+            'request_id': str(uuid.uuid4()),
+            'session_id': session_id,
+            'calls': 0,
+            'prompt_tokens': 0,
+            'completion_tokens': 0,
+            'cost_usd': 0.0,
+            'models': set()
+        })
+
+    def end_request(self, token: contextvars.Token, session_id: Optional[str] = None):
+        """إنهاء الطلب وتسجيل مجموعه"""
+        request = _current_request.get()
+        _current_request.reset(token)
+        if not request or not request['calls']:
+            return
+
+        summary = {
+            'kind': 'request',
+            'request_id': request['request_id'],
+            'session_id': session_id or request['session_id'],
+            'calls': request['calls'],
+            'prompt_tokens': request['prompt_tokens'],
+            'completion_tokens': request['completion_tokens'],
+            'total_tokens': request['prompt_tokens'] + request['completion_tokens'],
+            'cost_usd': request['cost_usd'],
+            'models': sorted(request['models']),
+            'timestamp': datetime.utcnow()
+        }
+        self._recent_requests.append(summary)
+        self._enqueue(summary)
+
+    def estimate_tokens(self, text: str) -> int:
+        """تقدير عدد التوكنات عند غياب أرقام المزود (تقريباً 3 أحرف عربية لكل توكن)"""
+        return max(1, len(text) // 3) if text else 0
+
+    def estimate_cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        """تكلفة الاستدعاء بالدولار وفق جدول الأسعار"""
+        input_price, output_price = MODEL_PRICING.get(model, (0.0, 0.0))
+        return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+    def record(
+        self,
+        provider: str,
+        model: str,
+        prompt_tokens: int,
+        completion_tokens: int,
+        stage: str,
+        estimated: bool = False
+    ) -> float:
+        """تسجيل استدعاء نموذج واحد وإرجاع تكلفته"""
+        cost = self.estimate_cost(model, prompt_tokens, completion_tokens)
+        request = _current_request.get()
+
+        if request is not None:
+            request['calls'] += 1
+            request['prompt_tokens'] += prompt_tokens
+            request['completion_tokens'] += completion_tokens
+            request['cost_usd'] += cost
+            request['models'].add(f"{provider}:{model}")
+
+        self._stage_window(stage).append(prompt_tokens + completion_tokens)
+        self._enqueue({
+            'kind': 'call',
+            'request_id': request['request_id'] if request else None,
+            'session_id': request['session_id'] if request else None,
+            'provider': provider,
+            'model': model,
+            'stage': stage,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'cost_usd': cost,
+            'estimated': estimated,
+            'timestamp': datetime.utcnow()
+        })
+        return cost
+
+    def record_prompt_breakdown(self, components: Dict[str, str]):
+        """تسجيل حجم كل مكون من مكونات الرسالة (سياق البحث، المنهج، التعليمات...)"""
+        for component, text in components.items():
+            self._stage_window(f"prompt:{component}").append(self.estimate_tokens(text))
+
+    def _stage_window(self, stage: str) -> deque:
+        if stage not in self._recent_stages:
+            self._recent_stages[stage] = deque(maxlen=1000)
+        return self._recent_stages[stage]
+
+    def _enqueue(self, record: Dict[str, Any]):
+        if self.collection is None:
+            return
+        self._buffer.append(record)
+        if len(self._buffer) >= self.batch_size:
+            asyncio.ensure_future(self.flush())
+
+    async def flush(self):
+        """حفظ السجلات المتراكمة في Mongo دفعة واحدة"""
+        if self.collection is None or not self._buffer:
+            return
+
+        batch, self._buffer = self._buffer, []
+        try:
+            await self.collection.insert_many(batch, ordered=False)
+        except Exception as e:
+            logger.error(f"خطأ في حفظ سجلات الاستهلاك: {e}")
+
+    async def _periodic_flush(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def get_usage_summary(self, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """ملخص الاستهلاك: مئينات التوكنات والتكلفة لكل طلب، ومجاميع لكل نموذج ومرحلة"""
+        await self.flush()
+
+        requests = list(self._recent_requests)
+        by_model: List[Dict[str, Any]] = []
+
+        if self.collection is not None:
+            request_filter = {'kind': 'request'}
+            call_filter = {'kind': 'call'}
+            if session_id:
+                request_filter['session_id'] = session_id
+                call_filter['session_id'] = session_id
+
+            requests = await self.collection.find(
+                request_filter, {'_id': 0, 'total_tokens': 1, 'cost_usd': 1}
+            ).sort('timestamp', -1).limit(2000).to_list(2000)
+
+            async for row in self.collection.aggregate([
+                {'$match': call_filter},
+                {'$group': {
+                    '_id': {'model': '$model', 'stage': '$stage'},
+                    'calls': {'$sum': 1},
+                    'prompt_tokens': {'$sum': '$prompt_tokens'},
+                    'completion_tokens': {'$sum': '$completion_tokens'},
+                    'cost_usd': {'$sum': '$cost_usd'}
+                }},
+                {'$sort': {'cost_usd': -1}}
+            ]):
+                by_model.append({**row.pop('_id'), **row})
+        elif session_id:
+            requests = [r for r in requests if r['session_id'] == session_id]
+
+        tokens = [r['total_tokens'] for r in requests]
+        costs = [r['cost_usd'] for r in requests]
+
+        return {
+            'session_id': session_id,
+            'requests_analyzed': len(requests),
+            'tokens_per_request': {
+                'p50': _percentile(tokens, 0.5),
+                'p95': _percentile(tokens, 0.95)
+            },
+            'cost_per_request_usd': {
+                'p50': round(_percentile(costs, 0.5), 6),
+                'p95': round(_percentile(costs, 0.95), 6),
+                'total': round(sum(costs), 6)
+            },
+            'by_model_and_stage': by_model,
+            'tokens_by_stage': {
+                stage: {
+                    'p50': _percentile(list(window), 0.5),
+                    'p95': _percentile(list(window), 0.95),
+                    'samples': len(window)
+                }
+                for stage, window in sorted(self._recent_stages.items())
+            }
+        }
+
+# مثيل واحد مشترك لجميع خدمات النماذج
+usage_tracker = UsageTracker()
@@ -3,8 +3,22 @@ import re
 import logging
 from datetime import datetime
 
+from services.tracing import tracer
+
 logger = logging.getLogger(__name__)
 
+# أنماط مترجمة مسبقاً عند الاستيراد بدلاً من أول طلب
+BOOK_PATTERNS = [
+    re.compile(r'"[^"]{5,30}"'),  # أي عنوان كتاب بين قوسين
+    re.compile(r'ديوان "[^"]+?"'),  # دواوين محددة
+    re.compile(r'رواية "[^"]+?"'),  # روايات محددة
+    re.compile(r'كتاب "[^"]+?"'),  # كتب محددة
+    re.compile(r'مجموعة "[^"]+?"'),  # مجموعات محددة
+]
+SPECIFIC_DATE_PATTERN = re.compile(r'عام \d{4}|سنة \d{4}|\d{4}م|\d{4}هـ')
+SPECIFIC_NUMBER_PATTERN = re.compile(r'\d+ (كتاباً|مؤلفاً|عملاً|ديواناً|رواية)')
+NAME_PATTERN = re.compile(r'[أ-ي]+\s+[أ-ي]+')
+
 class InformationVerificationService:
     """خدمة التحقق من صحة المعلومات ومنع الأخطاء"""
     
@@ -23,6 +37,7 @@ class InformationVerificationService:
             r'حاز على جائزة .+ في عام \d{4}',  # جوائز محددة
             r'درس في جامعة .+ وتخرج عام \d{4}',  # تفاصيل دراسية دقيقة
         ]
+        self.suspicious_regexes = [re.compile(pattern) for pattern in self.suspicious_patterns]
         
         # كلمات تدل على عدم اليقين (إيجابية)
         self.uncertainty_words = [
@@ -32,7 +47,10 @@ class InformationVerificationService:
         
     async def verify_response(self, response: str, user_query: str) -> Dict[str, Any]:
         """فحص شامل لرد غسان للتأكد من دقته"""
-        
+        with tracer.span('verify_response', response_chars=len(response)):
+            return await self._verify_response(response, user_query)
+    
+    async def _verify_response(self, response: str, user_query: str) -> Dict[str, Any]:
         verification_result = {
             'overall_score': 0.0,
             'warnings': [],
@@ -86,8 +104,8 @@ class InformationVerificationService:
         warnings = []
         suspicious_count = 0
         
-        for pattern in self.suspicious_patterns:
-            matches = re.findall(pattern, text)
+        for pattern in self.suspicious_regexes:
+            matches = pattern.findall(text)
             if matches:
                 suspicious_count += len(matches)
                 warnings.append(f'تم العثور على نمط مشبوه: {matches[0]}')
@@ -113,17 +131,9 @@ class InformationVerificationService:
         warning_score = 1.0
         
         # أنماط مشبوهة للكتب والمؤلفات المختلقة
-        book_patterns = [
-            r'"[^"]{5,30}"',  # أي عنوان كتاب بين قوسين
-            r'ديوان "[^"]+?"',  # دواوين محددة
-            r'رواية "[^"]+?"',  # روايات محددة
-            r'كتاب "[^"]+?"',  # كتب محددة
-            r'مجموعة "[^"]+?"',  # مجموعات محددة
-        ]
-        
         book_mentions = 0
-        for pattern in book_patterns:
-            matches = re.findall(pattern, text)
+        for pattern in BOOK_PATTERNS:
+            matches = pattern.findall(text)
             book_mentions += len(matches)
             if matches:
                 logger.warning(f"كتب مشبوهة مذكورة: {matches}")
@@ -134,13 +144,13 @@ class InformationVerificationService:
             logger.error(f"تم ذكر {book_mentions} عنوان كتاب محدد - مؤشر هلوسة قوي")
         
         # فحص التواريخ المحددة جداً
-        specific_dates = re.findall(r'عام \d{4}|سنة \d{4}|\d{4}م|\d{4}هـ', text)
+        specific_dates = SPECIFIC_DATE_PATTERN.findall(text)
         if len(specific_dates) > 2:
             warning_score -= 0.3
             logger.warning(f"تواريخ محددة كثيرة: {specific_dates}")
         
         # فحص الأرقام المحددة (عدد الكتب، الصفحات، إلخ)
-        specific_numbers = re.findall(r'\d+ (كتاباً|مؤلفاً|عملاً|ديواناً|رواية)', text)
+        specific_numbers = SPECIFIC_NUMBER_PATTERN.findall(text)
         if len(specific_numbers) > 1:
             warning_score -= 0.4
             logger.warning(f"أرقام محددة مشبوهة: {specific_numbers}")
@@ -153,7 +163,7 @@ class InformationVerificationService:
         warnings = []
         
         # استخراج الأسماء المحتملة
-        potential_names = re.findall(r'[أ-ي]+\s+[أ-ي]+', text)
+        potential_names = NAME_PATTERN.findall(text)
         
         for name in potential_names:
             if len(name) > 20:  # أسماء طويلة جداً مشبوهة
@@ -0,0 +1,108 @@
+import os
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+import logging
+
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+warmup_step_duration = metrics.gauge('warmup_step_duration_seconds', 'Duration of each warm-up step', ('step', 'outcome'))
+
+class WarmupManager:
+    """مرحلة إحماء منظمة بعد الإقلاع: خطوات مستقلة تُنفذ بالتوازي، والجاهزية تعتمد على الخطوات الإلزامية"""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    READY = 'ready'
+    DEGRADED = 'degraded'  # خطوات اختيارية فشلت لكن الخدمة جاهزة
+    FAILED = 'failed'
+
+    def __init__(self):
+        self.enabled = os.environ.get('WARMUP_ENABLED', 'true').lower() == 'true'
+        self.step_timeout = float(os.environ.get('WARMUP_STEP_TIMEOUT', '30'))
+
+        self.state = self.PENDING
+        self._steps: List[Dict[str, Any]] = []
+        self._results: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def add_step(self, name: str, func: Callable[[], Awaitable[Any]], required: bool = True):
+        """تسجيل خطوة إحماء؛ فشل الخطوة الإلزامية يمنع الجاهزية"""
+        self._steps.append({'name': name, 'func': func, 'required': required})
+
+    def start(self):
+        """بدء الإحماء في الخلفية حتى يبدأ الخادم بقبول فحوص الحياة فوراً"""
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    async def run(self):
+        self.started_at = time.perf_counter()
+        if not self.enabled:
+            self.state = self.READY
+            return
+
+        self.state = self.RUNNING
+        await asyncio.gather(*[self._run_step(step) for step in self._steps])
+        self.finished_at = time.perf_counter()
+
+        failed_required = [
+            step['name'] for step in self._steps
+            if step['required'] and not self._results[step['name']]['ok']
+        ]
+        failed_optional = [name for name, result in self._results.items() if not result['ok']]
+
+        if failed_required:
+            self.state = self.FAILED
+            logger.error(f"فشل الإحماء في خطوات إلزامية: {', '.join(failed_required)}")
+        elif failed_optional:
+            self.state = self.DEGRADED
+            logger.warning(f"اكتمل الإحماء مع فشل خطوات اختيارية: {', '.join(failed_optional)}")
+        else:
+            self.state = self.READY
+            logger.info(f"اكتمل الإحماء خلال {(self.finished_at - self.started_at) * 1000:.0f}ms")
+
+    async def _run_step(self, step: Dict[str, Any]):
+        started = time.perf_counter()
+        result = {'ok': True, 'required': step['required'], 'error': None}
+        try:
+            await asyncio.wait_for(step['func'](), timeout=self.step_timeout)
+        except Exception as e:
+            result['ok'] = False
+            result['error'] = f"{type(e).__name__}: {e}"
+            logger.error(f"فشل خطوة الإحماء {step['name']}: {e}")
+
+        elapsed = time.perf_counter() - started
+        result['duration_ms'] = round(elapsed * 1000, 1)
+        warmup_step_duration.set(elapsed, step=step['name'], outcome='ok' if result['ok'] else 'error')
+        self._results[step['name']] = result
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state in (self.READY, self.DEGRADED)
+
+    def get_status(self) -> Dict[str, Any]:
+        """حالة الجاهزية ونتيجة كل خطوة"""
+        total_ms = None
+        if self.started_at is not None and self.finished_at is not None:
+            total_ms = round((self.finished_at - self.started_at) * 1000, 1)
+
+        return {
+            'ready': self.is_ready,
+            'state': self.state,
+            'total_ms': total_ms,
+            'steps': {
+                step['name']: self._results.get(step['name'], {'ok': None, 'required': step['required']})
+                for step in self._steps
+            }
+        }
+
+# مثيل واحد لكل عملية
+warmup_manager = WarmupManager()
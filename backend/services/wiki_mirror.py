@@ -0,0 +1,154 @@
+import os
+import asyncio
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from urllib.parse import quote
+import logging
+
+from services.arabic_text import search_terms
+from services.metrics import metrics
+from services.sqlite_files import ReloadingReader
+
+logger = logging.getLogger(__name__)
+
+wiki_mirror_lookups = metrics.counter(
+    'wiki_mirror_lookups_total', 'Arabic Wikipedia lookups answered from the local mirror', ('outcome',)
+)
+wiki_mirror_lookup_seconds = metrics.histogram(
+    'wiki_mirror_lookup_seconds', 'Local Wikipedia mirror lookup time',
+    export_buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.05)
+)
+
+DEFAULT_MIRROR_PATH = Path(__file__).resolve().parent.parent / 'data' / 'arwiki_subset.sqlite3'
+WIKI_BASE_URL = 'https://ar.wikipedia.org/wiki/'
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)',
+    # التصنيفات المشمولة بعد توسيعها للتصنيفات الفرعية
+    'CREATE TABLE IF NOT EXISTS scope_categories (name TEXT PRIMARY KEY)',
+    # النص الكامل مضغوط (zlib)، والملخص غير مضغوط لأنه ما يُعرض في نتائج البحث
+    'CREATE TABLE IF NOT EXISTS pages ('
+    'page_id INTEGER PRIMARY KEY, title TEXT UNIQUE, revision_id INTEGER, categories TEXT, '
+    'summary TEXT, body BLOB, updated_at REAL)',
+    # rowid = page_id؛ المصطلحات موحدة مسبقاً (arabic_text.search_terms)
+    'CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(title_terms, body_terms)',
+)
+
+def article_url(title: str) -> str:
+    return WIKI_BASE_URL + quote(title.replace(' ', '_'))
+
+def store_page(conn: sqlite3.Connection, page: Dict[str, Any]):
+    """إدراج مقالة أو استبدالها مع فهرسها النصي (للمستورد فقط)"""
+    conn.execute('DELETE FROM pages_fts WHERE rowid = ?', (page['page_id'],))
+    conn.execute(
+        'INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (
+            page['page_id'], page['title'], page['revision_id'], '|'.join(page['categories']),
+            page['text'][:600], zlib.compress(page['text'].encode('utf-8'), 6), time.time()
+        )
+    )
+    conn.execute(
+        'INSERT INTO pages_fts (rowid, title_terms, body_terms) VALUES (?, ?, ?)',
+        (page['page_id'], ' '.join(search_terms(page['title'])), ' '.join(search_terms(page['text'])))
+    )
+
+def delete_page(conn: sqlite3.Connection, page_id: int):
+    conn.execute('DELETE FROM pages_fts WHERE rowid = ?', (page_id,))
+    conn.execute('DELETE FROM pages WHERE page_id = ?', (page_id,))
+
+class WikipediaMirror:
+    """نسخة محلية من مقالات ويكيبيديا العربية في تصنيفات الأدب العُماني وشعرائه وأماكنه
+
+    يبنيها ويحدثها jobs.import_wikipedia_subset (من ملف تفريغ ثم تحديثات دورية)، والخدمة
+    تقرأ فقط: استعلام FTS5 واحد على مصطلحات عربية موحدة بدلاً من طلب شبكي لكل سؤال.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.enabled = os.environ.get('WIKI_MIRROR_ENABLED', 'true').lower() == 'true'
+        self.path = Path(path or os.environ.get('WIKI_MIRROR_PATH', str(DEFAULT_MIRROR_PATH)))
+        # المقالة تُعاد إن غطت هذه النسبة من مصطلحات السؤال (ومصطلحين على الأقل)
+        self.min_coverage = float(os.environ.get('WIKI_MIRROR_MIN_COVERAGE', '0.5'))
+        self._reader = ReloadingReader(self.path, float(os.environ.get('WIKI_MIRROR_RELOAD_CHECK', '60')))
+        self.stats = {'hits': 0, 'misses': 0}
+
+    @property
+    def available(self) -> bool:
+        return self.enabled and self.path.exists()
+
+    def _search(self, query: str, limit: int) -> List[Dict[str, Any]]:
+        terms = search_terms(query)
+        if not terms:
+            return []
+        required = max(min(2, len(terms)), round(len(terms) * self.min_coverage))
+
+        with self._reader.lock:
+            conn = self._reader.connection()
+            if conn is None:
+                return []
+            rows = conn.execute(
+                'SELECT p.title, p.summary, f.title_terms, f.body_terms '
+                'FROM pages_fts f JOIN pages p ON p.page_id = f.rowid '
+                'WHERE pages_fts MATCH ? ORDER BY bm25(pages_fts, 5.0, 1.0) LIMIT ?',
+                (' OR '.join(f'"{term}"' for term in terms), limit * 5)
+            ).fetchall()
+
+        articles = []
+        for title, summary, title_terms, body_terms in rows:
+            page_terms = set(f'{title_terms} {body_terms}'.split())
+            if sum(1 for term in terms if term in page_terms) >= required:
+                articles.append({'title': title, 'summary': summary, 'url': article_url(title)})
+                if len(articles) == limit:
+                    break
+        return articles
+
+    async def search(self, query: str, limit: int = 2) -> List[Dict[str, Any]]:
+        """أفضل المقالات المحلية للسؤال، أو قائمة فارغة (فيُلجأ لواجهة ويكيبيديا)"""
+        if not self.available:
+            return []
+        started = time.perf_counter()
+        try:
+            articles = await asyncio.to_thread(self._search, query, limit)
+        except sqlite3.Error as e:
+            logger.error(f"خطأ في البحث في نسخة ويكيبيديا المحلية: {e}")
+            return []
+        finally:
+            wiki_mirror_lookup_seconds.observe(time.perf_counter() - started)
+
+        self.stats['hits' if articles else 'misses'] += 1
+        wiki_mirror_lookups.inc(outcome='hit' if articles else 'miss')
+        return articles
+
+    def get_article(self, title: str) -> Optional[str]:
+        """النص الكامل لمقالة (يُفك ضغطه عند الطلب فقط)"""
+        if not self.available:
+            return None
+        with self._reader.lock:
+            conn = self._reader.connection()
+            row = conn.execute('SELECT body FROM pages WHERE title = ?', (title,)).fetchone() if conn else None
+        return zlib.decompress(row[0]).decode('utf-8') if row else None
+
+    def get_mirror_stats(self) -> Dict[str, Any]:
+        """حجم النسخة المحلية وتاريخ بنائها وآخر تحديث ونسبة الإجابة منها"""
+        stats = {'enabled': self.enabled, 'path': str(self.path), 'available': self.available, **self.stats}
+        if not self.available:
+            return stats
+        with self._reader.lock:
+            conn = self._reader.connection()
+            pages = conn.execute('SELECT COUNT(*) FROM pages').fetchone()[0]
+            meta = dict(conn.execute('SELECT key, value FROM meta').fetchall())
+        lookups = self.stats['hits'] + self.stats['misses']
+        return {
+            **stats,
+            'pages': pages,
+            'file_bytes': self.path.stat().st_size,
+            'source': meta.get('source'),
+            'built_at': meta.get('built_at'),
+            'refreshed_at': meta.get('refreshed_at'),
+            'local_hit_rate': round(self.stats['hits'] / lookups, 3) if lookups else 0.0
+        }
+
+# مثيل واحد لكل عامل (الملف نفسه مشترك)
+wikipedia_mirror = WikipediaMirror()
@@ -86,8 +86,24 @@ export const AdvancedKnowledgeManager = () => {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
       
-      const result = await response.json();
-      
+      // الجمع يجري في الخلفية: متابعة المهمة حتى تنتهي
+      let job = await response.json();
+      setMessage('بدأ الجمع في الخلفية...');
+      setMessageType('success');
+      while (job.status === 'queued' || job.status === 'running') {
+        await new Promise(resolve => setTimeout(resolve, 3000));
+        const statusResponse = await fetch(`${process.env.REACT_APP_BACKEND_URL}/api/jobs/${job.job_id}`);
+        if (!statusResponse.ok) {
+          throw new Error(`HTTP error! status: ${statusResponse.status}`);
+        }
+        job = await statusResponse.json();
+        if (job.progress && job.progress.authors_total) {
+          setMessage(`جارٍ الجمع: ${job.progress.authors_done} من ${job.progress.authors_total} مؤلف...`);
+        }
+      }
+
+      const result = job.result || { error: job.error };
+
       if (result.collection_completed) {
         setMessage(`تم جمع ${result.total_sources_found} مصدر من ${result.authors_processed} مؤلف بنجاح!`);
         setMessageType('success');